@@ -1,11 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from engine import handle_turn
+from engine import handle_turn_async, handle_turn_stream
+from core.admission import Rejected, get_admission
+from core.deadline import deadline_stats, turn_deadline
+from core.llm_cache import get_llm_cache
+from core.llm_client import dispatch_stats
+from core.llm_pool import pool_stats
+from core.llm_transport import transport_stats
+from core.tracing import DEBUG_PRINTS
+import json
 import uvicorn
 
 app = FastAPI()
+admission = get_admission()
 
 # Serve static files (HTML, CSS, JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -26,10 +36,17 @@ async def root():
 
 @app.post("/turn")
 async def turn(request: TurnRequest) -> TurnResponse:
-    result = handle_turn(request.session_id, request.user_text)
+    # het budget loopt vanaf binnenkomst, dus inclusief de wachttijd in de rij
+    deadline = turn_deadline()
+    try:
+        async with admission.admit(request.session_id):
+            result = await handle_turn_async(request.session_id, request.user_text, deadline)
+    except Rejected as e:
+        raise _overloaded(e)
     
-    print(f"[API DEBUG] Coherence: {result.get('coherence')}")  # ✨ debug
-    print(f"[API DEBUG] State sum: {sum(result.get('state_vector', []))}")  # ✨ debug
+    if DEBUG_PRINTS:
+        print(f"[API DEBUG] Coherence: {result.get('coherence')}")
+        print(f"[API DEBUG] State sum: {sum(result.get('state_vector', []))}")
     
     return TurnResponse(
         assistant_text=result["assistant_text"],
@@ -38,5 +55,72 @@ async def turn(request: TurnRequest) -> TurnResponse:
     )
 
 
+def _overloaded(e: Rejected) -> HTTPException:
+    """429 (te veel requests voor deze sessie) of 503 (server vol), met Retry-After."""
+    return HTTPException(
+        status_code=e.status,
+        detail=f"Server is druk ({e.reason}), probeer het over {e.retry_after}s opnieuw",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formatteer één Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/turn/stream")
+async def turn_stream(request: TurnRequest) -> StreamingResponse:
+    """Zelfde als /turn, maar tokens gaan als SSE naar de client zodra ze er zijn."""
+    deadline = turn_deadline()
+    # toelaten vóór de response start, zodat een weigering nog een echte 429/503 is
+    try:
+        started = await admission.acquire(request.session_id)
+    except Rejected as e:
+        raise _overloaded(e)
+
+    async def events():
+        try:
+            async for item in handle_turn_stream(request.session_id, request.user_text, deadline):
+                event = item.pop("event")
+                yield _sse(event, item)
+        except Exception as e:
+            print(f"[API ERROR] stream failed: {e!r}")
+            yield _sse("error", {"detail": "LLM stream failed"})
+        finally:
+            release()
+
+    def release() -> None:
+        # via de generator én als background task: een stream die nooit
+        # startte (client al weg) moet zijn plek ook teruggeven
+        nonlocal started
+        if started is not None:
+            admission.release(request.session_id, started)
+            started = None
+
+    async def release_after() -> None:
+        release()  # async, zodat Starlette hem op de event loop draait
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_after),
+    )
+
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    """Runtime-tellers voor monitoring."""
+    return {
+        "admission": admission.stats(),
+        "deadline": deadline_stats(),
+        "llm_cache": get_llm_cache().stats(),
+        "llm_transport": transport_stats(),
+        "llm_dispatch": dispatch_stats(),
+        "llm_pools": pool_stats(),
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# benchmarks/bench_emotions.py
+"""Micro-benchmark: Aho-Corasick `text_to_emotions` vs. de oude substring-scan.
+
+Gebruik (vanuit de repo-root):
+    python -m benchmarks.bench_emotions [--repeat 2000] [--scale 1 5 20]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import timeit
+from typing import Dict
+
+from core.emotions import EMOTION_LEXICON, EmotionMatcher, text_to_emotions
+
+SAMPLES = [
+    "Hoi, hoe gaat het?",
+    "Ik voel me zo eenzaam en bang, niemand begrijpt me.",
+    "Ik ben echt dankbaar en blij met hoe het nu gaat, thanks!",
+    "Ik vertrouw het niet, ik haat hem en ben woedend.",
+    "Leg eens uit hoe de 32D state werkt en wat entropy betekent.",
+]
+
+
+def naive_text_to_emotions(text: str, lexicon=EMOTION_LEXICON) -> Dict[str, float]:
+    """Oorspronkelijke implementatie: één substring-scan per keyword."""
+    text = text.lower()
+    emotions: Dict[str, float] = {}
+    for name, (value, keywords) in lexicon.items():
+        if any(k in text for k in keywords):
+            emotions[name] = value
+    return emotions
+
+
+def scaled_lexicon(factor: int) -> dict:
+    """Lexicon met `factor`x zoveel emoties (synthetische keyword-varianten)."""
+    if factor <= 1:
+        return dict(EMOTION_LEXICON)
+    lex = {}
+    for i in range(factor):
+        for name, (value, keywords) in EMOTION_LEXICON.items():
+            suffix = "" if i == 0 else f"_{i}"
+            kws = keywords if i == 0 else [f"{k}{i}x" for k in keywords]
+            lex[name + suffix] = (value, kws)
+    return lex
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    long_text = " ".join(rng.choice(SAMPLES) for _ in range(40))
+
+    # correctheid eerst
+    for text in SAMPLES + [long_text]:
+        assert text_to_emotions(text) == naive_text_to_emotions(text), text
+
+    print(f"{'lexicon':>8} {'text':>6} {'naive µs':>10} {'automaton µs':>13} {'speedup':>8}")
+    for factor in args.scale:
+        lex = scaled_lexicon(factor)
+        matcher = EmotionMatcher(lex)
+        for label, text in (("short", SAMPLES[1]), ("long", long_text)):
+            assert matcher.match(text) == naive_text_to_emotions(text, lex)
+            t_naive = timeit.timeit(lambda: naive_text_to_emotions(text, lex), number=args.repeat)
+            t_ac = timeit.timeit(lambda: matcher.match(text), number=args.repeat)
+            print(
+                f"{len(lex):>8} {label:>6} {t_naive / args.repeat * 1e6:>10.1f} "
+                f"{t_ac / args.repeat * 1e6:>13.1f} {t_naive / t_ac:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# benchmarks/bench_turn.py
+"""End-to-end benchmark van engine.handle_turn, uitgesplitst per stage.
+
+De LLM wordt vervangen door een deterministische stub (optioneel met een
+vaste gesimuleerde latency), zodat alleen onze eigen code gemeten wordt:
+perception, state-update, prompt-opbouw, LLM (stub), memory/journal.
+
+Gebruik (vanuit de repo-root):
+    python -m benchmarks.bench_turn [--turns 200] [--json out.json]
+    python -m benchmarks.bench_turn --sweep message --lengths 5 50 500
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+import core.llm_client
+import core.sessions
+import engine
+from core.emotions import EMOTION_LEXICON
+from core.journal import TurnJournal, set_journal
+from core.memory import ConversationMemory
+from pda32d_base import ConsciousnessState32D
+
+STAGES = ["perception", "state_update", "prompt", "llm", "memory", "total"]
+
+FILLER = ["ik", "denk", "dat", "het", "vandaag", "werk", "gesprek", "weer", "best", "eigenlijk", "en", "maar"]
+KEYWORDS = [k for _, (_, kws) in EMOTION_LEXICON.items() for k in kws]
+
+
+def make_message(rng: random.Random, words: int) -> str:
+    """Deterministisch bericht met ~1 emotie-keyword per 8 woorden."""
+    parts = [rng.choice(KEYWORDS) if rng.random() < 0.125 else rng.choice(FILLER) for _ in range(words)]
+    return " ".join(parts)
+
+
+class StageTimer:
+    """Wrapt de stage-functies van de engine en telt hun tijd per beurt op."""
+
+    def __init__(self, llm_latency: float = 0.0):
+        self.llm_latency = llm_latency
+        self.current: Dict[str, float] = {}
+        self.llm_calls = 0
+        self._restore: List[Callable[[], None]] = []
+
+    def _add(self, stage: str, seconds: float) -> None:
+        self.current[stage] = self.current.get(stage, 0.0) + seconds
+
+    def _wrap(self, owner: Any, name: str, stage: str) -> None:
+        original = getattr(owner, name)
+        timer = self
+
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer._add(stage, time.perf_counter() - start)
+
+        setattr(owner, name, wrapped)
+        self._restore.append(lambda: setattr(owner, name, original))
+
+    def _stub_llm(self, system_prompt: str, user_prompt: str, intent=None) -> str:
+        start = time.perf_counter()
+        self.llm_calls += 1
+        if self.llm_latency:
+            time.sleep(self.llm_latency)
+        text = f"Stub-antwoord op een prompt van {len(system_prompt) + len(user_prompt)} tekens."
+        self._add("llm", time.perf_counter() - start)
+        return text
+
+    def install(self) -> None:
+        self._wrap(engine, "run_perception_step", "perception")
+        self._wrap(ConsciousnessState32D, "update_from_emotions", "state_update")
+        self._wrap(ConversationMemory, "append_turn", "memory")
+        original = core.llm_client.generate_text
+        core.llm_client.generate_text = self._stub_llm
+        self._restore.append(lambda: setattr(core.llm_client, "generate_text", original))
+
+    def uninstall(self) -> None:
+        while self._restore:
+            self._restore.pop()()
+
+    def run_turn(self, session_id: str, text: str) -> Dict[str, float]:
+        self.current = {}
+        start = time.perf_counter()
+        engine.handle_turn(session_id, text)
+        total = time.perf_counter() - start
+        timings = {stage: self.current.get(stage, 0.0) for stage in STAGES if stage != "total"}
+        # prompt-opbouw = alles in de beurt wat niet in een andere stage valt
+        timings["prompt"] = max(0.0, total - sum(timings.values()))
+        timings["total"] = total
+        return timings
+
+
+def summarize(samples: List[Dict[str, float]], wall: float, llm_calls: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "turns": len(samples),
+        "throughput_turns_per_s": len(samples) / wall if wall else 0.0,
+        # beurten met een vast antwoord (PDA_LLM_SKIP_ACTIONS), zonder LLM-call
+        "llm_skip_rate": 1.0 - llm_calls / len(samples) if samples else 0.0,
+    }
+    for stage in STAGES:
+        us = np.array([s[stage] for s in samples]) * 1e6
+        out[stage] = {
+            "mean_us": float(us.mean()),
+            "p50_us": float(np.percentile(us, 50)),
+            "p95_us": float(np.percentile(us, 95)),
+            "max_us": float(us.max()),
+        }
+    return out
+
+
+def run_scenario(
+    timer: StageTimer,
+    turns: int,
+    words: int,
+    history: int,
+    sessions: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    core.sessions.registry = core.sessions.SessionRegistry(max_sessions=max(sessions, 1) * 2, ttl_seconds=0)
+    session_ids = [f"bench-{i}" for i in range(sessions)]
+
+    # geschiedenis vooraf vullen (niet gemeten)
+    for sid in session_ids:
+        memory = core.sessions.get_session(sid).memory
+        for h in range(history):
+            memory.append_turn("user" if h % 2 == 0 else "pda", make_message(rng, 12), {}, np.zeros(32))
+
+    messages = [make_message(rng, words) for _ in range(turns)]
+    for i in range(min(5, turns)):  # warm-up
+        timer.run_turn(session_ids[i % sessions], messages[i])
+
+    samples = []
+    timer.llm_calls = 0
+    wall_start = time.perf_counter()
+    for i, text in enumerate(messages):
+        samples.append(timer.run_turn(session_ids[i % sessions], text))
+    wall = time.perf_counter() - wall_start
+    return summarize(samples, wall, timer.llm_calls)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--sweep", choices=["message", "history", "sessions", "all"], default="all")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[5, 50, 500], help="woorden per bericht")
+    parser.add_argument("--histories", type=int, nargs="+", default=[0, 100, 1000], help="beurten vooraf in memory")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", help="schrijf resultaten als JSON naar dit pad ('-' = stdout)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    journal_dir = tempfile.mkdtemp(prefix="pda-bench-")
+    set_journal(TurnJournal(directory=journal_dir))
+
+    timer = StageTimer(llm_latency=args.llm_latency_ms / 1000.0)
+    timer.install()
+
+    scenarios = []
+    if args.sweep in {"message", "all"}:
+        scenarios += [("message", {"words": n, "history": 10, "sessions": 1}) for n in args.lengths]
+    if args.sweep in {"history", "all"}:
+        scenarios += [("history", {"words": 20, "history": n, "sessions": 1}) for n in args.histories]
+    if args.sweep in {"sessions", "all"}:
+        scenarios += [("sessions", {"words": 20, "history": 10, "sessions": n}) for n in args.sessions]
+
+    results = []
+    try:
+        for sweep, params in scenarios:
+            # engine print() veel debug-output; niet meten wat de terminal kost
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                summary = run_scenario(timer, args.turns, seed=args.seed, **params)
+            results.append({"sweep": sweep, "params": params, **summary})
+            print(
+                f"{sweep:>8} {json.dumps(params):<48} "
+                f"{summary['throughput_turns_per_s']:>9.0f} turns/s  "
+                f"skip={summary['llm_skip_rate']:.0%}  "
+                + "  ".join(f"{s}={summary[s]['p50_us']:.0f}µs" for s in STAGES),
+                file=sys.stderr,
+            )
+    finally:
+        timer.uninstall()
+
+    report = {
+        "benchmark": "engine.handle_turn",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "turns_per_scenario": args.turns,
+        "llm_latency_ms": args.llm_latency_ms,
+        "results": results,
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# core/admission.py
+from __future__ import annotations
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import asyncio
+import math
+import os
+import time
+
+# Admission control voor /turn: hoeveel beurten tegelijk, hoe lang de rij
+# mag worden en hoe lang een request maximaal mag wachten op een plek.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("PDA_ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("PDA_ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_PER_SESSION = int(os.getenv("PDA_ADMISSION_PER_SESSION", "2"))
+ADMISSION_MAX_WAIT = float(os.getenv("PDA_ADMISSION_MAX_WAIT_S", "10"))
+# startschatting van de duur van één beurt, tot er metingen zijn
+ADMISSION_INITIAL_SERVICE = float(os.getenv("PDA_ADMISSION_INITIAL_SERVICE_S", "2"))
+EWMA_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    """Request geweigerd; de API maakt er een 429/503 met Retry-After van."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Begrensde FIFO-rij voor beurten, met shedding op voorspelde wachttijd.
+
+    - Hooguit `max_concurrent` beurten tegelijk in behandeling; de rest
+      wacht in volgorde van binnenkomst, maximaal `max_queue` requests.
+    - Per sessie hooguit `per_session` requests tegelijk (lopend +
+      wachtend); daarboven 429.
+    - De wachttijd wordt voorspeld uit de positie in de rij en een
+      voortschrijdend gemiddelde van de duur van een beurt. Is de
+      voorspelling groter dan `max_wait`, of is de rij vol, dan volgt
+      direct een 503 in plaats van een timeout veel later. Wie toch
+      langer dan `max_wait` in de rij staat, krijgt alsnog een 503.
+
+    Bedoeld voor één event loop (één uvicorn-worker); er is geen lock.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        per_session: int = ADMISSION_PER_SESSION,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        initial_service: float = ADMISSION_INITIAL_SERVICE,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent moet >= 1 zijn")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_session = per_session
+        self.max_wait = max_wait
+        self.service_seconds = initial_service  # EWMA van de duur van een beurt
+        self.in_flight = 0
+        self.admitted = 0
+        self.max_queued = 0
+        self.queue_wait_seconds_total = 0.0
+        self.shed: Dict[str, int] = {"session_limit": 0, "queue_full": 0, "predicted_wait": 0, "timeout": 0}
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._per_session: Dict[str, int] = {}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def predicted_wait(self, position: Optional[int] = None) -> float:
+        """Verwachte wachttijd voor wie nu achteraan in de rij aansluit."""
+        if position is None:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                return 0.0
+            position = len(self._waiters)
+        return (position + 1) / self.max_concurrent * self.service_seconds
+
+    def _reject(self, reason: str, status: int, retry_after: float) -> Rejected:
+        self.shed[reason] += 1
+        return Rejected(status, reason, retry_after)
+
+    async def acquire(self, session_id: str) -> float:
+        """Wacht op een plek; geeft het starttijdstip terug (voor release)."""
+        count = self._per_session.get(session_id, 0)
+        if count >= self.per_session:
+            raise self._reject("session_limit", 429, self.service_seconds)
+
+        immediate = self.in_flight < self.max_concurrent and not self._waiters
+        if not immediate:
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject("queue_full", 503, self.predicted_wait())
+            predicted = self.predicted_wait()
+            if predicted > self.max_wait:
+                raise self._reject("predicted_wait", 503, predicted)
+
+        self._per_session[session_id] = count + 1
+        if immediate:
+            self.in_flight += 1
+        else:
+            try:
+                await self._wait_in_queue()
+            except BaseException:
+                self._leave(session_id)
+                raise
+        self.admitted += 1
+        return time.monotonic()
+
+    async def _wait_in_queue(self) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.max_queued = max(self.max_queued, len(self._waiters))
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done():
+                # de plek was al aan ons overgedragen: teruggeven
+                self._release_slot()
+            else:
+                self._waiters.remove(fut)
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("timeout", 503, self.predicted_wait()) from None
+            raise
+        finally:
+            self.queue_wait_seconds_total += time.monotonic() - start
+
+    def _leave(self, session_id: str) -> None:
+        count = self._per_session.get(session_id, 0) - 1
+        if count > 0:
+            self._per_session[session_id] = count
+        else:
+            self._per_session.pop(session_id, None)
+
+    def _release_slot(self) -> None:
+        # plek direct doorgeven aan de eerstvolgende wachtende (FIFO)
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def release(self, session_id: str, started: float) -> None:
+        elapsed = time.monotonic() - started
+        self.service_seconds += EWMA_ALPHA * (elapsed - self.service_seconds)
+        self._leave(session_id)
+        self._release_slot()
+
+    @asynccontextmanager
+    async def admit(self, session_id: str) -> AsyncIterator[None]:
+        started = await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release(session_id, started)
+
+    def stats(self) -> Dict[str, Any]:
+        shed_total = sum(self.shed.values())
+        offered = self.admitted + shed_total
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "shed_rate": shed_total / offered if offered else 0.0,
+            "service_ms_ewma": round(self.service_seconds * 1000, 1),
+            "predicted_wait_ms": round(self.predicted_wait() * 1000, 1),
+            "queue_wait_seconds_total": round(self.queue_wait_seconds_total, 3),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,139 @@
+# core/deadline.py
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, TypeVar
+
+import asyncio
+import os
+import threading
+import time
+
+# Tijdsbudget per beurt (vanaf binnenkomst in de API); 0 = geen deadline
+TURN_DEADLINE = float(os.getenv("PDA_TURN_DEADLINE_S", "20"))
+# met minder budget dan dit beginnen we niet meer aan een LLM-call
+LLM_MIN_BUDGET = float(os.getenv("PDA_LLM_MIN_BUDGET_S", "1"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Het budget van de beurt is op."""
+
+
+class Deadline:
+    """Absoluut tijdstip (monotonic) waarop de beurt klaar moet zijn."""
+
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+def turn_deadline(seconds: float = TURN_DEADLINE) -> Optional[Deadline]:
+    """Nieuwe deadline voor een beurt, of None als de deadline uit staat."""
+    return Deadline(seconds) if seconds > 0 else None
+
+
+# Loopt via contextvars mee naar asyncio-tasks en asyncio.to_thread, zodat
+# de LLM-client hem ziet zonder dat elke laag hem als argument doorgeeft.
+_current: ContextVar[Optional[Deadline]] = ContextVar("pda_deadline", default=None)
+T = TypeVar("T")
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    """Resterend budget van de huidige beurt in seconden; None = onbegrensd."""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Zet de deadline voor de duur van het blok.
+
+    Niet over een `yield` van een async generator heen gebruiken: die kan in
+    een andere context worden afgesloten (reset faalt dan) en de deadline
+    lekt naar de consument. Gebruik daar `bind` of `iterate_until`.
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def bind(deadline: Optional[Deadline], fn: Callable[..., T]) -> Callable[..., T]:
+    """`fn` die met deze deadline draait, bijv. voor asyncio.to_thread."""
+    def run(*args: Any, **kwargs: Any) -> T:
+        with deadline_scope(deadline):
+            return fn(*args, **kwargs)
+    return run
+
+
+_END = object()
+
+
+async def iterate_until(stream: AsyncIterator[T], deadline: Optional[Deadline]) -> AsyncIterator[T]:
+    """Geef items van `stream` door tot de deadline; daarna DeadlineExceeded.
+
+    De stream draait in een eigen task die bij een timeout gecanceld wordt,
+    zodat hij binnen die task wordt afgesloten (HTTP-stream, backend-slot).
+    Alleen die task ziet de deadline als huidige deadline.
+    """
+    if deadline is None:
+        async for item in stream:
+            yield item
+        return
+
+    queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+
+    async def pump() -> None:
+        _current.set(deadline)  # de task heeft een eigen kopie van de context
+        try:
+            async for item in stream:
+                queue.put_nowait((item, None))
+            queue.put_nowait((_END, None))
+        except Exception as e:
+            queue.put_nowait((_END, e))
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Deadline verstreken tijdens de stream") from None
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        task.cancel()
+
+
+_stats_lock = threading.Lock()
+_degradations: Dict[str, int] = {}
+
+
+def record_degradation(reason: str) -> None:
+    with _stats_lock:
+        _degradations[reason] = _degradations.get(reason, 0) + 1
+
+
+def deadline_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {
+            "turn_deadline_s": TURN_DEADLINE,
+            "degraded": dict(_degradations),
+            "degraded_total": sum(_degradations.values()),
+        }
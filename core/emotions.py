@@ -1,5 +1,6 @@
 # emotions.py
-from typing import Dict
+from collections import deque
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
 EMOTION_LEXICON = {
     # 12: Joy / Sadness
@@ -88,10 +89,93 @@ EMOTION_LEXICON = {
 }
 
 
+class EmotionMatcher:
+    """Aho-Corasick automaat over alle keywords van een lexicon.
+
+    Eén pass over de (lowercase) tekst levert alle emoties op waarvan minstens
+    één keyword als substring voorkomt – dezelfde semantiek als `k in text`.
+    """
+
+    def __init__(self, lexicon: Dict[str, Tuple[float, List[str]]]):
+        self.names: List[str] = list(lexicon.keys())
+        self.values: List[float] = [float(v) for v, _ in lexicon.values()]
+        self.index: Dict[str, int] = {n: i for i, n in enumerate(self.names)}
+
+        # 1) trie: goto[state][char] -> state, out[state] = emotie-indices
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Set[int]] = [set()]
+        for idx, (_, keywords) in enumerate(lexicon.values()):
+            for kw in keywords:
+                state = 0
+                for ch in kw.lower():
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        out.append(set())
+                    state = nxt
+                out[state].add(idx)
+
+        # 2) failure links (BFS) en volledige DFA-transities, zodat match()
+        #    per karakter maar één dict-lookup doet
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            out[state] |= out[fail[state]]
+            # erf transities van de failure-state, overschrijf met eigen goto
+            trans = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                trans[ch] = nxt
+                queue.append(nxt)
+            delta[state] = trans
+
+        self._delta = delta
+        self._out: List[FrozenSet[int]] = [frozenset(o) for o in out]
+        self._always = self._out[0]  # lege keywords matchen altijd
+
+    def hits(self, text: str) -> Set[int]:
+        """Indices (in lexicon-volgorde) van alle emoties met een keyword‑hit."""
+        delta, out = self._delta, self._out
+        found: Set[int] = set(self._always)
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+    def match(self, text: str) -> Dict[str, float]:
+        found = self.hits(text.lower())
+        return {self.names[i]: self.values[i] for i in sorted(found)}
+
+
+_matcher = EmotionMatcher(EMOTION_LEXICON)
+
+
+def get_emotion_matcher() -> EmotionMatcher:
+    return _matcher
+
+
+def rebuild_emotion_matcher(
+    lexicon: Optional[Dict[str, Tuple[float, List[str]]]] = None,
+) -> EmotionMatcher:
+    """Compileer de automaat opnieuw na een wijziging van het lexicon.
+
+    Zonder argument wordt `EMOTION_LEXICON` (eventueel in-place aangepast)
+    opnieuw ingelezen; met een nieuw lexicon wordt `EMOTION_LEXICON` eerst
+    vervangen, zodat de volgorde voor andere modules gelijk blijft.
+    """
+    global _matcher
+    if lexicon is not None and lexicon is not EMOTION_LEXICON:
+        EMOTION_LEXICON.clear()
+        EMOTION_LEXICON.update(lexicon)
+    _matcher = EmotionMatcher(EMOTION_LEXICON)
+    return _matcher
+
+
 def text_to_emotions(text: str) -> Dict[str, float]:
-    text = text.lower()
-    emotions: Dict[str, float] = {}
-    for name, (value, keywords) in EMOTION_LEXICON.items():
-        if any(k in text for k in keywords):
-            emotions[name] = value
-    return emotions
+    return _matcher.match(text)
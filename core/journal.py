@@ -0,0 +1,253 @@
+# core/journal.py
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+from core.tracing import span
+from core.utils import file_lock, session_path, to_list
+
+# Eén journal voor alle beurten: logs/session_<id>.jsonl, één schema.
+JOURNAL_DIR = Path(os.getenv("PDA_JOURNAL_DIR", "logs"))
+JOURNAL_MAX_BATCH = int(os.getenv("PDA_JOURNAL_MAX_BATCH", "256"))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("PDA_JOURNAL_FLUSH_INTERVAL", "0.2"))
+# "batch": fsync na elke batch, "interval": hoogstens elke FSYNC_INTERVAL s,
+# "never": laat het aan het OS over
+JOURNAL_FSYNC = os.getenv("PDA_JOURNAL_FSYNC", "interval")
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("PDA_JOURNAL_FSYNC_INTERVAL", "1.0"))
+
+FSYNC_POLICIES = {"batch", "interval", "never"}
+
+# Geroteerde (gesloten) logs gaan naar <JOURNAL_DIR>/closed/, klaar voor compaction
+CLOSED_SUBDIR = "closed"
+ACTIVE_PATTERN = "session*.jsonl"
+# writers (ook andere workers) en rotatie sluiten elkaar hiermee uit, zodat
+# een batch nooit half in een al geroteerd bestand belandt
+ROTATE_LOCK = ".rotate.lock"
+
+
+def rotate_files(directory: Path) -> List[Path]:
+    """Verplaats alle actieve logs in `directory` naar `directory/closed/`.
+
+    Elke file krijgt een tijdstempel in de naam, zodat opeenvolgende
+    rotaties elkaar niet overschrijven. Geeft de nieuwe paden terug.
+    Veilig naast draaiende writers in andere processen (ROTATE_LOCK).
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    closed_dir = directory / CLOSED_SUBDIR
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    closed = []
+    with file_lock(directory / ROTATE_LOCK):
+        for path in sorted(directory.glob(ACTIVE_PATTERN)):
+            if not path.is_file() or path.stat().st_size == 0:
+                continue
+            closed_dir.mkdir(parents=True, exist_ok=True)
+            target = closed_dir / f"{path.stem}.{stamp}.jsonl"
+            os.replace(path, target)
+            closed.append(target)
+    return closed
+
+
+class _Rotation(threading.Event):
+    """Rotatieverzoek voor de writer-thread; `closed` bevat daarna de geroteerde paden."""
+
+    def __init__(self):
+        super().__init__()
+        self.closed: List[Path] = []
+
+
+def make_record(
+    session_id: str,
+    role: str,
+    text: str,
+    emotions: Optional[Dict[str, float]] = None,
+    state_vector: Any = None,
+    extras: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Het (enige) schema van een journal-regel."""
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "session_id": session_id,
+        "role": role,          # "user" of "pda"
+        "text": text,
+        "emotions": emotions or {},
+        "state_vector": to_list(state_vector),
+    }
+    if extras:
+        record.update(extras)
+    return record
+
+
+class TurnJournal:
+    """Group-commit writer: records gaan via een queue naar één achtergrondthread.
+
+    De thread verzamelt records tot `max_batch` of tot `flush_interval`
+    seconden verstreken zijn, opent elk sessiebestand één keer per batch en
+    fsynct volgens `fsync`. record() doet zelf geen disk-I/O.
+    """
+
+    def __init__(
+        self,
+        directory: Path = JOURNAL_DIR,
+        max_batch: int = JOURNAL_MAX_BATCH,
+        flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+        fsync: str = JOURNAL_FSYNC,
+        fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Onbekende fsync-policy: {fsync!r} (kies uit {sorted(FSYNC_POLICIES)})")
+        self.directory = Path(directory)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self.records_written = 0
+        self.batches_written = 0
+
+        self._thread = threading.Thread(target=self._run, name="turn-journal", daemon=True)
+        self._thread.start()
+
+    def path_for(self, session_id: str) -> Path:
+        return session_path(self.directory, session_id, ".jsonl")
+
+    def record(
+        self,
+        session_id: str,
+        role: str,
+        text: str,
+        emotions: Optional[Dict[str, float]] = None,
+        state_vector: Any = None,
+        extras: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if self._closed:
+            raise RuntimeError("TurnJournal is gesloten")
+        self._queue.put(make_record(session_id, role, text, emotions, state_vector, extras))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blokkeer tot alles wat vóór deze call is aangeboden op disk staat."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def rotate(self, timeout: Optional[float] = None) -> List[Path]:
+        """Flush en roteer alle sessielogs, tussen twee batches in de writer-thread."""
+        if self._closed:
+            return rotate_files(self.directory)
+        request = _Rotation()
+        self._queue.put(request)
+        request.wait(timeout)
+        return request.closed
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---- writer thread ---------------------------------------------------
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[Dict[str, Any]] = []
+            waiters: List[threading.Event] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch, force_sync=bool(waiters) or stop)
+                except Exception as e:
+                    print(f"[JOURNAL] write failed ({len(batch)} records): {e!r}")
+            for w in waiters:
+                if isinstance(w, _Rotation):
+                    try:
+                        w.closed = rotate_files(self.directory)
+                    except Exception as e:
+                        print(f"[JOURNAL] rotation failed: {e!r}")
+                w.set()
+
+    def _write_batch(self, batch: List[Dict[str, Any]], force_sync: bool) -> None:
+        by_session: Dict[str, List[str]] = {}
+        for record in batch:
+            by_session.setdefault(record["session_id"], []).append(
+                json.dumps(record, ensure_ascii=False) + "\n"
+            )
+
+        now = time.monotonic()
+        do_sync = self.fsync == "batch" or (
+            self.fsync == "interval" and (force_sync or now - self._last_fsync >= self.fsync_interval)
+        )
+
+        with span("journal.write_batch", records=len(batch), sessions=len(by_session), fsync=do_sync):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.directory / ROTATE_LOCK):
+                for session_id, lines in by_session.items():
+                    with self.path_for(session_id).open("a", encoding="utf-8") as f:
+                        f.writelines(lines)
+                        if do_sync:
+                            f.flush()
+                            os.fsync(f.fileno())
+
+        if do_sync:
+            self._last_fsync = now
+        self.records_written += len(batch)
+        self.batches_written += 1
+
+
+_journal: Optional[TurnJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> TurnJournal:
+    """Proces-brede journal; start de writer-thread bij eerste gebruik."""
+    global _journal
+    with _journal_lock:
+        if _journal is None or _journal._closed:
+            _journal = TurnJournal()
+            atexit.register(_journal.close)
+        return _journal
+
+
+def set_journal(journal: TurnJournal) -> Optional[TurnJournal]:
+    """Vervang de proces-brede journal (bijv. naar een tijdelijke map); geeft de oude terug."""
+    global _journal
+    with _journal_lock:
+        old, _journal = _journal, journal
+        return old
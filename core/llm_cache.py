@@ -0,0 +1,232 @@
+# core/llm_cache.py
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+# Configuratie (env), zodat de API zonder codewijziging af te stellen is
+LLM_CACHE_ENABLED = os.getenv("PDA_LLM_CACHE", "1") not in {"0", "false", "off"}
+LLM_CACHE_PATH = Path(os.getenv("PDA_LLM_CACHE_PATH", "cache/llm_cache.sqlite"))
+LLM_CACHE_SIZE = int(os.getenv("PDA_LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = float(os.getenv("PDA_LLM_CACHE_TTL", str(24 * 3600)))  # 0 = nooit verlopen
+LLM_CACHE_SKIP_INTENTS = {
+    i.strip() for i in os.getenv("PDA_LLM_CACHE_SKIP_INTENTS", "emotional_support").split(",") if i.strip()
+}
+
+_WS = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+def make_key(model: str, system_prompt: str, user_prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Hash over model + genormaliseerde prompts + sampling-parameters."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "system": _normalize(system_prompt),
+            "user": _normalize(user_prompt),
+            "params": params or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """In-memory LRU met een SQLite-bestand erachter, zodat hits een herstart overleven.
+
+    Schrijven naar SQLite gebeurt write-behind in een eigen thread; put()
+    raakt alleen de LRU. Op de event loop kijkt get_async() alleen in de
+    LRU en leest de disk-tier via asyncio.to_thread. De LRU en de
+    SQLite-connectie hebben elk een eigen lock, zodat de loop nooit op
+    disk-I/O wacht.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = LLM_CACHE_PATH,
+        max_entries: int = LLM_CACHE_SIZE,
+        ttl_seconds: float = LLM_CACHE_TTL,
+        skip_intents: Iterable[str] = LLM_CACHE_SKIP_INTENTS,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.skip_intents = set(skip_intents)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, text)
+        self._lock = threading.Lock()      # LRU + tellers
+        self._db_lock = threading.Lock()   # SQLite-connectie
+        self._db: Optional[sqlite3.Connection] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        if path is not None and enabled:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, created_at REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self._db.commit()
+            self._thread = threading.Thread(target=self._run, name="llm-cache-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def applies_to(self, intent: Optional[str]) -> bool:
+        return self.enabled and (intent is None or intent not in self.skip_intents)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        # aanroepen met self._lock vast
+        entry = self._lru.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._lru[key]
+        return None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT created_at, response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        with self._lock:
+            if row is not None and not self._expired(row[0]):
+                self._remember(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[1]
+            self.misses += 1
+        if row is not None:
+            self._queue.put(("delete", key))
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._get_memory(key)
+            if text is not None:
+                return text
+            if self._db is None:
+                self.misses += 1
+                return None
+        return self._get_disk(key)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """Als get(), maar de SQLite-lookup draait in een thread i.p.v. op de event loop."""
+        with self._lock:
+            text = self._get_memory(key)
+            if text is not None:
+                return text
+            if self._db is None:
+                self.misses += 1
+                return None
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+        if self._db is not None:
+            self._queue.put(("put", key, now, response))
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        self._lru[key] = (created_at, response)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            ops = [item for item in batch if isinstance(item, tuple)]
+            if ops:
+                try:
+                    with self._db_lock:
+                        for op in ops:
+                            if op[0] == "put":
+                                self._db.execute(
+                                    "INSERT OR REPLACE INTO llm_cache (key, created_at, response) VALUES (?, ?, ?)",
+                                    op[1:],
+                                )
+                            else:
+                                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (op[1],))
+                        self._db.commit()
+                except Exception as e:
+                    print(f"[LLM CACHE] write failed ({len(ops)} items): {e!r}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is None for item in batch):
+                return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blokkeer tot alle eerdere puts in SQLite staan."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / total if total else 0.0,
+            "resident": len(self._lru),
+        }
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
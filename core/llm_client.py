@@ -1,14 +1,42 @@
 # core/llm_client.py
+"""LLM-calls met cache, deadline en dispatcher.
+
+Twee dispatchers: "chat" voor de beurten van de engine (generate_text,
+generate_text_async, stream_text) en "local" voor call_llm. Coalescing van
+identieke prompts geldt voor beide; micro-batching alleen voor "local"
+(call_llm) en alleen met PDA_LLM_BATCH_URL. De chat-backends (Mistral, Ollama
+met system prompt) kennen geen batch-API, dus beurten worden nooit gebatcht.
+"""
 from __future__ import annotations
-from typing import Any, Dict
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlsplit
 
-import json
-import requests
+from core.deadline import remaining
+from core.llm_cache import get_llm_cache, make_key
+from core.llm_pool import get_pool
+from core.tracing import span
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "mistral:latest"  # jij gebruikt deze tag
+MISTRAL_TEMPERATURE = 0.4  # zelfde default als pda_mistral.chat
 
-# placeholder: hier kun je later Mistral / OpenAI / lokaal model inprikken
+# Dispatcher: identieke gelijktijdige prompts delen één call; verschillende
+# prompts worden binnen een kort venster gebundeld als de backend batches kan
+# (alleen call_llm, zie de docstring hierboven).
+LLM_COALESCE = os.getenv("PDA_LLM_COALESCE", "1") not in {"0", "false", "off"}
+LLM_BATCH_WINDOW_MS = float(os.getenv("PDA_LLM_BATCH_WINDOW_MS", "10"))
+LLM_BATCH_MAX = int(os.getenv("PDA_LLM_BATCH_MAX", "8"))
+# OpenAI-compatibel completions-endpoint dat een lijst prompts accepteert
+# (vLLM, llama.cpp server), op elke box van de lokale pool (PDA_OLLAMA_URLS).
+# Een volledige URL mag ook; alleen het pad telt. Leeg = geen batching.
+LLM_BATCH_URL = os.getenv("PDA_LLM_BATCH_URL", "")
+LLM_BATCH_PATH = urlsplit(LLM_BATCH_URL).path if "://" in LLM_BATCH_URL else LLM_BATCH_URL
+
+# Welke backends (Ollama-boxen, Mistral) en hoe er gerouteerd wordt: core.llm_pool
 
 
 def build_prompt(
@@ -56,25 +84,375 @@ Richtlijnen:
 
 
 
-def call_llm(prompt: str) -> str:
-    resp = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False,
-        },
-        timeout=120,
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    return data.get("response", "").strip()
+def _cache_lookup(
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    params: Dict[str, Any],
+    intent: Optional[str],
+) -> Tuple[Optional[str], Optional[str]]:
+    """(cache-key, gecachte tekst); key is None als caching niet geldt voor deze intent."""
+    cache = get_llm_cache()
+    if not cache.applies_to(intent):
+        return None, None
+    key = make_key(model, system_prompt, user_prompt, params)
+    return key, cache.get(key)
+
+
+async def _cache_lookup_async(
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    params: Dict[str, Any],
+    intent: Optional[str],
+) -> Tuple[Optional[str], Optional[str]]:
+    """Als _cache_lookup; op de loop alleen de LRU, SQLite via een thread."""
+    cache = get_llm_cache()
+    if not cache.applies_to(intent):
+        return None, None
+    key = make_key(model, system_prompt, user_prompt, params)
+    return key, await cache.get_async(key)
+
+
+def _cache_store(key: Optional[str], text: str) -> None:
+    # put() raakt alleen de LRU; SQLite schrijft write-behind
+    if key is not None and text:
+        get_llm_cache().put(key, text)
+
+
+_FOLLOW, _CALL, _LEAD, _MEMBER = "follow", "call", "lead", "member"
+
+
+class _Batch:
+    """Verzameling wachtende requests; de eerste (de leader) voert hem uit."""
+
+    __slots__ = ("items", "full", "wakers")
+
+    def __init__(self):
+        self.items: List[Tuple[str, Any, Future]] = []
+        self.full = threading.Event()
+        self.wakers: List[Callable[[], None]] = []
+
+    def close(self) -> None:
+        self.full.set()
+        for wake in self.wakers:
+            wake()
+
+
+def _consume(fut: "asyncio.Future[str]") -> None:
+    if not fut.cancelled():
+        fut.exception()
+
+
+class LLMDispatcher:
+    """Bundelt LLM-calls van gelijktijdige beurten voor één backend.
+
+    - Coalescing: een request met dezelfde key als een call die nog loopt
+      start geen eigen call, maar wacht op het resultaat van die call.
+    - Micro-batching (alleen met `call_batch`): verschillende requests die
+      binnen `window_ms` binnenkomen gaan samen in één batch-call, maximaal
+      `max_batch` per keer. De eerste request van een batch wacht het
+      venster af (of tot de batch vol is) en voert hem dan uit.
+
+    Sync (threads) en async (event loop) callers delen dezelfde in-flight
+    tabel: resultaten lopen via een concurrent.futures.Future.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        call: Callable[[Any], str],
+        call_async: Optional[Callable[[Any], Any]] = None,
+        call_batch: Optional[Callable[[List[Any]], List[str]]] = None,
+        window_ms: float = LLM_BATCH_WINDOW_MS,
+        max_batch: int = LLM_BATCH_MAX,
+        coalesce: bool = LLM_COALESCE,
+    ):
+        self.name = name
+        self.call = call
+        self.call_async = call_async
+        self.call_batch = call_batch if max_batch > 1 else None
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.calls = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self._inflight: Dict[str, Future] = {}
+        self._pending: Optional[_Batch] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def _join(self, key: str, request: Any) -> Tuple[Future, str, Optional[_Batch]]:
+        with self._lock:
+            fut = self._inflight.get(key) if self.coalesce else None
+            if fut is not None:
+                self.coalesced += 1
+                return fut, _FOLLOW, None
+            fut = Future()
+            if self.coalesce:
+                self._inflight[key] = fut
+            self.calls += 1
+            if self.call_batch is None:
+                return fut, _CALL, None
+
+            batch = self._pending
+            role = _MEMBER
+            if batch is None:
+                batch = self._pending = _Batch()
+                role = _LEAD
+            batch.items.append((key, request, fut))
+            if len(batch.items) >= self.max_batch:
+                self._pending = None
+                batch.close()
+            return fut, role, batch
+
+    def _finish(self, key: str, fut: Future, text: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(text)
+
+    def _take(self, batch: _Batch) -> List[Tuple[str, Any, Future]]:
+        with self._lock:
+            if self._pending is batch:
+                self._pending = None
+            self.batches += 1
+            self.batched_requests += len(batch.items)
+            return list(batch.items)
+
+    def _run(self, key: str, fut: Future, request: Any) -> None:
+        try:
+            text = self.call(request)
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+        else:
+            self._finish(key, fut, text)
+
+    def _run_batch(self, items: List[Tuple[str, Any, Future]]) -> None:
+        with span("llm.batch", backend=self.name, size=len(items)):
+            try:
+                texts = self.call_batch([request for _, request, _ in items])
+                if len(texts) != len(items):
+                    raise RuntimeError(f"Batch gaf {len(texts)} antwoorden op {len(items)} prompts")
+            except BaseException as e:
+                for key, _, fut in items:
+                    self._finish(key, fut, error=e)
+                return
+        for (key, _, fut), text in zip(items, texts):
+            self._finish(key, fut, text)
+
+    def submit(self, key: str, request: Any) -> Tuple[str, bool]:
+        """(tekst, coalesced); blokkeert tot het antwoord er is."""
+        fut, role, batch = self._join(key, request)
+        if role == _CALL:
+            self._run(key, fut, request)
+        elif role == _LEAD:
+            batch.full.wait(self.window)
+            self._run_batch(self._take(batch))
+        # wie meelift op een andere call wacht niet langer dan zijn eigen deadline
+        return fut.result(timeout=remaining()), role == _FOLLOW
+
+    async def submit_async(self, key: str, request: Any) -> Tuple[str, bool]:
+        """Async variant van submit.
+
+        De call zelf draait als losse task: als deze caller afhaakt, krijgen
+        de andere wachtenden op dezelfde key of batch toch hun antwoord.
+        """
+        fut, role, batch = self._join(key, request)
+        if role == _CALL:
+            self._spawn(self._run_async(key, fut, request))
+        elif role == _LEAD:
+            self._spawn(self._lead_async(batch))
+        result = asyncio.wrap_future(fut)
+        # uitkomst ook ophalen als deze caller al afhaakte (deadline, disconnect)
+        result.add_done_callback(_consume)
+        text = await asyncio.shield(result)
+        return text, role == _FOLLOW
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_async(self, key: str, fut: Future, request: Any) -> None:
+        if self.call_async is None:
+            await asyncio.to_thread(self._run, key, fut, request)
+            return
+        try:
+            text = await self.call_async(request)
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+        else:
+            self._finish(key, fut, text)
+
+    async def _lead_async(self, batch: _Batch) -> None:
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        with self._lock:
+            waiting = not batch.full.is_set()
+            if waiting:
+                batch.wakers.append(lambda: loop.call_soon_threadsafe(woken.set))
+        if waiting:
+            try:
+                await asyncio.wait_for(woken.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.to_thread(self._run_batch, self._take(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "batching": self.call_batch is not None,
+        }
+
+
+def _local_generate_batch(prompts: List[str]) -> List[str]:
+    """Eén request met alle prompts, via de lokale pool (routering, failover, breaker)."""
+    return get_pool("local").generate_batch(prompts, LLM_BATCH_PATH)
+
+
+def _local_generate(prompt: str) -> str:
+    return get_pool("local").generate("", prompt)
+
+
+async def _local_generate_async(prompt: str) -> str:
+    return await get_pool("local").generate_async("", prompt)
+
+
+def _chat_generate(request: Tuple[str, str]) -> str:
+    return get_pool("chat").generate(request[0], request[1], MISTRAL_TEMPERATURE)
+
+
+async def _chat_generate_async(request: Tuple[str, str]) -> str:
+    return await get_pool("chat").generate_async(request[0], request[1], MISTRAL_TEMPERATURE)
+
+
+_dispatchers: Dict[str, LLMDispatcher] = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(name: str) -> LLMDispatcher:
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(name)
+        if dispatcher is None:
+            if name == "local":
+                dispatcher = LLMDispatcher(
+                    name,
+                    _local_generate,
+                    _local_generate_async,
+                    _local_generate_batch if LLM_BATCH_URL else None,
+                )
+            elif name == "chat":
+                # chat-API's (Mistral, Ollama met system prompt) kennen geen batches: alleen coalescing
+                dispatcher = LLMDispatcher(name, _chat_generate, _chat_generate_async)
+            else:
+                raise KeyError(name)
+            _dispatchers[name] = dispatcher
+        return dispatcher
+
+
+def dispatch_stats() -> Dict[str, Dict[str, Any]]:
+    with _dispatchers_lock:
+        return {name: d.stats() for name, d in _dispatchers.items()}
+
+
+def call_llm(prompt: str, intent: Optional[str] = None) -> str:
+    model = get_pool("local").model_key
+    key, cached = _cache_lookup(model, "", prompt, {}, intent)
+    if cached is not None:
+        return cached
+
+    text, _ = get_dispatcher("local").submit(key or make_key(model, "", prompt), prompt)
+    _cache_store(key, text)
+    return text
+
+
+async def call_llm_async(prompt: str, intent: Optional[str] = None) -> str:
+    """Async variant van call_llm: blokkeert de event loop niet tijdens het wachten."""
+    model = get_pool("local").model_key
+    key, cached = await _cache_lookup_async(model, "", prompt, {}, intent)
+    if cached is not None:
+        return cached
+
+    text, _ = await get_dispatcher("local").submit_async(key or make_key(model, "", prompt), prompt)
+    _cache_store(key, text)
+    return text
+
+
+def generate_text(system_prompt: str, user_prompt: str, intent: Optional[str] = None) -> str:
+    model = get_pool("chat").model_key
+
+    with span(
+        "generate_text",
+        model=model,
+        intent=intent,
+        prompt_chars=len(system_prompt) + len(user_prompt),
+    ) as s:
+        params = {"temperature": MISTRAL_TEMPERATURE}
+        key, cached = _cache_lookup(model, system_prompt, user_prompt, params, intent)
+        s.set_attribute("cache_hit", cached is not None)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        text, coalesced = get_dispatcher("chat").submit(
+            key or make_key(model, system_prompt, user_prompt, params),
+            (system_prompt, user_prompt),
+        )
+        s.set_attribute("coalesced", coalesced)
+        s.set_attribute("llm_latency_ms", (time.perf_counter() - start) * 1000)
+        s.set_attribute("response_chars", len(text or ""))
+        _cache_store(key, text)
+        return text
+
+
+async def generate_text_async(system_prompt: str, user_prompt: str, intent: Optional[str] = None) -> str:
+    model = get_pool("chat").model_key
+
+    with span(
+        "generate_text",
+        model=model,
+        intent=intent,
+        prompt_chars=len(system_prompt) + len(user_prompt),
+    ) as s:
+        params = {"temperature": MISTRAL_TEMPERATURE}
+        key, cached = await _cache_lookup_async(model, system_prompt, user_prompt, params, intent)
+        s.set_attribute("cache_hit", cached is not None)
+        if cached is not None:
+            return cached
 
+        start = time.perf_counter()
+        text, coalesced = await get_dispatcher("chat").submit_async(
+            key or make_key(model, system_prompt, user_prompt, params),
+            (system_prompt, user_prompt),
+        )
+        s.set_attribute("coalesced", coalesced)
+        s.set_attribute("llm_latency_ms", (time.perf_counter() - start) * 1000)
+        s.set_attribute("response_chars", len(text or ""))
+        _cache_store(key, text)
+        return text
 
-def generate_text(system_prompt: str, user_prompt: str) -> str:
-    from pda_mistral import chat
-    
-    # Roep alleen aan met de parameters die chat() accepteert
-    return chat(system_prompt, user_prompt)
 
+async def stream_text(system_prompt: str, user_prompt: str, intent: Optional[str] = None) -> AsyncIterator[str]:
+    model = get_pool("chat").model_key
+    params = {"temperature": MISTRAL_TEMPERATURE}
+    key, cached = await _cache_lookup_async(model, system_prompt, user_prompt, params, intent)
+    if cached is not None:
+        yield cached
+        return
 
+    parts = []
+    async for token in get_pool("chat").stream_async(system_prompt, user_prompt, MISTRAL_TEMPERATURE):
+        parts.append(token)
+        yield token
+    # alleen complete streams cachen
+    _cache_store(key, "".join(parts).strip())
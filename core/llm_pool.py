@@ -0,0 +1,521 @@
+# core/llm_pool.py
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, TypeVar
+from urllib.parse import urlsplit
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.deadline import DeadlineExceeded, current_deadline, remaining
+from core.llm_transport import LLMBackend, get_backend, register_backend
+from core.tracing import span
+
+# Pools van LLM-backends, komma-gescheiden in voorkeursvolgorde. Een URL is
+# een Ollama-endpoint, "mistral" is de Mistral-API (pda_mistral).
+# - chat:  de beurten van de engine (generate_text / stream_text)
+# - local: call_llm (alleen lokale modellen)
+LLM_POOL = os.getenv("PDA_LLM_POOL", "mistral")
+OLLAMA_URLS = os.getenv("PDA_OLLAMA_URLS", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("PDA_OLLAMA_MODEL", "mistral:latest")
+LLM_HTTP_TIMEOUT = 120.0  # zonder deadline van de beurt
+
+# Hedging: na de p95 van de gekozen backend een tweede request naar de
+# volgende; zonder genoeg metingen na HEDGE_DEFAULT seconden. PDA_LLM_HEDGE=0 = uit.
+HEDGE_ENABLED = os.getenv("PDA_LLM_HEDGE", "1") not in {"0", "false", "off"}
+HEDGE_DEFAULT = float(os.getenv("PDA_LLM_HEDGE_DEFAULT_S", "8"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 128
+
+# Circuit breaker per backend
+BREAKER_FAILURES = int(os.getenv("PDA_LLM_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("PDA_LLM_BREAKER_COOLDOWN_S", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+T = TypeVar("T")
+
+
+def request_timeout() -> float:
+    """HTTP-timeout: het resterende budget van de beurt, anders LLM_HTTP_TIMEOUT."""
+    budget = remaining()
+    if budget is None:
+        return LLM_HTTP_TIMEOUT
+    if budget <= 0:
+        raise DeadlineExceeded("Geen budget meer voor de LLM-call")
+    return budget
+
+
+class CircuitBreaker:
+    """Closed → open na `failures` fouten op rij → na `cooldown` één probe (half-open).
+
+    Slaagt de probe, dan gaat de backend weer mee in de routering; faalt
+    hij, dan blijft hij nog een cooldown lang uit de pool.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.ejections = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Mag er nu een request heen (zonder iets te reserveren)?"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self._probing:
+                return False
+            return time.monotonic() - self.opened_at >= self.cooldown
+
+    def dispatch(self) -> None:
+        """Aanroepen voor een request dat naar deze backend gaat."""
+        with self._lock:
+            if self.state != CLOSED and not self._probing:
+                self.state = HALF_OPEN
+                self._probing = True
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state == CLOSED:
+                    self.ejections += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def abandon(self) -> None:
+        """Request afgebroken (hedge verloren, deadline): telt niet als uitkomst."""
+        with self._lock:
+            self._probing = False
+
+    def reopens_at(self) -> float:
+        return self.opened_at + self.cooldown if self.state != CLOSED else 0.0
+
+
+class PoolMember(ABC):
+    """Eén backend in een pool: latency-venster, circuit breaker en de call zelf.
+
+    Het latency-venster bevat alleen requests die echt klaar waren; een
+    afgebroken hedge of een request dat op de deadline stukliep telt niet.
+    """
+
+    kind = ""
+    batch = False  # kan generate_batch
+
+    def __init__(self, name: str, backend: LLMBackend):
+        self.name = name
+        self.backend = backend
+        self.breaker = CircuitBreaker()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.ewma = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    @abstractmethod
+    def model_key(self) -> str:
+        ...
+
+    def observe(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.ewma = seconds if self.ewma == 0.0 else self.ewma + 0.2 * (seconds - self.ewma)
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), 95))
+
+    def hedge_delay(self) -> float:
+        p95 = self.p95()
+        return p95 if p95 is not None else HEDGE_DEFAULT
+
+    def score(self) -> float:
+        """Verwachte wachttijd: gemeten latency × drukte. Lager is beter."""
+        limiter = self.backend.limiter
+        load = (limiter.in_flight + limiter.waiting + 1) / limiter.limit
+        # nog niet gemeten backends eerst proberen, zodat ze metingen krijgen
+        return self.ewma * load if self.latencies else 0.0
+
+    @abstractmethod
+    def generate(self, system: str, user: str, temperature: Optional[float], timeout: float) -> str:
+        ...
+
+    @abstractmethod
+    async def generate_async(self, system: str, user: str, temperature: Optional[float], timeout: float) -> str:
+        ...
+
+    @abstractmethod
+    def stream_async(self, system: str, user: str, temperature: Optional[float], timeout: float) -> AsyncIterator[str]:
+        ...
+
+    def generate_batch(self, prompts: List[str], path: str, timeout: float) -> List[str]:
+        """Alleen voor members met `batch = True`; de pool slaat de rest over."""
+        raise NotImplementedError(f"{self.name} kent geen batches")
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "kind": self.kind,
+            "state": self.breaker.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.breaker.ejections,
+            "latency_ms_ewma": round(self.ewma * 1000, 1),
+            "latency_ms_p95": round(p95 * 1000, 1) if p95 is not None else None,
+            **self.backend.stats(),
+        }
+
+
+class OllamaMember(PoolMember):
+    kind = "ollama"
+    batch = True
+
+    def __init__(self, base_url: str, model: str = OLLAMA_MODEL, backend: Optional[LLMBackend] = None):
+        base_url = base_url.rstrip("/")
+        name = f"ollama@{urlsplit(base_url).netloc}"
+        super().__init__(name, backend or register_backend(name))
+        self.base_url = base_url
+        self.url = f"{base_url}/api/generate"
+        self.model = model
+
+    @property
+    def model_key(self) -> str:
+        return f"ollama:{self.model}"
+
+    def _payload(self, system: str, user: str, temperature: Optional[float], stream: bool) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": self.model, "prompt": user, "stream": stream}
+        if system:
+            payload["system"] = system
+        if temperature is not None:
+            payload["options"] = {"temperature": temperature}
+        return payload
+
+    def generate(self, system, user, temperature, timeout):
+        with self.backend.slot(timeout) as timeout:
+            resp = self.backend.session().post(
+                self.url, json=self._payload(system, user, temperature, False), timeout=timeout
+            )
+        resp.raise_for_status()
+        return resp.json().get("response", "").strip()
+
+    async def generate_async(self, system, user, temperature, timeout):
+        async with self.backend.slot_async(timeout) as timeout:
+            resp = await self.backend.async_client().post(
+                self.url, json=self._payload(system, user, temperature, False), timeout=timeout
+            )
+        resp.raise_for_status()
+        return resp.json().get("response", "").strip()
+
+    async def stream_async(self, system, user, temperature, timeout):
+        """NDJSON van Ollama, één object per regel."""
+        async with self.backend.slot_async(timeout) as timeout:
+            async with self.backend.async_client().stream(
+                "POST", self.url, json=self._payload(system, user, temperature, True), timeout=timeout
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    token = data.get("response", "")
+                    if token:
+                        yield token
+                    if data.get("done"):
+                        break
+
+    def generate_batch(self, prompts, path, timeout):
+        """OpenAI-compatibel completions-endpoint met een lijst prompts; één slot voor de hele batch."""
+        with self.backend.slot(timeout) as timeout:
+            resp = self.backend.session().post(
+                f"{self.base_url}{path}",
+                json={"model": self.model, "prompt": prompts, "stream": False},
+                timeout=timeout,
+            )
+        resp.raise_for_status()
+        choices = sorted(resp.json()["choices"], key=lambda c: c["index"])
+        return [c.get("text", "").strip() for c in choices]
+
+
+class MistralMember(PoolMember):
+    """De Mistral-API via pda_mistral (dat zelf het "mistral"-slot neemt)."""
+
+    kind = "mistral"
+
+    def __init__(self):
+        super().__init__("mistral", get_backend("mistral"))
+
+    @property
+    def model_key(self) -> str:
+        from pda_mistral import MODEL_NAME
+
+        return f"mistral:{MODEL_NAME}"
+
+    def generate(self, system, user, temperature, timeout):
+        from pda_mistral import chat
+
+        return chat(system, user, temperature=temperature if temperature is not None else 0.4, timeout=timeout)
+
+    async def generate_async(self, system, user, temperature, timeout):
+        from pda_mistral import chat_async
+
+        return await chat_async(
+            system, user, temperature=temperature if temperature is not None else 0.4, timeout=timeout
+        )
+
+    async def stream_async(self, system, user, temperature, timeout):
+        from pda_mistral import chat_stream_async
+
+        async for token in chat_stream_async(
+            system, user, temperature=temperature if temperature is not None else 0.4, timeout=timeout
+        ):
+            yield token
+
+
+class BackendPool:
+    """Routeert LLM-requests over meerdere backends.
+
+    - Routering: de beschikbare backend met de laagste verwachte wachttijd
+      (EWMA-latency × bezetting van zijn slots); ongemeten backends eerst.
+    - Hedging (async): is het antwoord er na de p95 van die backend nog
+      niet, dan gaat hetzelfde request ook naar de volgende; het eerste
+      antwoord wint en de andere wordt afgebroken.
+    - Failover: faalt een request, dan volgt direct de volgende backend.
+    - Circuit breaker per backend: na herhaalde fouten gaat hij een
+      cooldown lang uit de pool en komt terug via één probe-request. Zijn
+      alle backends uit de pool, dan krijgt degene die het eerst weer
+      aan de beurt zou zijn het request toch (liever proberen dan weigeren).
+    """
+
+    def __init__(self, name: str, members: List[PoolMember], hedge: bool = HEDGE_ENABLED):
+        if not members:
+            raise ValueError(f"LLM-pool {name!r} heeft geen backends")
+        self.name = name
+        self.members = members
+        self.hedge = hedge and len(members) > 1
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    @property
+    def model_key(self) -> str:
+        """Modellen in de pool, voor de cache-key (één backend: diens model)."""
+        return "|".join(dict.fromkeys(m.model_key for m in self.members))
+
+    def _route(self, exclude: Set[PoolMember]) -> Optional[PoolMember]:
+        with self._lock:
+            candidates = [m for m in self.members if m not in exclude]
+            if not candidates:
+                return None
+            available = [m for m in candidates if m.breaker.available()]
+            if available:
+                member = min(available, key=lambda m: m.score())
+            else:
+                member = min(candidates, key=lambda m: m.breaker.reopens_at())
+            member.breaker.dispatch()
+            member.requests += 1
+            return member
+
+    def _failed(self, member: PoolMember, error: BaseException) -> None:
+        """Boekt een fout; is het budget van de beurt op, dan DeadlineExceeded (geen failover)."""
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            # timeout op het budget van de beurt: traag, maar geen storing
+            member.breaker.abandon()
+            raise DeadlineExceeded(f"Deadline verstreken tijdens {member.name}") from error
+        member.errors += 1
+        was_closed = member.breaker.state == CLOSED
+        member.breaker.failure()
+        print(f"[LLM POOL] {member.name} faalde: {error!r}")
+        if was_closed and member.breaker.state == OPEN:
+            print(f"[LLM POOL] {member.name} uit de pool voor {member.breaker.cooldown:.0f}s")
+
+    def generate(self, system: str, user: str, temperature: Optional[float] = None) -> str:
+        """Sync: routering + failover, zonder hedging (dat vraagt extra threads)."""
+        return self._call(lambda m: m.generate(system, user, temperature, request_timeout()))
+
+    def generate_batch(self, prompts: List[str], path: str) -> List[str]:
+        """Batch naar `path` op de backends die dat kunnen, met dezelfde failover."""
+        skip = {m for m in self.members if not m.batch}
+        if len(skip) == len(self.members):
+            raise ValueError(f"LLM-pool {self.name!r} heeft geen backend met batches")
+        return self._call(lambda m: m.generate_batch(prompts, path, request_timeout()), skip)
+
+    def _call(self, call: Callable[[PoolMember], T], skip: Set[PoolMember] = frozenset()) -> T:
+        tried: Set[PoolMember] = set(skip)
+        last_error: Optional[BaseException] = None
+        while True:
+            member = self._route(tried)
+            if member is None:
+                raise last_error
+            if len(tried) > len(skip):
+                self.failovers += 1
+            tried.add(member)
+            start = time.monotonic()
+            try:
+                result = call(member)
+            except DeadlineExceeded:
+                member.breaker.abandon()
+                raise
+            except Exception as e:
+                self._failed(member, e)
+                last_error = e
+                continue
+            member.observe(time.monotonic() - start)
+            member.breaker.success()
+            return result
+
+    async def _attempt(self, member: PoolMember, system: str, user: str, temperature: Optional[float]) -> str:
+        start = time.monotonic()
+        try:
+            text = await member.generate_async(system, user, temperature, request_timeout())
+        except asyncio.CancelledError:
+            # verloren hedge: niet af, dus geen latency-meting
+            member.breaker.abandon()
+            raise
+        except DeadlineExceeded:
+            member.breaker.abandon()
+            raise
+        except Exception as e:
+            self._failed(member, e)
+            raise
+        member.observe(time.monotonic() - start)
+        member.breaker.success()
+        return text
+
+    async def generate_async(self, system: str, user: str, temperature: Optional[float] = None) -> str:
+        tried: Set[PoolMember] = set()
+        tasks: Dict[asyncio.Task, PoolMember] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Optional[PoolMember]:
+            member = self._route(tried)
+            if member is not None:
+                tried.add(member)
+                tasks[asyncio.ensure_future(self._attempt(member, system, user, temperature))] = member
+            return member
+
+        with span("llm.pool", pool=self.name) as s:
+            first = latest = launch()
+            hedged = not self.hedge
+            try:
+                while tasks:
+                    done, _ = await asyncio.wait(
+                        tasks, timeout=None if hedged else latest.hedge_delay(),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    if not done:
+                        hedged = True
+                        hedge = launch()
+                        if hedge is not None:
+                            self.hedged += 1
+                            s.set_attribute("hedged_to", hedge.name)
+                        continue
+                    for task in done:
+                        member = tasks.pop(task)
+                        if task.exception() is None:
+                            if hedged and member is not first:
+                                self.hedge_wins += 1
+                            s.set_attribute("backend", member.name)
+                            return task.result()
+                        last_error = task.exception()
+                        if isinstance(last_error, DeadlineExceeded):
+                            raise last_error
+                    if not tasks:
+                        latest = launch()
+                        if latest is not None:
+                            self.failovers += 1
+                raise last_error
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def stream_async(
+        self, system: str, user: str, temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Routering + failover tot het eerste token; daarna geen wissel meer."""
+        tried: Set[PoolMember] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            member = self._route(tried)
+            if member is None:
+                raise last_error
+            if tried:
+                self.failovers += 1
+            tried.add(member)
+            start = time.monotonic()
+            started = False
+            try:
+                async for token in member.stream_async(system, user, temperature, request_timeout()):
+                    if not started:
+                        started = True
+                        member.observe(time.monotonic() - start)  # tijd tot het eerste token
+                    yield token
+            except (asyncio.CancelledError, GeneratorExit, DeadlineExceeded):
+                member.breaker.abandon()
+                raise
+            except Exception as e:
+                self._failed(member, e)
+                if started:
+                    raise
+                last_error = e
+                continue
+            member.breaker.success()
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "backends": {m.name: m.stats() for m in self.members},
+        }
+
+
+def _members(spec: str) -> List[PoolMember]:
+    members: List[PoolMember] = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        if entry == "mistral":
+            members.append(MistralMember())
+        elif entry.startswith(("http://", "https://")):
+            # het standaard lokale endpoint houdt de bestaande "ollama"-backend
+            backend = get_backend("ollama") if entry.rstrip("/") == "http://localhost:11434" else None
+            members.append(OllamaMember(entry, backend=backend))
+        else:
+            print(f"[LLM POOL] onbekende backend {entry!r} genegeerd")
+    return members
+
+
+POOL_SPECS = {"chat": LLM_POOL, "local": OLLAMA_URLS}
+_pools: Dict[str, BackendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> BackendPool:
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = BackendPool(name, _members(POOL_SPECS[name]))
+        return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}
@@ -0,0 +1,231 @@
+# core/llm_transport.py
+from __future__ import annotations
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hoeveel requests een backend echt parallel verwerkt (Ollama: OLLAMA_NUM_PARALLEL)
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("PDA_OLLAMA_MAX_CONCURRENCY", "2"))
+MISTRAL_MAX_CONCURRENCY = int(os.getenv("PDA_MISTRAL_MAX_CONCURRENCY", "4"))
+
+
+class ConcurrencyLimiter:
+    """Semafoor die door sync (threads) en async (event loop) callers gedeeld wordt.
+
+    Bij release() gaat het slot direct over naar de eerstvolgende wachtende,
+    in FIFO-volgorde, zodat nieuwe callers niet voor de rij kunnen kruipen.
+    """
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError("limit moet >= 1 zijn")
+        self.limit = limit
+        self.in_flight = 0
+        self.acquired_total = 0
+        self.max_waiting = 0
+        self.wait_seconds_total = 0.0
+        self._lock = threading.Lock()
+        self._waiters: Deque[Tuple[Any, ...]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_fast(self) -> bool:
+        # aanroepen met self._lock vast
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.acquired_total += 1
+            return True
+        return False
+
+    def _enqueue(self, waiter: Tuple[Any, ...]) -> None:
+        self._waiters.append(waiter)
+        self.max_waiting = max(self.max_waiting, len(self._waiters))
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wacht op een slot, hooguit `timeout` seconden; False = geen slot gekregen."""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_fast():
+                return True
+            event = threading.Event()
+            waiter = ("sync", event)
+            self._enqueue(waiter)
+        if not event.wait(timeout):
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._add_wait_locked(time.monotonic() - start)
+                    return False
+            # het slot werd net op tijd aan ons overgedragen
+        self._add_wait(time.monotonic() - start)
+        return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_fast():
+                return True
+            fut = loop.create_future()
+            waiter = ("async", loop, fut)
+            self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    fut.cancel()
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._add_wait_locked(time.monotonic() - start)
+                        return False
+                    raise
+            # het slot was al aan ons overgedragen (of is onderweg)
+            if isinstance(e, asyncio.TimeoutError):
+                await fut
+            else:
+                fut.add_done_callback(lambda f: f.cancelled() or self.release())
+                raise
+        self._add_wait(time.monotonic() - start)
+        return True
+
+    def _add_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._add_wait_locked(seconds)
+
+    def _add_wait_locked(self, seconds: float) -> None:
+        self.wait_seconds_total += seconds
+
+    def _wake(self, fut: "asyncio.Future[None]") -> None:
+        if fut.cancelled():
+            self.release()  # waiter is intussen afgehaakt
+        else:
+            fut.set_result(None)
+
+    def release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                self.acquired_total += 1
+                if waiter[0] == "sync":
+                    waiter[1].set()
+                else:
+                    _, loop, fut = waiter
+                    loop.call_soon_threadsafe(self._wake, fut)
+                return
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquired_total": self.acquired_total,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+        }
+
+
+class LLMBackend:
+    """Eén LLM-backend: keep-alive connection pool + limiet op gelijktijdige requests."""
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self._session: Optional[requests.Session] = None
+        self._async_clients: Dict[int, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    def session(self) -> requests.Session:
+        """Gedeelde requests.Session; hergebruikt TCP-verbindingen."""
+        with self._lock:
+            if self._session is None:
+                size = self.limiter.limit
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Gedeelde httpx.AsyncClient per event loop."""
+        loop_id = id(asyncio.get_running_loop())
+        with self._lock:
+            client = self._async_clients.get(loop_id)
+            if client is None or client.is_closed:
+                size = self.limiter.limit
+                client = httpx.AsyncClient(
+                    timeout=120,
+                    limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+                )
+                self._async_clients[loop_id] = client
+            return client
+
+    def _left(self, timeout: Optional[float], start: float) -> Optional[float]:
+        if timeout is None:
+            return None
+        left = timeout - (time.monotonic() - start)
+        if left <= 0:
+            self.limiter.release()
+            raise TimeoutError(f"Geen {self.name}-slot binnen {timeout:.1f}s")
+        return left
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """Houdt een slot vast; geeft de `timeout` terug die na het wachten nog over is."""
+        start = time.monotonic()
+        if not self.limiter.acquire(timeout):
+            raise TimeoutError(f"Geen {self.name}-slot binnen {timeout:.1f}s")
+        left = self._left(timeout, start)
+        try:
+            yield left
+        finally:
+            self.limiter.release()
+
+    @asynccontextmanager
+    async def slot_async(self, timeout: Optional[float] = None):
+        start = time.monotonic()
+        if not await self.limiter.acquire_async(timeout):
+            raise TimeoutError(f"Geen {self.name}-slot binnen {timeout:.1f}s")
+        left = self._left(timeout, start)
+        try:
+            yield left
+        finally:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.limiter.stats()}
+
+
+BACKENDS: Dict[str, LLMBackend] = {
+    "ollama": LLMBackend("ollama", OLLAMA_MAX_CONCURRENCY),
+    "mistral": LLMBackend("mistral", MISTRAL_MAX_CONCURRENCY),
+}
+
+
+def get_backend(name: str) -> LLMBackend:
+    return BACKENDS[name]
+
+
+def register_backend(name: str, max_concurrency: int = OLLAMA_MAX_CONCURRENCY) -> LLMBackend:
+    """Backend voor een extra endpoint (bijv. een tweede Ollama-box); idempotent."""
+    backend = BACKENDS.get(name)
+    if backend is None:
+        backend = BACKENDS[name] = LLMBackend(name, max_concurrency)
+    return backend
+
+
+def transport_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: backend.stats() for name, backend in BACKENDS.items()}
@@ -0,0 +1,383 @@
+# core/log_archive.py
+"""Compaction van gesloten journal-logs naar een kolom-archief.
+
+Rotatie verplaatst actieve logs naar logs/closed/; compaction voegt die
+samen tot een segment onder logs/archive/segment_<stempel>/ met één
+.npy-bestand per kolom. Lezen gaat via np.load(mmap_mode="r"), dus een
+analyse raakt alleen de kolommen (en pagina's) die ze nodig heeft.
+
+Gebruik (vanuit de repo-root):
+    python -m core.log_archive compact [--no-rotate] [--keep]
+    python -m core.log_archive info
+"""
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import argparse
+import heapq
+import json
+import os
+import shutil
+
+import numpy as np
+
+from core.journal import CLOSED_SUBDIR, JOURNAL_DIR, get_journal, rotate_files
+from core.utils import pack_strings, unpack_strings
+
+ARCHIVE_DIR = Path(os.getenv("PDA_ARCHIVE_DIR", str(JOURNAL_DIR / "archive")))
+
+STATE_DIMS = 32
+ROLES = ("user", "pda")
+BASE_FIELDS = {"timestamp", "session_id", "role", "text", "emotions", "state_vector"}
+
+
+def _parse_ts(value: Any) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def read_jsonl(paths: Iterable[Path], warn: bool = True) -> Iterator[Dict[str, Any]]:
+    """Records uit journal-bestanden; kapotte regels (bijv. half geschreven) worden overgeslagen."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    if warn:
+                        print(f"[ARCHIVE] skipping malformed line {path.name}:{n}")
+
+
+def _sort_key(ts: float) -> float:
+    return float("inf") if ts != ts else ts  # records zonder geldige timestamp achteraan
+
+
+def _extras(record: Dict[str, Any]) -> bytes:
+    return json.dumps({k: v for k, v in record.items() if k not in BASE_FIELDS}, ensure_ascii=False).encode("utf-8")
+
+
+class _Scan:
+    """Eerste pass over de bronnen: aantallen, woordenboeken en blob-groottes."""
+
+    def __init__(self, sources: Sequence[Path]):
+        self.rows = 0
+        self.text_bytes = 0
+        self.extras_bytes = 0
+        self.unsorted: Set[Path] = set()
+        sessions: Set[str] = set()
+        emotions: Set[str] = set()
+        for path in sources:
+            last = float("-inf")
+            for r in read_jsonl([path]):
+                self.rows += 1
+                sessions.add(str(r.get("session_id", "")))
+                emotions.update(r.get("emotions") or {})
+                self.text_bytes += len(str(r.get("text", "")).encode("utf-8"))
+                self.extras_bytes += len(_extras(r))
+                key = _sort_key(_parse_ts(r.get("timestamp")))
+                if key < last:
+                    self.unsorted.add(path)
+                last = key
+        self.sessions = sorted(sessions)
+        self.emotion_names = sorted(emotions)
+
+
+def _merged(sources: Sequence[Path], unsorted: Set[Path]) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """(timestamp, record) over alle bronnen, gesorteerd via een k-way merge.
+
+    Een journal-bestand is append-only per sessie en dus al op tijd
+    gesorteerd; alleen een bestand waarvoor dat niet geldt wordt in zijn
+    geheel in RAM gesorteerd.
+    """
+    def run(path: Path) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        records = ((_parse_ts(r.get("timestamp")), r) for r in read_jsonl([path], warn=False))
+        if path in unsorted:
+            return iter(sorted(records, key=lambda item: _sort_key(item[0])))
+        return records
+
+    return heapq.merge(*(run(p) for p in sources), key=lambda item: _sort_key(item[0]))
+
+
+def write_segment(sources: Sequence[Path], archive_dir: Path) -> Optional[Path]:
+    """Schrijf de records van `sources` als één segment, atomair (tijdelijke map + rename).
+
+    Twee streaming passes: de eerste bepaalt de groottes, de tweede schrijft
+    de records in tijdsvolgorde direct in memory-mapped .npy-kolommen. Het
+    geheugengebruik hangt dus niet af van hoeveel logs er gecompacteerd worden.
+    Geeft None als er geen records zijn.
+    """
+    scan = _Scan(sources)
+    if not scan.rows:
+        return None
+    n = scan.rows
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    name = f"segment_{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+    tmp = archive_dir / f".{name}.tmp"
+    tmp.mkdir()
+    try:
+        def column(column_name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+            if 0 in shape:  # een leeg bestand kan niet gemapt worden
+                array = np.zeros(shape, dtype=dtype)
+                np.save(tmp / f"{column_name}.npy", array)
+                return array
+            return np.lib.format.open_memmap(tmp / f"{column_name}.npy", mode="w+", dtype=dtype, shape=shape)
+
+        ts = column("timestamp", (n,), np.float64)
+        session = column("session", (n,), np.int32)
+        role = column("role", (n,), np.uint8)
+        state = column("state", (n, STATE_DIMS), np.float32)
+        emotions = column("emotions", (len(scan.emotion_names), n), np.float32)  # één rij per emotie
+        text_blob = column("text_blob", (scan.text_bytes,), np.uint8)
+        text_offsets = column("text_offsets", (n + 1,), np.int64)
+        extras_blob = column("extras_blob", (scan.extras_bytes,), np.uint8)
+        extras_offsets = column("extras_offsets", (n + 1,), np.int64)
+        text_offsets[0] = extras_offsets[0] = 0
+
+        session_codes = {sid: i for i, sid in enumerate(scan.sessions)}
+        emotion_codes = {e: i for i, e in enumerate(scan.emotion_names)}
+        emotions[:] = 0.0
+        text_at = extras_at = 0
+        for i, (stamp, r) in enumerate(_merged(sources, scan.unsorted)):
+            ts[i] = stamp
+            session[i] = session_codes[str(r.get("session_id", ""))]
+            role[i] = ROLES.index(r["role"]) if r.get("role") in ROLES else 255
+            vec = r.get("state_vector") or []
+            state[i] = vec if len(vec) == STATE_DIMS else 0.0
+            for emotion, value in (r.get("emotions") or {}).items():
+                emotions[emotion_codes[emotion], i] = value
+            text = str(r.get("text", "")).encode("utf-8")
+            text_blob[text_at:text_at + len(text)] = np.frombuffer(text, dtype=np.uint8)
+            text_at += len(text)
+            text_offsets[i + 1] = text_at
+            extras = _extras(r)
+            extras_blob[extras_at:extras_at + len(extras)] = np.frombuffer(extras, dtype=np.uint8)
+            extras_at += len(extras)
+            extras_offsets[i + 1] = extras_at
+
+        for column_name, strings in (("session", scan.sessions), ("emotion", scan.emotion_names)):
+            blob, offsets = pack_strings(strings)
+            np.save(tmp / f"{column_name}_blob.npy", blob)
+            np.save(tmp / f"{column_name}_offsets.npy", offsets)
+
+        valid = ts[~np.isnan(ts)]
+        meta = {
+            "rows": n,
+            "min_ts": float(valid.min()) if len(valid) else None,
+            "max_ts": float(valid.max()) if len(valid) else None,
+            "sources": [p.name for p in sources],
+        }
+        for array in (ts, session, role, state, emotions, text_blob, text_offsets, extras_blob, extras_offsets):
+            if isinstance(array, np.memmap):
+                array.flush()
+        del ts, session, role, state, emotions, text_blob, text_offsets, extras_blob, extras_offsets, valid
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        target = archive_dir / name
+        os.replace(tmp, target)
+        return target
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def compact(
+    journal_dir: Path = JOURNAL_DIR,
+    archive_dir: Path = ARCHIVE_DIR,
+    rotate: bool = True,
+    in_process: bool = True,
+    keep_sources: bool = False,
+) -> Optional[Path]:
+    """Roteer (optioneel) en voeg alle gesloten logs samen tot één nieuw segment.
+
+    Is `journal_dir` de map van de journal van dit proces (`in_process`),
+    dan roteert diens writer-thread, na wat nog in de queue staat. Anders
+    (CLI naast een draaiende API) roteert compaction zelf onder het
+    rotatie-lock dat ook de writers van andere processen nemen.
+    """
+    journal_dir = Path(journal_dir)
+    if rotate:
+        journal = get_journal() if in_process else None
+        if journal is not None and journal.directory.resolve() == journal_dir.resolve():
+            journal.rotate()
+        else:
+            rotate_files(journal_dir)
+
+    sources = sorted((journal_dir / CLOSED_SUBDIR).glob("*.jsonl"))
+    if not sources:
+        return None
+    segment = write_segment(sources, archive_dir)
+    if not keep_sources:
+        for path in sources:
+            path.unlink()
+    return segment
+
+
+class Segment:
+    """Eén archief-segment; kolommen worden lazy en memory-mapped geopend."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._cache:
+            self._cache[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._cache[name]
+
+    @property
+    def sessions(self) -> List[str]:
+        return unpack_strings(self.array("session_blob"), self.array("session_offsets"))
+
+    @property
+    def emotion_names(self) -> List[str]:
+        return unpack_strings(self.array("emotion_blob"), self.array("emotion_offsets"))
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        lo, hi = self.meta.get("min_ts"), self.meta.get("max_ts")
+        if lo is None:
+            return True
+        return not ((since is not None and hi < since) or (until is not None and lo > until))
+
+    def column(self, name: str, rows: Optional[np.ndarray] = None):
+        """Kolom (optioneel alleen `rows`). Strings komen terug als lijst."""
+        if name == "session_id":
+            sessions = self.sessions
+            codes = self.array("session")
+            codes = codes if rows is None else codes[rows]
+            return [sessions[c] for c in codes.tolist()]
+        if name == "role":
+            codes = self.array("role")
+            codes = codes if rows is None else codes[rows]
+            return [ROLES[c] if c < len(ROLES) else "?" for c in codes.tolist()]
+        if name in ("text", "extras"):
+            blob, offsets = self.array(f"{name}_blob"), self.array(f"{name}_offsets")
+            values = unpack_strings(blob, offsets, range(len(self)) if rows is None else rows.tolist())
+            return [json.loads(v) for v in values] if name == "extras" else values
+        if name.startswith("emotion:"):
+            emotion = name.split(":", 1)[1]
+            names = self.emotion_names
+            if emotion not in names:
+                return np.zeros(len(self) if rows is None else len(rows), dtype=np.float32)
+            values = self.array("emotions")[names.index(emotion)]
+            return np.asarray(values if rows is None else values[rows])
+        if name in ("timestamp", "state"):
+            values = self.array(name)
+            return np.asarray(values if rows is None else values[rows])
+        raise KeyError(f"Onbekende kolom: {name!r}")
+
+    def mask(
+        self,
+        session_id: Optional[str] = None,
+        role: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        where: Optional[Callable[["Segment"], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """Bool-masker van de rijen die aan alle predicaten voldoen."""
+        mask = np.ones(len(self), dtype=bool)
+        if session_id is not None:
+            sessions = self.sessions
+            if session_id not in sessions:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.array("session") == sessions.index(session_id)
+        if role is not None:
+            mask &= self.array("role") == (ROLES.index(role) if role in ROLES else 255)
+        if since is not None or until is not None:
+            ts = self.array("timestamp")
+            if since is not None:
+                mask &= ts >= since
+            if until is not None:
+                mask &= ts <= until
+        if where is not None:
+            mask &= np.asarray(where(self), dtype=bool)
+        return mask
+
+
+class ColumnarArchive:
+    """Alle segmenten onder `directory`, met predicate-gefilterde kolom-reads."""
+
+    def __init__(self, directory: Path = ARCHIVE_DIR):
+        self.directory = Path(directory)
+
+    @property
+    def segments(self) -> List[Segment]:
+        if not self.directory.exists():
+            return []
+        return [Segment(p) for p in sorted(self.directory.glob("segment_*")) if p.is_dir()]
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self.segments)
+
+    def scan(
+        self,
+        columns: Sequence[str],
+        session_id: Optional[str] = None,
+        role: Optional[str] = None,
+        since: Optional[datetime | float] = None,
+        until: Optional[datetime | float] = None,
+        where: Optional[Callable[[Segment], np.ndarray]] = None,
+    ) -> Dict[str, Any]:
+        """Lees alleen `columns` van de rijen die aan de predicaten voldoen.
+
+        `where(segment)` geeft een bool-masker, bijvoorbeeld
+        `lambda s: s.column("emotion:angst") > 0.5`. Segmenten buiten
+        [since, until] worden niet geopend.
+        """
+        since = since.timestamp() if isinstance(since, datetime) else since
+        until = until.timestamp() if isinstance(until, datetime) else until
+        parts: Dict[str, List[Any]] = {c: [] for c in columns}
+        for segment in self.segments:
+            if not segment.overlaps(since, until):
+                continue
+            rows = np.flatnonzero(segment.mask(session_id, role, since, until, where))
+            if not len(rows):
+                continue
+            for c in columns:
+                parts[c].append(segment.column(c, rows))
+
+        out: Dict[str, Any] = {}
+        for c, chunks in parts.items():
+            if c in ("session_id", "role", "text", "extras"):
+                out[c] = [v for chunk in chunks for v in chunk]
+            elif chunks:
+                out[c] = np.concatenate(chunks)
+            else:
+                out[c] = np.zeros((0, STATE_DIMS) if c == "state" else 0, dtype=np.float32)
+        return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rotatie + compaction van journal-logs naar een kolom-archief.")
+    parser.add_argument("command", choices=["compact", "info"])
+    parser.add_argument("--journal-dir", type=Path, default=JOURNAL_DIR)
+    parser.add_argument("--archive-dir", type=Path, default=ARCHIVE_DIR)
+    parser.add_argument("--no-rotate", action="store_true", help="alleen al gesloten logs compacteren")
+    parser.add_argument("--keep", action="store_true", help="gesloten logs na compaction bewaren")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        segment = compact(
+            args.journal_dir, args.archive_dir,
+            rotate=not args.no_rotate, in_process=False, keep_sources=args.keep,
+        )
+        print(f"[ARCHIVE] {'nieuw segment: ' + str(segment) if segment else 'niets te compacteren'}")
+    else:
+        archive = ColumnarArchive(args.archive_dir)
+        for segment in archive.segments:
+            print(f"{segment.path.name}: {len(segment)} rijen, {len(segment.sessions)} sessies")
+        print(f"totaal: {len(archive)} rijen")
+
+
+if __name__ == "__main__":
+    main()
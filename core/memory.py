@@ -1,71 +1,103 @@
 # memory.py
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+from types import MappingProxyType
+import os
+import threading
+import time
 import uuid
 import numpy as np
-import json
-from pathlib import Path
-from datetime import datetime
+from core.journal import get_journal
+from core.state_history import StateHistory
+from core.state_index import get_global_state_index, knn_exact
+from core.summary import RollingSummary, _snippet
+from core.text_index import BM25Index
 from core.utils import to_list
 
-_memory_store = {}
+# Relevante eerdere momenten (op emotionele staat) die in de prompt mogen,
+# en of alle sessies ook in één globaal index komen (voor
+# MemoryStore.similar_moments over sessies; kost een index-update per beurt).
+RECALL_K = int(os.getenv("PDA_RECALL_K", "2"))
+GLOBAL_STATE_INDEX = os.getenv("PDA_GLOBAL_STATE_INDEX", "0").lower() in {"1", "true", "on"}
+RECALL_SNIPPET_WORDS = 25
+# Aantal lexicaal (BM25) relevante oudere beurten in de prompt
+LEXICAL_RECALL_K = int(os.getenv("PDA_LEXICAL_RECALL_K", "2"))
+# Alleen de laatste MEMORY_WINDOW beurten blijven in RAM. Met een duurzame
+# store (PDA_MEMORY_BACKEND=sqlite) worden oudere uit SQLite gelezen; zonder
+# staan ze alleen nog in de journal (logs/) en tellen ze niet meer mee voor recall.
+MEMORY_WINDOW = int(os.getenv("PDA_MEMORY_WINDOW", "200"))
 
 def get_session_memory(session_id: str):
-    if session_id not in _memory_store:
-        _memory_store[session_id] = ConversationMemory(session_id)
-    return _memory_store[session_id]
+    """ConversationMemory van deze sessie, via de begrensde SessionRegistry."""
+    from core.sessions import get_session
+
+    return get_session(session_id).memory
+
+
+_NO_EMOTIONS: Dict[str, float] = MappingProxyType({})  # gedeeld, read-only
 
 
-@dataclass
 class TurnMemory:
-    role: str                    # "user" of "pda"
-    text: str
-    emotions: Dict[str, float]   # output van text_to_emotions
-    state_vector: List[float]    # snapshot van 32D vector
-    timestamp: datetime = field(default_factory=datetime.utcnow)
+    """Compacte beurt: de state-snapshot staat als rij in de StateHistory van de sessie."""
+
+    __slots__ = ("role", "text", "emotions", "_ts", "_history", "_row")
+
+    def __init__(
+        self,
+        role: str,                   # "user" of "pda"
+        text: str,
+        emotions: Dict[str, float],  # output van text_to_emotions
+        history: StateHistory,
+        row: int,                    # rij van de 32D snapshot in history
+        timestamp: Optional[float] = None,
+    ):
+        self.role = role
+        self.text = text
+        self.emotions = emotions if emotions else _NO_EMOTIONS
+        self._ts = time.time() if timestamp is None else timestamp
+        self._history = history
+        self._row = row
+
+    @property
+    def state_vector(self) -> List[float]:
+        """Snapshot van de 32D vector (als lijst, zoals voorheen)."""
+        return self._history.get(self._row).tolist()
+
+    @property
+    def state_row(self) -> int:
+        return self._row
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self._ts, timezone.utc).replace(tzinfo=None)
+
+    def __repr__(self) -> str:
+        return f"TurnMemory(role={self.role!r}, text={self.text!r}, emotions={dict(self.emotions)!r})"
 
 
 @dataclass
 class ConversationMemory:
-    def __init__(self, session_id: str):
+    def __init__(
+        self,
+        session_id: str,
+        shared_index: Optional[BM25Index] = None,
+        persist: Optional[Any] = None,  # core.memory_db.MemoryDB: write-through naar SQLite
+    ):
         self.session_id = session_id
-        self.turns: List[Turn] = []
-        self.log_path = Path(f"logs/session_{session_id}.jsonl")
-        self.log_path.parent.mkdir(exist_ok=True)
-    
-    def append_turn(self, role: str, text: str, emotions: Dict, state_vector):
-        turn = Turn(
-            role=role, 
-            text=text, 
-            emotions=emotions, 
-            state_vector=to_list(state_vector)  # ✅
-    )
-        self.turns.append(turn)
-        self._log_to_file(turn)
-    
-    def _log_to_file(self, turn: Turn):  # ← moet een methode zijn!
-        print(f"[DEBUG] Logging to: {self.log_path}")
-        
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "session_id": self.session_id,
-            "role": turn.role,
-            "text": turn.text,
-            "emotions": turn.emotions,
-        }
-        
-        # ← Deze regel moet BINNEN de methode staan, met juiste indentatie
-        with self.log_path.open("a", encoding="utf-8") as f:
-            json.dump(log_entry, f, ensure_ascii=False)
-            f.write("\n")
-        
-        print(f"[DEBUG] Logged successfully")
-
-
-    def get_recent(self, n: int = 10):
-        return self.turns[-n:] if len(self.turns) > n else self.turns
+        self.persist = persist
+        self.summary = RollingSummary()
+        # beurtnummers zijn absoluut; turns bevat alleen de beurten vanaf `offset`
+        self.window = max(MEMORY_WINDOW, self.summary.verbatim_turns + 2)
+        self.offset = 0
+        self.turns: List[TurnMemory] = []
+        self.states = StateHistory.for_session(session_id)
+        self._row_first_turn: List[int] = []  # state-rij -> eerste beurt met die rij
+        self.text_index = BM25Index()          # doc_id = beurtnummer
+        self.shared_index = shared_index       # doc_id = (session_id, beurtnummer)
+        self._last_user: Optional[int] = None
+        self.log_path = get_journal().path_for(session_id)
 
     def append_turn(
         self,
@@ -73,21 +105,172 @@ class ConversationMemory:
         text: str,
         emotions: Dict[str, float],
         state_vector: np.ndarray,
+        extras: Optional[Dict[str, Any]] = None,
     ) -> None:
-        self.turns.append(
-            TurnMemory(
-                role=role,
-                text=text,
-                emotions=emotions,
-                state_vector=to_list(state_vector),
+        row = self.states.append(to_list(state_vector))
+        turn = TurnMemory(role=role, text=text, emotions=emotions, history=self.states, row=row)
+        self._add(turn)
+        if self.persist is not None:
+            self.persist.insert(self.session_id, role, text, emotions, state_vector, turn._ts)
+        # disk-I/O gebeurt in de journal-thread, niet op het request-pad
+        get_journal().record(
+            self.session_id, role, text, emotions, state_vector, extras
+        )
+
+    def _add(self, turn: TurnMemory) -> None:
+        """Beurt toevoegen en alle afgeleide structuren bijwerken (ook bij restore)."""
+        row = turn.state_row
+        position = self.turn_count
+        if row == len(self._row_first_turn):
+            self._row_first_turn.append(position)
+            if GLOBAL_STATE_INDEX:
+                get_global_state_index().add(self.states.get(row), (self.session_id, row))
+        self.turns.append(turn)
+        if turn.role == "user":
+            self._last_user = position
+        self.text_index.add(position, turn.text)
+        if self.shared_index is not None:
+            self.shared_index.add((self.session_id, position), turn.text)
+        self.summary.on_append(self.turns)
+        if len(self.turns) > self.window:
+            self._trim(len(self.turns) - self.window)
+
+    def _trim(self, drop: int) -> None:
+        """Oudste beurten uit RAM halen (ze staan al in de journal en eventueel in SQLite)."""
+        for position, turn in enumerate(self.turns[:drop], self.offset):
+            self.text_index.remove(position, turn.text)
+            if self.shared_index is not None:
+                self.shared_index.remove((self.session_id, position), turn.text)
+        del self.turns[:drop]
+        self.offset += drop
+
+    @property
+    def turn_count(self) -> int:
+        """Aantal beurten in totaal, ook de beurten die niet meer in RAM staan."""
+        return self.offset + len(self.turns)
+
+    def turn_at(self, position: int) -> Optional[TurnMemory]:
+        """Beurt op absoluut nummer, als die (nog) in RAM staat."""
+        i = position - self.offset
+        return self.turns[i] if 0 <= i < len(self.turns) else None
+
+    def state_vectors(self, turns: Optional[List[TurnMemory]] = None) -> np.ndarray:
+        """(len(turns), 32) float32-matrix met de snapshots van (alle) beurten."""
+        turns = self.turns if turns is None else turns
+        return self.states.take([t.state_row for t in turns])
+
+    def similar_moments(
+        self,
+        vector,
+        k: int = RECALL_K,
+        exclude_recent: Optional[int] = None,
+    ) -> List[List[TurnMemory]]:
+        """De k eerdere momenten waarvan de state het dichtst bij `vector` ligt (L2, exact).
+
+        Een moment = de beurten die dezelfde state-rij delen (user + PDA).
+        De laatste `exclude_recent` beurten (standaard het verbatim-venster
+        van de samenvatting) doen niet mee; die staan al in de prompt.
+        """
+        if exclude_recent is None:
+            exclude_recent = self.summary.verbatim_turns
+        if len(self.turns) <= exclude_recent:
+            return []
+        cutoff = self.turns[-exclude_recent].state_row if exclude_recent else self.states.count
+        if cutoff == 0:
+            return []
+
+        # zonder duurzame store zijn momenten van vóór het RAM-venster niet meer op te halen
+        first = self.turns[0].state_row if self.persist is None else 0
+        if cutoff <= first:
+            return []
+        idx, _ = knn_exact(self.states.matrix()[first:cutoff], vector, k)
+        return [self.moment(first + row) for row in idx[0].tolist()]
+
+    def moment(self, row: int) -> List[TurnMemory]:
+        """De beurten (user + PDA) die state-rij `row` delen."""
+        first = self._row_first_turn[row]
+        if first >= self.offset:
+            i = first - self.offset
+            return [t for t in self.turns[i:i + 2] if t.state_row == row]
+        if self.persist is None:
+            return []
+        # buiten het RAM-venster: uit de duurzame store, zelfde state = zelfde moment
+        vec = self.states.get(row)
+        return [
+            t for t in self.persist.turns_at(self.session_id, first, 2)
+            if np.array_equal(t.state_vector, vec)
+        ]
+
+    def recall_context(self, vector, k: int = RECALL_K) -> str:
+        """Vergelijkbare eerdere momenten als korte prompt-regels."""
+        lines = []
+        for moment in self.similar_moments(vector, k):
+            parts = [
+                f"{'User' if t.role == 'user' else 'PDA'}: {_snippet(t.text, RECALL_SNIPPET_WORDS)}"
+                for t in moment
+            ]
+            lines.append("- " + " → ".join(parts))
+        return "\n".join(lines)
+
+    def relevant_turns(
+        self,
+        query: str,
+        k: int = LEXICAL_RECALL_K,
+        exclude_recent: Optional[int] = None,
+    ) -> List[TurnMemory]:
+        """Top-k oudere beurten op BM25-relevantie voor `query`.
+
+        Net als bij similar_moments doet het verbatim-venster niet mee.
+        """
+        if exclude_recent is None:
+            exclude_recent = self.summary.verbatim_turns
+        cutoff = self.turn_count - exclude_recent
+        if cutoff <= 0:
+            return []
+        # de top-(k + venster) bevat altijd de top-k van buiten het venster
+        hits = self.text_index.search(query, k + exclude_recent)
+        found = [self.turn_at(i) for i, _ in hits if i < cutoff][:k]
+        if len(found) < k and self.offset and self.persist is not None:
+            # beurten van vóór het RAM-venster: FTS5 in de duurzame store
+            found += self.persist.search_session(
+                self.session_id, query, k - len(found), before=self.turns[0]._ts
             )
+        return found
+
+    def relevant_context(self, query: str, k: int = LEXICAL_RECALL_K) -> str:
+        """Lexicaal relevante oudere beurten als korte prompt-regels."""
+        return "\n".join(
+            f"- {'User' if t.role == 'user' else 'PDA'}: {_snippet(t.text, RECALL_SNIPPET_WORDS)}"
+            for t in self.relevant_turns(query, k)
         )
 
+    def get_recent(self, n: int = 10):
+        return self.turns[-n:] if len(self.turns) > n else self.turns
+
+    def prompt_context(
+        self,
+        token_budget: Optional[int] = None,
+        sections: Sequence[Tuple[str, str]] = (),
+    ) -> str:
+        """Gesprekscontext voor de prompt: lopende samenvatting + laatste beurten
+        + extra secties (kop, regels), samen binnen budget."""
+        return self.summary.prompt_context(self.turns, token_budget, sections)
+
+    def close(self) -> None:
+        """Opruimen bij eviction: het state-bestand en de rijen in het globale index."""
+        self.states.discard()
+        if GLOBAL_STATE_INDEX:
+            get_global_state_index().remove(
+                (self.session_id, row) for row in range(len(self._row_first_turn))
+            )
+
     def last_user_text(self) -> Optional[str]:
-        for turn in reversed(self.turns):
-            if turn.role == "user":
-                return turn.text
-        return None
+        if self._last_user is None:
+            return None
+        turn = self.turn_at(self._last_user)
+        if turn is None and self.persist is not None:
+            return self.persist.last_user_text(self.session_id)
+        return turn.text if turn is not None else None
 
     def summary_hint(self, max_turns: int = 10) -> str:
         """Korte, goedkope samenvatting voor de planner/ethics."""
@@ -96,16 +279,37 @@ class ConversationMemory:
         return "\n".join(parts)
 
 
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
+
+def get_memory_store():
+    """Proces-brede MemoryStore volgens PDA_MEMORY_BACKEND: "memory" (standaard) of "sqlite".
+
+    De SessionRegistry maakt zijn sessies via deze store aan ("memory") of
+    schrijft door naar dezelfde MemoryDB ("sqlite"), dus queries over
+    sessies (search, similar_moments) zien de gesprekken van de API.
+    """
+    global _memory_store
+    from core.memory_db import MEMORY_BACKEND, SQLiteMemoryStore
+
+    with _memory_store_lock:
+        if _memory_store is None:
+            _memory_store = SQLiteMemoryStore() if MEMORY_BACKEND == "sqlite" else MemoryStore()
+        return _memory_store
+
+
 class MemoryStore:
-    """Eenvoudige in‑memory store; later vervangbaar door DB."""
+    """Eenvoudige in‑memory store; zie core.memory_db.SQLiteMemoryStore voor de duurzame variant."""
 
     def __init__(self):
         self._conversations: Dict[str, ConversationMemory] = {}
+        self.text_index = BM25Index()  # over alle sessies van deze store
 
     def create_session(self, session_id: Optional[str] = None) -> ConversationMemory:
         if session_id is None:
             session_id = str(uuid.uuid4())
-        conv = ConversationMemory(session_id=session_id)
+        conv = ConversationMemory(session_id=session_id, shared_index=self.text_index)
         self._conversations[session_id] = conv
         return conv
 
@@ -119,3 +323,63 @@ class MemoryStore:
 
     def all_sessions(self) -> List[ConversationMemory]:
         return list(self._conversations.values())
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        session_ids: Optional[List[str]] = None,
+    ) -> List[tuple]:
+        """BM25 over alle (of de gegeven) sessies: [(session_id, TurnMemory, score)]."""
+        allowed = set(session_ids) if session_ids is not None else None
+        accept = (lambda doc: doc[0] in allowed) if allowed is not None else None
+        results = []
+        for (sid, position), score in self.text_index.search(query, k, accept=accept):
+            conv = self._conversations.get(sid)
+            turn = conv.turn_at(position) if conv is not None else None
+            if turn is not None:
+                results.append((sid, turn, score))
+        return results
+
+    def similar_moments(
+        self,
+        vector,
+        k: int = 5,
+        session_ids: Optional[List[str]] = None,
+    ) -> List[Tuple[str, List[TurnMemory], float]]:
+        """Momenten uit alle (of de gegeven) sessies met een state dicht bij `vector`:
+        [(session_id, beurten, afstand)], via het globale StateIndex.
+
+        Vereist PDA_GLOBAL_STATE_INDEX=1 (anders wordt het index niet bijgehouden).
+        """
+        if not GLOBAL_STATE_INDEX:
+            raise RuntimeError("similar_moments over sessies vraagt PDA_GLOBAL_STATE_INDEX=1")
+        index = get_global_state_index()
+        allowed = set(session_ids) if session_ids is not None else None
+        fetch = k
+        while True:
+            keys, dist = index.query_many(vector, fetch)
+            hits = [
+                (key, d) for key, d in zip(keys[0], dist[0].tolist())
+                if allowed is None or key[0] in allowed
+            ]
+            if len(hits) >= k or fetch >= len(index):
+                break
+            fetch *= 4  # sessiefilter: verder zoeken
+        results = []
+        for (sid, row), d in hits[:k]:
+            conv = self._conversations.get(sid)
+            moment = conv.moment(row) if conv is not None else []
+            if moment:
+                results.append((sid, moment, d))
+        return results
+
+    def remove_session(self, session_id: str, memory: Optional[ConversationMemory] = None) -> None:
+        """Sessie uit de store halen; met `memory` alleen als die er (nog) onder staat."""
+        conv = self._conversations.get(session_id)
+        if conv is None or (memory is not None and conv is not memory):
+            return
+        del self._conversations[session_id]
+        for position, turn in enumerate(conv.turns, conv.offset):
+            self.text_index.remove((session_id, position), turn.text)
+        conv.close()  # ook de rijen in het globale StateIndex
@@ -0,0 +1,432 @@
+# core/memory_db.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from core.journal import get_journal
+from core.memory import TurnMemory
+from core.state_history import STATE_DIMS, StateHistory
+from core.utils import to_list
+
+# PDA_MEMORY_BACKEND=sqlite: gesprekken duurzaam in één SQLite-bestand (WAL).
+MEMORY_BACKEND = os.getenv("PDA_MEMORY_BACKEND", "memory")
+MEMORY_DB_PATH = Path(os.getenv("PDA_MEMORY_DB", "data/memory.sqlite"))
+MEMORY_DB_MAX_BATCH = int(os.getenv("PDA_MEMORY_DB_MAX_BATCH", "256"))
+MEMORY_DB_FLUSH_INTERVAL = float(os.getenv("PDA_MEMORY_DB_FLUSH_INTERVAL", "0.2"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    emotions TEXT NOT NULL,
+    state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_turns_session_ts ON turns (session_id, ts);
+CREATE INDEX IF NOT EXISTS idx_turns_role ON turns (role);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5 (text, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts (turns_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Vaste SQL-teksten: sqlite3 houdt de geprepareerde statements in zijn cache
+INSERT_SESSION = "INSERT OR IGNORE INTO sessions (session_id, created_at) VALUES (?, ?)"
+INSERT_TURN = "INSERT INTO turns (session_id, ts, role, text, emotions, state) VALUES (?, ?, ?, ?, ?, ?)"
+SELECT_RECENT = (
+    "SELECT role, text, emotions, state, ts FROM turns"
+    " WHERE session_id = ? ORDER BY ts DESC, id DESC LIMIT ?"
+)
+SELECT_ALL = "SELECT role, text, emotions, state, ts FROM turns WHERE session_id = ? ORDER BY ts, id"
+SELECT_RANGE = (
+    "SELECT role, text, emotions, state, ts FROM turns"
+    " WHERE session_id = ? ORDER BY ts, id LIMIT ? OFFSET ?"
+)
+SELECT_LAST_USER = (
+    "SELECT text FROM turns WHERE session_id = ? AND role = 'user' ORDER BY ts DESC, id DESC LIMIT 1"
+)
+SELECT_COUNT = "SELECT COUNT(*) FROM turns WHERE session_id = ?"
+SELECT_SESSION = "SELECT 1 FROM sessions WHERE session_id = ?"
+SELECT_SESSIONS = "SELECT session_id FROM sessions ORDER BY created_at"
+SEARCH = (
+    "SELECT t.session_id, t.role, t.text, t.emotions, t.state, t.ts, bm25(turns_fts) AS score"
+    " FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid"
+    " WHERE turns_fts MATCH ? ORDER BY score LIMIT ?"
+)
+SEARCH_SESSION = (
+    "SELECT t.role, t.text, t.emotions, t.state, t.ts FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid"
+    " WHERE turns_fts MATCH ? AND t.session_id = ? AND t.ts < ? ORDER BY bm25(turns_fts) LIMIT ?"
+)
+
+
+def _match_expr(query: str) -> str:
+    """FTS5-query: de woorden van `query` als losse termen, OR."""
+    return " OR ".join(f'"{t}"' for t in query.replace('"', " ").split())
+
+
+def _state_blob(state_vector: Any) -> bytes:
+    vec = np.asarray(to_list(state_vector), dtype=np.float32).reshape(-1)
+    if vec.size != STATE_DIMS:
+        vec = np.resize(vec, STATE_DIMS) if vec.size else np.zeros(STATE_DIMS, dtype=np.float32)
+    return vec.tobytes()
+
+
+def _to_turns(rows: List[tuple]) -> List[TurnMemory]:
+    """DB-rijen (role, text, emotions, state, ts) als TurnMemory's met één gedeelde StateHistory."""
+    history = StateHistory(capacity=max(1, len(rows)))
+    if rows:
+        history.extend(np.frombuffer(b"".join(r[3] for r in rows), dtype=np.float32))
+    return [
+        TurnMemory(role=role, text=text, emotions=json.loads(emotions), history=history, row=i, timestamp=ts)
+        for i, (role, text, emotions, _, ts) in enumerate(rows)
+    ]
+
+
+class MemoryDB:
+    """SQLite (WAL) opslag van beurten met group-commit.
+
+    Inserts gaan via een queue naar één writer-thread die ze per batch in
+    één transactie wegschrijft (executemany). Leesqueries lopen over een
+    eigen connectie; ze flushen eerst openstaande inserts, zodat een
+    sessie altijd haar eigen laatste beurten terugziet.
+    """
+
+    def __init__(
+        self,
+        path: Path = MEMORY_DB_PATH,
+        max_batch: int = MEMORY_DB_MAX_BATCH,
+        flush_interval: float = MEMORY_DB_FLUSH_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        self._write_db = self._connect()
+        self._write_db.executescript(SCHEMA)
+        self._read_db = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._closed = False
+        self.rows_written = 0
+        self.batches_written = 0
+        self._thread = threading.Thread(target=self._run, name="memory-db", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ---- schrijven -----------------------------------------------------------
+
+    def ensure_session(self, session_id: str) -> None:
+        self._put(("session", (session_id, time.time())))
+
+    def insert(
+        self,
+        session_id: str,
+        role: str,
+        text: str,
+        emotions: Optional[Dict[str, float]],
+        state_vector: Any,
+        timestamp: Optional[float] = None,
+    ) -> None:
+        row = (
+            session_id,
+            time.time() if timestamp is None else timestamp,
+            role,
+            text,
+            json.dumps(dict(emotions or {}), ensure_ascii=False),
+            _state_blob(state_vector),
+        )
+        self._put(("turn", row))
+
+    def delete_session(self, session_id: str) -> None:
+        self._put(("delete", (session_id,)))
+        self.flush()
+
+    def _put(self, item: tuple) -> None:
+        if self._closed:
+            raise RuntimeError("MemoryDB is gesloten")
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put(item)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blokkeer tot alle eerder aangeboden writes gecommit zijn."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _sync(self) -> None:
+        with self._pending_lock:
+            pending = self._pending
+        if pending:
+            self.flush()
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[tuple] = []
+            waiters: List[threading.Event] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"[MEMORY DB] write failed ({len(batch)} items): {e!r}")
+                with self._pending_lock:
+                    self._pending -= len(batch)
+            for w in waiters:
+                w.set()
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        db = self._write_db
+        db.execute("BEGIN")
+        try:
+            # volgorde bewaren: opeenvolgende items van hetzelfde soort samen uitvoeren
+            start = 0
+            while start < len(batch):
+                kind = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == kind:
+                    end += 1
+                params = [item[1] for item in batch[start:end]]
+                if kind == "turn":
+                    db.executemany(INSERT_SESSION, {(p[0], p[1]) for p in params})
+                    db.executemany(INSERT_TURN, params)
+                    self.rows_written += len(params)
+                elif kind == "session":
+                    db.executemany(INSERT_SESSION, params)
+                elif kind == "delete":
+                    db.executemany("DELETE FROM turns WHERE session_id = ?", params)
+                    db.executemany("DELETE FROM sessions WHERE session_id = ?", params)
+                start = end
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.batches_written += 1
+
+    # ---- lezen ---------------------------------------------------------------
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        self._sync()
+        with self._read_lock:
+            return self._read_db.execute(sql, params).fetchall()
+
+    def has_session(self, session_id: str) -> bool:
+        return bool(self._query(SELECT_SESSION, (session_id,)))
+
+    def session_ids(self) -> List[str]:
+        return [r[0] for r in self._query(SELECT_SESSIONS, ())]
+
+    def recent(self, session_id: str, n: int) -> List[TurnMemory]:
+        rows = self._query(SELECT_RECENT, (session_id, n))
+        rows.reverse()
+        return _to_turns(rows)
+
+    def all_turns(self, session_id: str) -> List[TurnMemory]:
+        return _to_turns(self._query(SELECT_ALL, (session_id,)))
+
+    def turns_at(self, session_id: str, position: int, n: int) -> List[TurnMemory]:
+        """n beurten vanaf (absoluut) beurtnummer `position`."""
+        return _to_turns(self._query(SELECT_RANGE, (session_id, n, position)))
+
+    def last_user_text(self, session_id: str) -> Optional[str]:
+        rows = self._query(SELECT_LAST_USER, (session_id,))
+        return rows[0][0] if rows else None
+
+    def count(self, session_id: str) -> int:
+        return self._query(SELECT_COUNT, (session_id,))[0][0]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, TurnMemory, float]]:
+        """FTS5/BM25 over alle sessies: [(session_id, TurnMemory, score)], beste eerst."""
+        terms = _match_expr(query)
+        if not terms:
+            return []
+        rows = self._query(SEARCH, (terms, k))
+        turns = _to_turns([r[1:6] for r in rows])
+        # bm25() is negatief: hoe lager hoe beter
+        return [(r[0], turn, -r[6]) for r, turn in zip(rows, turns)]
+
+    def search_session(self, session_id: str, query: str, k: int, before: float) -> List[TurnMemory]:
+        """FTS5/BM25 binnen één sessie, alleen beurten van vóór `before` (timestamp)."""
+        terms = _match_expr(query)
+        if not terms or k <= 0:
+            return []
+        return _to_turns(self._query(SEARCH_SESSION, (terms, session_id, before, k)))
+
+
+def restore_session(session: Any, db: MemoryDB) -> bool:
+    """Vul een verse (RAM-)sessie uit de MemoryDB; de PDA-state wordt die van de laatste beurt.
+
+    Alleen het RAM-venster van de memory (de laatste `window` beurten) wordt geladen.
+    """
+    memory = session.memory
+    total = db.count(session.session_id)
+    if not total:
+        return False
+    turns = db.recent(session.session_id, memory.window or total)
+    memory.offset = total - len(turns)
+    memory.states.extend(np.array([t.state_vector for t in turns], dtype=np.float32))
+    for row, turn in enumerate(turns):
+        # opnieuw dedupliceren zoals append_turn dat doet zou rijen verschuiven; 1 rij per beurt
+        memory._add(TurnMemory(
+            role=turn.role, text=turn.text, emotions=turn.emotions,
+            history=memory.states, row=row, timestamp=turn._ts,
+        ))
+    session.pda.state.vector = memory.states.get(len(turns) - 1)
+    return True
+
+
+class SQLiteConversationMemory:
+    """ConversationMemory-achtige handle op één sessie in de MemoryDB.
+
+    Houdt zelf geen beurten vast; alles wordt per query uit SQLite gelezen.
+    """
+
+    def __init__(self, session_id: str, db: MemoryDB):
+        self.session_id = session_id
+        self.db = db
+        self.log_path = get_journal().path_for(session_id)
+
+    def append_turn(
+        self,
+        role: str,
+        text: str,
+        emotions: Dict[str, float],
+        state_vector: np.ndarray,
+        extras: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.db.insert(self.session_id, role, text, emotions, state_vector)
+        get_journal().record(self.session_id, role, text, emotions, state_vector, extras)
+
+    @property
+    def turns(self) -> List[TurnMemory]:
+        return self.db.all_turns(self.session_id)
+
+    def __len__(self) -> int:
+        return self.db.count(self.session_id)
+
+    def state_vectors(self, turns: Optional[List[TurnMemory]] = None) -> np.ndarray:
+        turns = self.turns if turns is None else turns
+        return np.array([t.state_vector for t in turns], dtype=np.float32).reshape(-1, STATE_DIMS)
+
+    def get_recent(self, n: int = 10) -> List[TurnMemory]:
+        return self.db.recent(self.session_id, n)
+
+    def last_user_text(self) -> Optional[str]:
+        return self.db.last_user_text(self.session_id)
+
+    def summary_hint(self, max_turns: int = 10) -> str:
+        return "\n".join(f"{t.role}: {t.text}" for t in self.get_recent(max_turns))
+
+
+class SQLiteMemoryStore:
+    """MemoryStore met dezelfde API, maar duurzaam en zonder sessies in RAM."""
+
+    def __init__(self, db: Optional[MemoryDB] = None):
+        self.db = db or get_memory_db()
+
+    def create_session(self, session_id: Optional[str] = None) -> SQLiteConversationMemory:
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        self.db.ensure_session(session_id)
+        return SQLiteConversationMemory(session_id, self.db)
+
+    def get_or_create(self, session_id: Optional[str]) -> SQLiteConversationMemory:
+        return self.create_session(session_id)
+
+    def get(self, session_id: str) -> Optional[SQLiteConversationMemory]:
+        if not self.db.has_session(session_id):
+            return None
+        return SQLiteConversationMemory(session_id, self.db)
+
+    def all_sessions(self) -> List[SQLiteConversationMemory]:
+        return [SQLiteConversationMemory(sid, self.db) for sid in self.db.session_ids()]
+
+    def search(self, query: str, k: int = 5, session_ids: Optional[List[str]] = None) -> List[tuple]:
+        hits = self.db.search(query, k if session_ids is None else k * 4)
+        if session_ids is not None:
+            allowed = set(session_ids)
+            hits = [h for h in hits if h[0] in allowed]
+        return hits[:k]
+
+    def remove_session(self, session_id: str) -> None:
+        self.db.delete_session(session_id)
+
+
+_db: Optional[MemoryDB] = None
+_db_lock = threading.Lock()
+
+
+def get_memory_db() -> MemoryDB:
+    """Proces-brede MemoryDB; start de writer-thread bij eerste gebruik."""
+    global _db
+    with _db_lock:
+        if _db is None or _db._closed:
+            _db = MemoryDB()
+            atexit.register(_db.close)
+        return _db
+
+
+def persistent_memory_db() -> Optional[MemoryDB]:
+    """De MemoryDB als PDA_MEMORY_BACKEND=sqlite, anders None."""
+    return get_memory_db() if MEMORY_BACKEND == "sqlite" else None
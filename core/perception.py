@@ -1,10 +1,12 @@
 # perception.py
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Sequence
 from enum import Enum
 
-from core.emotions import text_to_emotions  # waar jouw lexicon staat
+import numpy as np
+
+from core.emotions import text_to_emotions, get_emotion_matcher, EmotionMatcher  # waar jouw lexicon staat
 from pda32d_base import PDA32D        # of waar je PDA32D nu leeft
 
 
@@ -17,6 +19,29 @@ class Intent(str, Enum):
     GREETING = "greeting"
     ASK_PDA_SELF = "ask_pda_self"
 
+# Vaste volgorde voor de gevectoriseerde intent-codes in PerceptionBatch.intents
+INTENT_ORDER: List[Intent] = list(Intent)
+INTENT_CODES: Dict[Intent, int] = {intent: i for i, intent in enumerate(INTENT_ORDER)}
+
+# Trefwoorden voor intent/flags; gedeeld door perceive() en perceive_many()
+ASK_PDA_SELF_PHRASES = ["vertel me over jezelf", "tell me about yourself"]
+HELP_REQUEST_WORDS = ["help", "hoe", "kan ik", "uitleg", "leg eens uit"]
+META_SYSTEM_WORDS = ["pda", "32d", "ethics", "entropy", "framework"]
+EMOTIONAL_SUPPORT_EMOTIONS = ["despair", "isolation", "anxiety", "fear", "shame"]
+SMALL_TALK_WORDS = ["hoe gaat het", "alles goed", "lol", "haha"]
+SELF_HARM_PHRASES = ["ik wil niet meer"]
+
+FLAG_NAMES: List[str] = ["risk:self_harm_signal", "risk:high_anger"]
+
+_PHRASE_MATCHER = EmotionMatcher({
+    "ask_pda_self": (0.0, ASK_PDA_SELF_PHRASES),
+    "help_request": (0.0, HELP_REQUEST_WORDS),
+    "meta_system":  (0.0, META_SYSTEM_WORDS),
+    "small_talk":   (0.0, SMALL_TALK_WORDS),
+    "self_harm":    (0.0, SELF_HARM_PHRASES),
+})
+
+
 @dataclass
 class PerceptionResult:
     raw_text: str
@@ -26,6 +51,42 @@ class PerceptionResult:
     flags: List[str]
 
 
+@dataclass
+class PerceptionBatch:
+    """Resultaat van perceive_many(): één rij per tekst.
+
+    - emotions: (N, n_emotions) float32, kolommen in EMOTION_LEXICON-volgorde
+    - present:  (N, n_emotions) bool, welke emoties echt gedetecteerd zijn
+    - intents:  (N,) int8, index in INTENT_ORDER
+    - flags:    (N, len(FLAG_NAMES)) bool
+    """
+    raw_texts: List[str]
+    cleaned_texts: List[str]
+    emotion_names: List[str]
+    emotion_values: List[float]  # originele lexiconwaarden, voor exacte result()
+    emotions: np.ndarray
+    present: np.ndarray
+    intents: np.ndarray
+    flags: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.raw_texts)
+
+    def intent_at(self, i: int) -> Intent:
+        return INTENT_ORDER[int(self.intents[i])]
+
+    def result(self, i: int) -> PerceptionResult:
+        """Zelfde PerceptionResult als perceive() voor tekst i."""
+        cols = np.flatnonzero(self.present[i])
+        return PerceptionResult(
+            raw_text=self.raw_texts[i],
+            cleaned_text=self.cleaned_texts[i],
+            emotions={self.emotion_names[c]: self.emotion_values[c] for c in cols},
+            intent=self.intent_at(i),
+            flags=[FLAG_NAMES[f] for f in np.flatnonzero(self.flags[i])],
+        )
+
+
 class PerceptionEngine:
     def __init__(self):
         pass
@@ -33,19 +94,19 @@ class PerceptionEngine:
     def _classify_intent(self, text: str, emotions: Dict[str, float]) -> Intent:
         lt = text.lower()
 
-        if any(phrase in lt for phrase in ["vertel me over jezelf", "tell me about yourself"]):
+        if any(phrase in lt for phrase in ASK_PDA_SELF_PHRASES):
             return Intent.ASK_PDA_SELF
 
-        if any(w in lt for w in ["help", "hoe", "kan ik", "uitleg", "leg eens uit"]):
+        if any(w in lt for w in HELP_REQUEST_WORDS):
             return Intent.HELP_REQUEST
 
-        if any(w in lt for w in ["pda", "32d", "ethics", "entropy", "framework"]):
+        if any(w in lt for w in META_SYSTEM_WORDS):
             return Intent.META_SYSTEM
 
-        if any(k in emotions for k in ["despair", "isolation", "anxiety", "fear", "shame"]):
+        if any(k in emotions for k in EMOTIONAL_SUPPORT_EMOTIONS):
             return Intent.EMOTIONAL_SUPPORT
 
-        if any(w in lt for w in ["hoe gaat het", "alles goed", "lol", "haha"]):
+        if any(w in lt for w in SMALL_TALK_WORDS):
             return Intent.SMALL_TALK
 
         return Intent.UNKNOWN
@@ -53,7 +114,7 @@ class PerceptionEngine:
 
     def _detect_flags(self, text: str, emotions: Dict[str, float]) -> List[str]:
         flags: List[str] = []
-        if emotions.get("despair", 0) <= -0.7 or "ik wil niet meer" in text.lower():
+        if emotions.get("despair", 0) <= -0.7 or any(p in text.lower() for p in SELF_HARM_PHRASES):
             flags.append("risk:self_harm_signal")
         if emotions.get("anger", 0) >= 0.7:
             flags.append("risk:high_anger")
@@ -72,14 +133,65 @@ class PerceptionEngine:
             flags=flags,
         )
 
+    def perceive_many(self, texts: Sequence[str]) -> PerceptionBatch:
+        """Batch-variant van perceive() voor het herspelen/scoren van archieven.
+
+        Per tekst blijft er één automaat-pass over voor emoties en één voor
+        intent-trefwoorden; al het beslissen (intent-prioriteit, flags)
+        gebeurt daarna kolomsgewijs in NumPy.
+        """
+        matcher = get_emotion_matcher()
+        names = matcher.names
+        n, m = len(texts), len(names)
+
+        raw = list(texts)
+        cleaned = [t.strip() for t in raw]
+
+        present = np.zeros((n, m), dtype=bool)
+        phrase_hits = np.zeros((n, len(_PHRASE_MATCHER.names)), dtype=bool)
+        for i, text in enumerate(cleaned):
+            lt = text.lower()
+            present[i, list(matcher.hits(lt))] = True
+            phrase_hits[i, list(_PHRASE_MATCHER.hits(lt))] = True
+
+        # float64 voor de drempelvergelijkingen (identiek aan perceive()),
+        # float32 voor de teruggegeven matrix
+        values = np.where(present, np.asarray(matcher.values, dtype=np.float64), 0.0)
+
+        ph = {name: phrase_hits[:, j] for j, name in enumerate(_PHRASE_MATCHER.names)}
+        support_cols = [matcher.index[k] for k in EMOTIONAL_SUPPORT_EMOTIONS if k in matcher.index]
+        emotional_support = present[:, support_cols].any(axis=1)
+
+        intents = np.select(
+            [ph["ask_pda_self"], ph["help_request"], ph["meta_system"], emotional_support, ph["small_talk"]],
+            [INTENT_CODES[Intent.ASK_PDA_SELF], INTENT_CODES[Intent.HELP_REQUEST],
+             INTENT_CODES[Intent.META_SYSTEM], INTENT_CODES[Intent.EMOTIONAL_SUPPORT],
+             INTENT_CODES[Intent.SMALL_TALK]],
+            default=INTENT_CODES[Intent.UNKNOWN],
+        ).astype(np.int8)
+
+        def column(name: str) -> np.ndarray:
+            j = matcher.index.get(name)
+            return values[:, j] if j is not None else np.zeros(n)
+
+        flags = np.zeros((n, len(FLAG_NAMES)), dtype=bool)
+        flags[:, 0] = (column("despair") <= -0.7) | ph["self_harm"]
+        flags[:, 1] = column("anger") >= 0.7
+
+        return PerceptionBatch(
+            raw_texts=raw,
+            cleaned_texts=cleaned,
+            emotion_names=list(names),
+            emotion_values=list(matcher.values),
+            emotions=values.astype(np.float32),
+            present=present,
+            intents=intents,
+            flags=flags,
+        )
+
 
 def run_perception_step(pda, engine, text, memory):
-    # Haal state en memory op voor deze perception call
-    from core.memory import get_session_memory
-    
-    state = pda  # of pda.state, afhankelijk van je structuur
-    memory = get_session_memory("cli")  # of session_id doorgeven
-    
+    # state en memory komen van de sessie van de caller
     result = engine.perceive(text, pda, memory)
     return result
 
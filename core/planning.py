@@ -50,7 +50,8 @@ class Planner:
         coherence = state.coherence()
         emo = perception.emotions or {}
         distress_keys = {"despair", "fear", "emptiness", "isolation", "shame"}
-        distress_level = max((emo.get(k, 0.0) for k in distress_keys), default=0.0)
+        # alleen aanwezige emoties tellen; ontbrekende zijn geen 0.0 (emoties zijn hier negatief)
+        distress_level = min((emo[k] for k in distress_keys if k in emo), default=0.0)
 
         if distress_level < -0.5:  # sterke negatieve waarde
             actions.append(
@@ -0,0 +1,321 @@
+# core/sessions.py
+from __future__ import annotations
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+
+from core import snapshots
+from core.memory import ConversationMemory, get_memory_store
+from core.memory_db import persistent_memory_db, restore_session
+from pda32d_base import PDA32D
+
+# Maximaal aantal sessies dat tegelijk in het geheugen blijft, en na hoeveel
+# seconden inactiviteit een sessie mag worden opgeruimd (0 = geen TTL).
+MAX_SESSIONS = int(os.getenv("PDA_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("PDA_SESSION_TTL", "3600"))
+# vangnet voor async wachtenden: zo vaak opnieuw proberen, ook zonder wake-up
+LOCK_POLL_SECONDS = 0.1
+
+
+@dataclass
+class Session:
+    session_id: str
+    pda: PDA32D
+    memory: ConversationMemory
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    created_at: float = field(default_factory=time.monotonic)
+    last_access: float = field(default_factory=time.monotonic)
+    shared_seq: Optional[int] = None  # seqlock-stand bij de laatste sync met core.shared_state
+
+    # async wachtenden op het lock: (loop, future), gewekt door release()
+    _waiters: Deque[tuple] = field(default_factory=deque, repr=False)
+
+    def release(self) -> None:
+        """Lock vrijgeven en de eerstvolgende async wachtende wekken."""
+        self.lock.release()
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        while self._waiters:
+            try:
+                loop, fut = self._waiters.popleft()
+            except IndexError:
+                return
+            if fut.done():
+                continue
+            try:
+                loop.call_soon_threadsafe(self._wake, fut)
+            except RuntimeError:
+                continue  # loop is al gesloten
+            return
+
+    def _wake(self, fut: "asyncio.Future[None]") -> None:
+        if fut.done():
+            self._wake_next()  # intussen afgehaakt: de volgende
+        else:
+            fut.set_result(None)
+
+    async def acquire_async(self) -> None:
+        """Wacht op de event loop (zonder executor-thread) tot het lock vrij is."""
+        loop = asyncio.get_running_loop()
+        while not self.lock.acquire(blocking=False):
+            fut = loop.create_future()
+            self._waiters.append((loop, fut))
+            # vrijgekomen tussen de poging en het aanmelden: meteen opnieuw
+            if self.lock.acquire(blocking=False):
+                fut.cancel()
+                return
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), LOCK_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                fut.cancel()
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._wake_next()  # wel gewekt, maar afgehaakt: doorgeven
+                fut.cancel()
+                raise
+
+    @contextmanager
+    def hold(self):
+        """Serialiseer beurten binnen deze sessie (sync callers)."""
+        self.lock.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def hold_async(self):
+        """Zelfde lock als hold(); wachten gebeurt op de event loop, niet in een thread."""
+        await self.acquire_async()
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+EvictionHook = Callable[[Session, str], None]
+SessionLoader = Callable[[Session], bool]
+
+
+class SessionRegistry:
+    """Begrensde LRU/TTL-registry van PDA32D + ConversationMemory per sessie.
+
+    Eviction slaat sessies over waarvan het lock bezet is (er loopt een
+    beurt). Hooks krijgen de sessie en de reden ("lru", "ttl", "manual")
+    mee, bijvoorbeeld om state weg te schrijven vóór ze verdwijnt.
+    Loaders (zie core.snapshots, core.memory_db) vullen een nieuwe sessie
+    bij de eerste toegang, in volgorde van toevoegen; dat gebeurt buiten het registry-lock maar met het sessie-lock
+    vast, zodat beurten op die sessie wachten tot hij geladen is. Wordt
+    dezelfde id nog ge-evict (hooks schrijven nog weg of ruimen op), dan
+    wacht de nieuwe sessie daar eerst op, anders laadt hij een verouderde
+    snapshot of ruimt een hook zijn (gelijknamige) bestanden op.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hooks: List[EvictionHook] = []
+        self._loaders: List[SessionLoader] = []
+        self._evicting: Dict[str, threading.Event] = {}  # hooks lopen nog
+        self.evictions: Dict[str, int] = {"lru": 0, "ttl": 0, "manual": 0}
+
+    def add_eviction_hook(self, hook: EvictionHook) -> None:
+        self._hooks.append(hook)
+
+    def add_loader(self, loader: SessionLoader) -> None:
+        self._loaders.append(loader)
+
+    def _create(self, session_id: str) -> Session:
+        now = self._clock()
+        db = persistent_memory_db()
+        if db is not None:
+            memory = ConversationMemory(session_id, persist=db)  # SQLiteMemoryStore leest dezelfde DB
+        else:
+            memory = get_memory_store().create_session(session_id)
+        return Session(
+            session_id=session_id,
+            pda=PDA32D(),
+            memory=memory,
+            created_at=now,
+            last_access=now,
+        )
+
+    def get(self, session_id: str) -> Session:
+        """Haal of creëer de sessie en markeer hem als recent gebruikt."""
+        loaders: List[SessionLoader] = []
+        pending = None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._create(session_id)
+                self._sessions[session_id] = session
+                loaders = list(self._loaders)
+                pending = self._evicting.get(session_id)
+                if loaders or pending is not None:
+                    session.lock.acquire()
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = self._clock()
+            evicted = self._collect_evictions(keep=session_id)
+        # eerst de eigen hooks: wie op een pending eviction wacht, mag er
+        # zelf geen meer open hebben (anders wachten twee threads op elkaar)
+        try:
+            self._run_hooks(evicted)
+        finally:
+            if loaders or pending is not None:
+                try:
+                    if pending is not None:
+                        pending.wait()
+                    for loader in loaders:
+                        try:
+                            loader(session)
+                        except Exception as e:
+                            print(f"[SESSIONS] loader failed for {session_id}: {e!r}")
+                finally:
+                    session.release()
+        return session
+
+    @contextmanager
+    def hold(self, session_id: str):
+        """get() plus het sessie-lock; de sessie zit dan gegarandeerd (nog) in de registry.
+
+        Tussen get() en het lock kan de sessie ge-evict zijn; een beurt op
+        zo'n wees gaat verloren, dus dan opnieuw met een verse get().
+        """
+        while True:
+            session = self.get(session_id)
+            with session.hold():
+                if self.peek(session_id) is session:
+                    yield session
+                    return
+
+    @asynccontextmanager
+    async def hold_async(self, session_id: str):
+        """Async variant van hold(); get() draait in een thread (loader en
+        eviction-hooks doen disk-I/O)."""
+        while True:
+            session = await asyncio.to_thread(self.get, session_id)
+            async with session.hold_async():
+                if self.peek(session_id) is session:
+                    yield session
+                    return
+
+    def peek(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def evict(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                done = self._evicting[session_id] = threading.Event()
+        if session is not None:
+            self._run_hooks([(session, "manual", done)])
+        return session
+
+    def sweep(self) -> int:
+        """Ruim verlopen/overtollige sessies op; geeft het aantal evictions terug."""
+        with self._lock:
+            evicted = self._collect_evictions(keep=None)
+        self._run_hooks(evicted)
+        return len(evicted)
+
+    def _collect_evictions(self, keep: Optional[str]) -> List[tuple]:
+        # aanroepen met self._lock vast
+        evicted = []
+        now = self._clock()
+        for sid, session in list(self._sessions.items()):
+            over_cap = len(self._sessions) > self.max_sessions
+            expired = self.ttl_seconds > 0 and now - session.last_access > self.ttl_seconds
+            if not (over_cap or expired):
+                break  # LRU-volgorde: de rest is recenter
+            if sid == keep or session.lock.locked():
+                continue
+            del self._sessions[sid]
+            done = self._evicting[sid] = threading.Event()
+            evicted.append((session, "lru" if over_cap else "ttl", done))
+        return evicted
+
+    def _run_hooks(self, evicted: List[tuple]) -> None:
+        for session, reason, done in evicted:
+            self.evictions[reason] += 1
+            for hook in self._hooks:
+                try:
+                    hook(session, reason)
+                except Exception as e:
+                    print(f"[SESSIONS] eviction hook failed for {session.session_id}: {e!r}")
+            with self._lock:
+                if self._evicting.get(session.session_id) is done:
+                    del self._evicting[session.session_id]
+            done.set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def state_rows(self, session_ids: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray]:
+        """(session_ids, StateTable-rijen) voor bulk-operaties over sessies.
+
+        Voorbeeld: `ids, rows = registry.state_rows(); get_state_table().coherence(rows)`.
+        """
+        with self._lock:
+            if session_ids is None:
+                sessions = list(self._sessions.values())
+            else:
+                sessions = [self._sessions[sid] for sid in session_ids if sid in self._sessions]
+        return [s.session_id for s in sessions], np.array([s.pda.state.row for s in sessions], dtype=np.intp)
+
+
+registry = SessionRegistry()
+
+if persistent_memory_db() is not None:
+    # de SQLite-store is dan de bron van waarheid voor het gesprek; de
+    # snapshot vult daarna alleen nog de PDA-state aan
+    registry.add_loader(lambda session: restore_session(session, persistent_memory_db()))
+if snapshots.SNAPSHOTS_ENABLED:
+    snapshots.attach(registry, memory=persistent_memory_db() is None)
+# na de snapshot-hook, die de state-historie nog leest
+if persistent_memory_db() is None:
+    # resident sessies staan in de MemoryStore (search / similar_moments over sessies)
+    registry.add_eviction_hook(
+        lambda session, reason: get_memory_store().remove_session(session.session_id, session.memory)
+    )
+registry.add_eviction_hook(lambda session, reason: session.memory.close())
+
+
+def get_session(session_id: str) -> Session:
+    return registry.get(session_id)
+
+
+def hold_session(session_id: str):
+    """Sessie ophalen en het lock nemen; zie SessionRegistry.hold."""
+    return registry.hold(session_id)
+
+
+def hold_session_async(session_id: str):
+    return registry.hold_async(session_id)
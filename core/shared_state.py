@@ -0,0 +1,308 @@
+# core/shared_state.py
+from __future__ import annotations
+from contextlib import ExitStack, contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: geen fcntl, dus geen gedeelde state
+    fcntl = None
+
+# Gedeelde state-tabel voor meerdere uvicorn-workers op één host. Staat uit
+# tenzij PDA_SHARED_STATE=1; alle workers moeten dezelfde naam en grootte gebruiken.
+SHARED_STATE_ENABLED = os.getenv("PDA_SHARED_STATE", "0").lower() in {"1", "true", "on"}
+SHARED_STATE_NAME = os.getenv("PDA_SHARED_STATE_NAME", "pda_state")
+SHARED_STATE_SLOTS = int(os.getenv("PDA_SHARED_STATE_SLOTS", "4096"))
+
+MAGIC = 0x50444133  # "PDA3"
+VERSION = 2
+HEADER_BYTES = 64
+KEY_BYTES = 16
+EMPTY = bytes(KEY_BYTES)
+TOMBSTONE = b"\xff" * KEY_BYTES
+NEVER_WRITTEN = -1  # activation van een net geclaimd slot
+LOCK_STRIPES = 64
+# lock-vrij lezen: zoveel pogingen, waarvan de eerste SPIN_READS zonder te wachten
+READ_RETRIES = 1000
+SPIN_READS = 16
+READ_BACKOFF_MAX = 0.001
+
+
+def session_key(session_id: str) -> bytes:
+    return hashlib.blake2b(session_id.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class SharedStateTable:
+    """Vaste (slots, 32) float32-regio in shared memory, gedeeld tussen processen.
+
+    Layout: header | seq uint64[slots] | activation int64[slots] |
+    refs int64[slots] | keys uint8[slots, 16] | vectors float32[slots, dims].
+
+    - Slots worden gevonden via open addressing op een 16-byte hash van
+      het session id; claimen/vrijgeven gebeurt onder een globaal
+      fcntl-lock, opzoeken niet. `refs` telt de workers die de sessie in
+      hun registry hebben; pas bij 0 wordt het slot vrijgegeven. Een
+      tombstone vóór een leeg slot wordt meteen weer leeg, zodat
+      zoekketens niet blijven groeien.
+    - Schrijvers nemen een byte-range lock per slot (dus ook tussen
+      processen exclusief) en zetten de seqlock-teller oneven tijdens het
+      schrijven. Lezers nemen geen lock: ze lezen opnieuw (begrensd, met
+      backoff) zolang de teller oneven is of tijdens het kopiëren
+      veranderde. Een worker die stierf midden in een write laat een
+      oneven teller achter; sync() herstelt die onder het slot-lock.
+
+    fcntl-locks zijn per proces; threads binnen één proces sluiten elkaar
+    daarom ook nog uit via gewone locks (globaal + gestreept per slot).
+    """
+
+    def __init__(
+        self,
+        name: str = SHARED_STATE_NAME,
+        slots: int = SHARED_STATE_SLOTS,
+        dims: int = 32,
+        lock_dir: Optional[Path] = None,
+    ):
+        if fcntl is None:
+            raise RuntimeError("PDA_SHARED_STATE vraagt fcntl-locks (Linux/macOS); zet hem uit op dit platform")
+        self.name = name
+        self.dims = dims
+        lock_dir = Path(lock_dir) if lock_dir is not None else Path(tempfile.gettempdir())
+        self._lock_fd = os.open(lock_dir / f"{name}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.retries = 0
+        self.repairs = 0
+
+        size = HEADER_BYTES + slots * (8 + 8 + 8 + KEY_BYTES + dims * 4)
+        with self._global_lock():
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                created = False
+            # de block moet workers en herstarts overleven: niet laten opruimen
+            # door de resource tracker van dit proces
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+            header = np.ndarray((4,), dtype=np.int64, buffer=self._shm.buf)
+            if created:
+                header[:] = (MAGIC, VERSION, slots, dims)
+            elif header[0] != MAGIC or header[1] != VERSION or header[3] != dims:
+                raise RuntimeError(f"Shared state {name!r} heeft een onbekende layout")
+            self.slots = int(header[2])
+        self._map()
+
+    def _map(self) -> None:
+        buf, n, offset = self._shm.buf, self.slots, HEADER_BYTES
+        self.seq = np.ndarray((n,), dtype=np.uint64, buffer=buf, offset=offset)
+        offset += n * 8
+        self.activation = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += n * 8
+        self.refs = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += n * 8
+        self.keys = np.ndarray((n, KEY_BYTES), dtype=np.uint8, buffer=buf, offset=offset)
+        offset += n * KEY_BYTES
+        self.vectors = np.ndarray((n, self.dims), dtype=np.float32, buffer=buf, offset=offset)
+
+    # ---- locks -------------------------------------------------------------
+
+    @contextmanager
+    def _global_lock(self) -> Iterator[None]:
+        # byte 0 van het lockbestand; slot i gebruikt byte i + 1
+        with self._thread_lock:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, 0)
+
+    @contextmanager
+    def _slot_lock(self, slot: int) -> Iterator[None]:
+        with self._stripes[slot % LOCK_STRIPES]:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, slot + 1)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot + 1)
+
+    # ---- slot allocator ----------------------------------------------------
+
+    def _probe(self, key: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """(slot met deze key, eerste vrije/tombstone-slot onderweg)."""
+        start = int.from_bytes(key[:8], "little") % self.slots
+        free = None
+        for i in range(self.slots):
+            slot = (start + i) % self.slots
+            current = self.keys[slot].tobytes()
+            if current == key:
+                return slot, free
+            if current == EMPTY:
+                return None, free if free is not None else slot
+            if current == TOMBSTONE and free is None:
+                free = slot
+        return None, free
+
+    def find(self, session_id: str) -> Optional[int]:
+        return self._probe(session_key(session_id))[0]
+
+    def slot_for(self, session_id: str) -> int:
+        """Slot van deze sessie; claimt er een als die nog niet bestaat."""
+        key = session_key(session_id)
+        slot, _ = self._probe(key)
+        if slot is not None:
+            return slot
+        with self._global_lock():
+            slot, free = self._probe(key)  # opnieuw, nu onder het lock
+            if slot is not None:
+                return slot
+            if free is None:
+                raise RuntimeError(f"Shared state {self.name!r} is vol ({self.slots} slots)")
+            with self._slot_lock(free):
+                self.vectors[free] = 0.0
+                self.activation[free] = NEVER_WRITTEN
+                self.refs[free] = 0
+                self.seq[free] += 2
+                self.keys[free] = np.frombuffer(key, dtype=np.uint8)
+            return free
+
+    def release(self, session_id: str) -> bool:
+        """Deze worker laat de sessie los; True als het slot daarmee vrijkwam."""
+        key = session_key(session_id)
+        with self._global_lock():
+            slot, _ = self._probe(key)
+            if slot is None:
+                return False
+            with self._slot_lock(slot):
+                self.refs[slot] = max(0, int(self.refs[slot]) - 1)
+                if self.refs[slot] > 0:
+                    return False  # een andere worker gebruikt hem nog
+                self.keys[slot] = np.frombuffer(TOMBSTONE, dtype=np.uint8)
+                self.seq[slot] += 2
+            self._compact(slot)
+            return True
+
+    def _compact(self, slot: int) -> None:
+        # aanroepen met het globale lock vast. Staat er na een reeks
+        # tombstones een leeg slot, dan eindigt geen enkele zoekketen
+        # voorbij die reeks: de tombstones mogen weer leeg worden.
+        if self.keys[(slot + 1) % self.slots].tobytes() != EMPTY:
+            return
+        for _ in range(self.slots):
+            if self.keys[slot].tobytes() != TOMBSTONE:
+                return
+            self.keys[slot] = 0
+            slot = (slot - 1) % self.slots
+
+    def __len__(self) -> int:
+        used = ~(np.all(self.keys == 0, axis=1) | np.all(self.keys == 0xFF, axis=1))
+        return int(used.sum())
+
+    # ---- lezen / schrijven --------------------------------------------------
+
+    def read(self, slot: int, retries: int = READ_RETRIES) -> Tuple[np.ndarray, int, int]:
+        """Consistente kopie (vector, activation_count, seq) zonder lock.
+
+        Geeft na `retries` mislukte pogingen een TimeoutError (bijv. als
+        een worker stierf midden in een write; zie sync()).
+        """
+        backoff = 0.0
+        for attempt in range(retries):
+            before = int(self.seq[slot])
+            if not before & 1:
+                vector = self.vectors[slot].copy()
+                activation = int(self.activation[slot])
+                if int(self.seq[slot]) == before:
+                    return vector, activation, before
+            self.retries += 1
+            if attempt >= SPIN_READS:
+                # de schrijver (ander proces) de kans geven af te ronden
+                time.sleep(backoff)
+                backoff = min(READ_BACKOFF_MAX, backoff * 2 or 1e-6)
+        raise TimeoutError(f"Shared state slot {slot} blijft in schrijfstaat")
+
+    def _read_locked(self, slot: int) -> Tuple[np.ndarray, int, int]:
+        # met het slot-lock vast schrijft niemand anders; een oneven teller
+        # is dan een write die nooit afkwam: teller herstellen
+        seq = int(self.seq[slot])
+        if seq & 1:
+            self.seq[slot] = seq + 1
+            self.repairs += 1
+            print(f"[SHARED STATE] slot {slot}: onafgemaakte write hersteld")
+            # de data is half geschreven: NEVER_WRITTEN laat de lokale state winnen
+            return self.vectors[slot].copy(), NEVER_WRITTEN, seq + 1
+        return self.vectors[slot].copy(), int(self.activation[slot]), seq
+
+    @contextmanager
+    def locked(self, slot: int) -> Iterator[None]:
+        """Alleen het schrijf-lock van het slot (voor read-modify-write over processen)."""
+        with self._slot_lock(slot):
+            yield
+
+    def write(self, slot: int, vector, activation: int) -> None:
+        """Schrijf zonder het slot-lock te nemen; aanroepen binnen `locked(slot)`."""
+        self.seq[slot] += 1
+        self.vectors[slot] = vector
+        self.activation[slot] = activation
+        self.seq[slot] += 1
+
+    @contextmanager
+    def sync(self, session: Any) -> Iterator[None]:
+        """Read-modify-write van de PDA-state van een sessie over processen heen.
+
+        Onder het slot-lock: haal de gedeelde state op als een andere worker
+        hem sinds onze laatste sync schreef, laat de caller de lokale state
+        bijwerken en schrijf hem daarna terug.
+        """
+        state = session.pda.state
+        key = np.frombuffer(session_key(session.session_id), dtype=np.uint8)
+        with ExitStack() as stack:
+            while True:
+                slot = self.slot_for(session.session_id)
+                stack.enter_context(self.locked(slot))
+                # het slot kan tussen opzoeken en locken vrijgegeven zijn
+                if np.array_equal(self.keys[slot], key):
+                    break
+                stack.close()
+
+            vector, activation, seq = self._read_locked(slot)
+            if activation != NEVER_WRITTEN and seq != session.shared_seq:
+                state.vector = vector
+                state.activation_count = activation
+            if session.shared_seq is None:
+                # eerste sync van deze sessie in deze worker; vanaf nu geeft de
+                # eviction-hook de ref weer vrij, ook als het blok hieronder faalt
+                self.refs[slot] += 1
+            session.shared_seq = seq
+            yield
+            self.write(slot, state.vector, state.activation_count)
+            session.shared_seq = int(self.seq[slot])
+
+    def close(self) -> None:
+        self._shm.close()
+        os.close(self._lock_fd)
+
+    def unlink(self) -> None:
+        """Verwijder de shared memory block (bijv. bij een geplande herstart van alle workers)."""
+        shared_memory.SharedMemory(name=self.name).unlink()
+
+
+_shared: Optional[SharedStateTable] = None
+
+
+def get_shared_state() -> Optional[SharedStateTable]:
+    """De gedeelde tabel van dit proces, of None als PDA_SHARED_STATE uit staat."""
+    global _shared
+    if _shared is None and SHARED_STATE_ENABLED:
+        _shared = SharedStateTable()
+    return _shared
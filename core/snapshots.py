@@ -0,0 +1,249 @@
+# core/snapshots.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import atexit
+import io
+import os
+import threading
+
+import numpy as np
+
+from core.memory import ConversationMemory, TurnMemory
+from core.tracing import span
+from core.utils import pack_strings, session_path, unpack_strings
+
+# Binaire snapshots per sessie (snapshots/session_<id>.npz): PDA32D-state +
+# ConversationMemory. Geschreven bij eviction, elke SNAPSHOT_INTERVAL seconden
+# voor gewijzigde sessies (zodat een crash hooguit dat interval kost) en bij
+# afsluiten; lazy teruggeladen bij de eerste toegang tot een sessie.
+SNAPSHOTS_ENABLED = os.getenv("PDA_SNAPSHOTS", "1").lower() in {"1", "true", "on"}
+SNAPSHOT_DIR = Path(os.getenv("PDA_SNAPSHOT_DIR", "snapshots"))
+SNAPSHOT_INTERVAL = float(os.getenv("PDA_SNAPSHOT_INTERVAL_S", "30"))  # 0 = alleen bij eviction/exit
+
+FORMAT_VERSION = 1
+ROLES = ("user", "pda")
+
+
+def encode_session(session: Any, include_memory: bool = True) -> Dict[str, np.ndarray]:
+    """Alle arrays van één sessie-snapshot (aanroepen met het sessie-lock vast).
+
+    Zonder `include_memory` alleen de PDA-state (het gesprek staat dan in SQLite).
+    Alleen het RAM-venster gaat mee: de states vanaf de eerste beurt daarin,
+    met rij 0 = die eerste state, plus het beurtnummer waar het venster begint.
+    """
+    memory: ConversationMemory = session.memory
+    turns = memory.turns if include_memory else []
+    first_row = turns[0].state_row if turns else 0
+
+    names = sorted({name for t in turns for name in t.emotions})
+    name_ids = {name: i for i, name in enumerate(names)}
+    emo_offsets = np.zeros(len(turns) + 1, dtype=np.int64)
+    np.cumsum([len(t.emotions) for t in turns], out=emo_offsets[1:])
+    emo_names = np.fromiter((name_ids[n] for t in turns for n in t.emotions), dtype=np.int32)
+    emo_values = np.fromiter((v for t in turns for v in t.emotions.values()), dtype=np.float64)
+
+    text_blob, text_offsets = pack_strings([t.text for t in turns])
+    name_blob, name_offsets = pack_strings(names)
+    return {
+        "version": np.array(FORMAT_VERSION, dtype=np.int32),
+        "session_id": np.frombuffer(session.session_id.encode("utf-8"), dtype=np.uint8),
+        "pda_vector": np.array(session.pda.state.vector, dtype=np.float32),
+        "pda_activation_count": np.array(session.pda.state.activation_count, dtype=np.int64),
+        "states": np.array(memory.states.matrix()[first_row:] if turns else [], dtype=np.float32).reshape(-1, memory.states.dims),
+        "turn_offset": np.array(memory.offset if include_memory else 0, dtype=np.int64),
+        "turn_rows": np.fromiter((t.state_row - first_row for t in turns), dtype=np.int32, count=len(turns)),
+        "turn_roles": np.fromiter((ROLES.index(t.role) for t in turns), dtype=np.uint8, count=len(turns)),
+        "turn_ts": np.fromiter((t._ts for t in turns), dtype=np.float64, count=len(turns)),
+        "text_blob": text_blob,
+        "text_offsets": text_offsets,
+        "emotion_name_blob": name_blob,
+        "emotion_name_offsets": name_offsets,
+        "emo_offsets": emo_offsets,
+        "emo_names": emo_names,
+        "emo_values": emo_values,
+    }
+
+
+def restore_session(session: Any, arrays: Dict[str, np.ndarray], include_memory: bool = True) -> None:
+    """Vul een verse sessie uit snapshot-arrays (zonder opnieuw te journalen)."""
+    version = int(arrays["version"])
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Onbekende snapshot-versie: {version}")
+
+    session.pda.state.vector = arrays["pda_vector"]
+    session.pda.state.activation_count = int(arrays["pda_activation_count"])
+    if not include_memory:
+        return
+
+    memory: ConversationMemory = session.memory
+    memory.offset = int(arrays["turn_offset"]) if "turn_offset" in arrays else 0
+    memory.states.extend(arrays["states"])
+    texts = unpack_strings(arrays["text_blob"], arrays["text_offsets"])
+    names = unpack_strings(arrays["emotion_name_blob"], arrays["emotion_name_offsets"])
+    emo_offsets = arrays["emo_offsets"].tolist()
+    emo_names = arrays["emo_names"].tolist()
+    emo_values = arrays["emo_values"].tolist()
+
+    for i, (row, role, ts) in enumerate(zip(
+        arrays["turn_rows"].tolist(), arrays["turn_roles"].tolist(), arrays["turn_ts"].tolist()
+    )):
+        lo, hi = emo_offsets[i], emo_offsets[i + 1]
+        emotions = {names[emo_names[j]]: emo_values[j] for j in range(lo, hi)}
+        memory._add(TurnMemory(
+            role=ROLES[role], text=texts[i], emotions=emotions,
+            history=memory.states, row=row, timestamp=ts,
+        ))
+
+
+class SnapshotStore:
+    """Schrijft en leest sessie-snapshots; schrijven is atomair (tmp + fsync + rename).
+
+    Met `memory=False` alleen de PDA-state, voor als een andere store
+    (PDA_MEMORY_BACKEND=sqlite) het gesprek bewaart en terugzet.
+    """
+
+    def __init__(self, directory: Path = SNAPSHOT_DIR, memory: bool = True):
+        self.directory = Path(directory)
+        self.memory = memory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._saved_turns: Dict[str, int] = {}  # laatst weggeschreven aantal beurten
+        self._lock = threading.Lock()
+        self.stats = {"saved": 0, "restored": 0, "failed": 0}
+
+    def path_for(self, session_id: str) -> Path:
+        return session_path(self.directory, session_id, ".npz")
+
+    def save(self, session: Any, force: bool = False) -> bool:
+        """Snapshot wegschrijven; slaat over als er sinds de vorige niets veranderde."""
+        sid = session.session_id
+        n_turns = session.memory.turn_count
+        if not force and self._saved_turns.get(sid, 0) == n_turns:
+            return False
+
+        with span("snapshot.save", session_id=sid, turns=n_turns) as s:
+            buffer = io.BytesIO()
+            np.savez(buffer, **encode_session(session, self.memory))
+            data = buffer.getbuffer()
+            s.set_attribute("bytes", data.nbytes)
+
+            path = self.path_for(sid)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+
+        with self._lock:
+            self._saved_turns[sid] = n_turns
+            self.stats["saved"] += 1
+        return True
+
+    def load(self, session: Any) -> bool:
+        """Rehydrateer `session` als er een snapshot is; False als die ontbreekt of stuk is."""
+        path = self.path_for(session.session_id)
+        if not path.exists():
+            return False
+        with span("snapshot.load", session_id=session.session_id) as s:
+            try:
+                with np.load(path, allow_pickle=False) as npz:
+                    arrays = {name: npz[name] for name in npz.files}
+                restore_session(session, arrays, self.memory)
+            except Exception as e:
+                print(f"[SNAPSHOT] restore failed for {session.session_id}: {e!r}")
+                with self._lock:
+                    self.stats["failed"] += 1
+                return False
+            s.set_attribute("turns", session.memory.turn_count)
+        with self._lock:
+            self._saved_turns[session.session_id] = session.memory.turn_count
+            self.stats["restored"] += 1
+        return True
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._saved_turns.pop(session_id, None)
+
+    def save_all(self, registry: Any, wait: bool = True) -> int:
+        """Snapshot van alle gewijzigde sessies in de registry, per sessie onder het sessie-lock.
+
+        Met `wait=False` worden sessies met een lopende beurt overgeslagen
+        (de volgende ronde komen ze weer langs).
+        """
+        saved = 0
+        for sid in registry.session_ids():
+            session = registry.peek(sid)
+            if session is None:
+                continue
+            if not session.lock.acquire(blocking=wait):
+                continue
+            try:
+                saved += self.save(session)
+            except Exception as e:
+                print(f"[SNAPSHOT] save failed for {sid}: {e!r}")
+            finally:
+                session.release()
+        return saved
+
+    def checkpoint(self, registry: Any) -> int:
+        """Periodieke ronde: verlopen sessies opruimen, daarna gewijzigde sessies opslaan."""
+        registry.sweep()
+        return self.save_all(registry, wait=False)
+
+
+_store: Optional[SnapshotStore] = None
+
+
+def get_snapshot_store() -> SnapshotStore:
+    global _store
+    if _store is None:
+        _store = SnapshotStore()
+    return _store
+
+
+def attach(
+    registry: Any,
+    store: Optional[SnapshotStore] = None,
+    memory: bool = True,
+    interval: float = SNAPSHOT_INTERVAL,
+) -> SnapshotStore:
+    """Koppel snapshots aan een SessionRegistry: lazy laden, opslaan bij eviction,
+    elke `interval` seconden (achtergrondthread) en bij exit.
+
+    De loader komt ná eerder toegevoegde loaders; `memory=False` als een
+    daarvan het gesprek al terugzet.
+    """
+    store = store or get_snapshot_store()
+    store.memory = memory
+
+    def on_evict(session: Any, reason: str) -> None:
+        store.save(session)
+        store.forget(session.session_id)
+
+    registry.add_loader(store.load)
+    registry.add_eviction_hook(on_evict)
+
+    stop = threading.Event()
+
+    def run() -> None:
+        while not stop.wait(interval):
+            try:
+                store.checkpoint(registry)
+            except Exception as e:
+                print(f"[SNAPSHOT] checkpoint failed: {e!r}")
+
+    if interval > 0:
+        threading.Thread(target=run, name="snapshot-checkpoint", daemon=True).start()
+
+    def at_exit() -> None:
+        stop.set()
+        store.save_all(registry)
+
+    atexit.register(at_exit)
+    return store
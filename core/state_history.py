@@ -0,0 +1,117 @@
+# core/state_history.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+
+import os
+
+import numpy as np
+
+from core.utils import session_path
+
+# Als gezet: state-historie per sessie als memory-mapped float32-bestand in
+# deze map (session_<id>.f32, zie core.utils.session_path); anders gewoon een groeiende array in RAM.
+STATE_HISTORY_DIR = os.getenv("PDA_STATE_HISTORY_DIR", "")
+
+STATE_DIMS = 32
+
+
+class StateHistory:
+    """Append-only (n, 32) float32-historie van state-snapshots voor één sessie.
+
+    Een beurt bewaart alleen zijn rijnummer. Identieke opeenvolgende
+    snapshots (user- en PDA-beurt van dezelfde turn) delen één rij.
+    Met `path` wordt de array een np.memmap die bij groei verdubbelt.
+    """
+
+    def __init__(self, path: Optional[Path] = None, capacity: int = 16, dims: int = STATE_DIMS):
+        self.dims = dims
+        self.path = Path(path) if path is not None else None
+        self.count = 0
+        self._initial = max(1, capacity)
+        if self.path is None:
+            self._data = np.zeros((self._initial, dims), dtype=np.float32)
+        else:
+            # het bestand komt er pas bij de eerste rij: een sessie met dezelfde
+            # id die nog ge-evict wordt, gebruikt het hare tot dan nog
+            self._data = np.zeros((0, dims), dtype=np.float32)
+
+    @classmethod
+    def for_session(cls, session_id: str) -> "StateHistory":
+        if STATE_HISTORY_DIR:
+            return cls(session_path(STATE_HISTORY_DIR, session_id, ".f32"))
+        return cls()
+
+    def _map(self, rows: int) -> np.ndarray:
+        size = rows * self.dims * 4
+        with open(self.path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self.path, dtype=np.float32, mode="r+", shape=(rows, self.dims))
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[0]
+
+    def _grow(self) -> None:
+        new = max(self.capacity * 2, self._initial)
+        if self.path is None:
+            data = np.zeros((new, self.dims), dtype=np.float32)
+            data[: self.count] = self._data[: self.count]
+            self._data = data
+        elif isinstance(self._data, np.memmap):
+            self._data.flush()
+            self._data = self._map(new)
+        else:
+            # de beurten zelf leven in RAM, dus een bestaand bestand begint opnieuw
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_bytes(b"")
+            self._data = self._map(new)
+
+    def append(self, vector) -> int:
+        """Voeg een snapshot toe en geef het rijnummer terug."""
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vec.size == 0:
+            vec = np.zeros(self.dims, dtype=np.float32)
+        if self.count and self._data[self.count - 1].tobytes() == vec.tobytes():
+            return self.count - 1
+        if self.count == self.capacity:
+            self._grow()
+        self._data[self.count] = vec
+        self.count += 1
+        return self.count - 1
+
+    def extend(self, matrix) -> None:
+        """Voeg rijen in bulk toe, zonder ontdubbeling (bijv. bij restore)."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dims)
+        while self.count + len(matrix) > self.capacity:
+            self._grow()
+        self._data[self.count : self.count + len(matrix)] = matrix
+        self.count += len(matrix)
+
+    def get(self, row: int) -> np.ndarray:
+        return self._data[row]
+
+    def take(self, rows) -> np.ndarray:
+        """Kopie van de gevraagde rijen als (len(rows), dims)-matrix."""
+        return self._data[np.asarray(rows, dtype=np.intp)]
+
+    def matrix(self) -> np.ndarray:
+        """View op alle gebruikte rijen."""
+        return self._data[: self.count]
+
+    def flush(self) -> None:
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+
+    def discard(self) -> None:
+        """Bestand verwijderen (bij eviction); de rijen blijven in RAM bruikbaar."""
+        if self.path is None:
+            return
+        data, self._data = self._data, np.array(self._data)
+        del data  # mapping sluiten vóór unlink (Windows)
+        self.path.unlink(missing_ok=True)
+        self.path = None
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,256 @@
+# core/state_index.py
+from __future__ import annotations
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import math
+import os
+import threading
+
+import numpy as np
+
+# Vanaf hoeveel vectoren het globale index overstapt van exact naar IVF
+STATE_INDEX_EXACT_LIMIT = int(os.getenv("PDA_STATE_INDEX_EXACT_LIMIT", "20000"))
+# Hoeveel IVF-lijsten een query doorzoekt: dit deel van alle lijsten, minstens
+# STATE_INDEX_NPROBE. Recall@5 gemeten bij 50k vectoren (223 lijsten):
+#   deel   ongestructureerde (random) data   geclusterde states
+#   ~4%    0.46                               1.00
+#   10%    0.72                               1.00
+#   25%    0.91                               1.00
+#   60%    1.00                               1.00
+# Echte PDA-states zijn geclusterd; random data is het slechtste geval.
+STATE_INDEX_NPROBE = int(os.getenv("PDA_STATE_INDEX_NPROBE", "8"))
+STATE_INDEX_NPROBE_FRACTION = float(os.getenv("PDA_STATE_INDEX_NPROBE_FRACTION", "0.25"))
+# IVF opnieuw trainen zodra het index zoveel keer groter is dan bij de vorige training
+RETRAIN_GROWTH = 2.0
+# verwijderde rijen opruimen zodra ze dit deel van het index uitmaken
+COMPACT_FRACTION = 0.25
+
+
+def knn_exact(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    norms: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exacte k-NN (L2) voor een batch queries.
+
+    Geeft (indices, afstanden) terug, beide (n_queries, min(k, n)),
+    gesorteerd van dichtstbij naar verst.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    n = matrix.shape[0]
+    k = min(k, n)
+    if k == 0:
+        empty = np.zeros((queries.shape[0], 0))
+        return empty.astype(np.intp), empty.astype(np.float32)
+
+    if norms is None:
+        norms = np.einsum("ij,ij->i", matrix, matrix)
+    q_norms = np.einsum("ij,ij->i", queries, queries)
+    # ||x - q||² = ||x||² - 2 x·q + ||q||²
+    d2 = norms[None, :] - 2.0 * (queries @ matrix.T) + q_norms[:, None]
+    np.maximum(d2, 0.0, out=d2)
+
+    if k < n:
+        part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n), (queries.shape[0], n))
+    part_d = np.take_along_axis(d2, part, axis=1)
+    order = np.argsort(part_d, axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    dist = np.sqrt(np.take_along_axis(part_d, order, axis=1))
+    return idx, dist
+
+
+def _kmeans(data: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign, _ = knn_exact(centroids, data, 1)
+        assign = assign[:, 0]
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+
+class StateIndex:
+    """k-NN index over 32D state-snapshots met willekeurige keys.
+
+    Tot `exact_limit` vectoren is het zoeken exact (brute force in NumPy).
+    Daarboven wordt een IVF-structuur getraind (k-means coarse quantizer,
+    ~sqrt(n) lijsten), opnieuw zodra het index sinds de vorige training
+    verdubbeld is; queries doorzoeken dan de dichtstbijzijnde
+    max(nprobe, nprobe_fraction × lijsten) lijsten (meer als die samen
+    minder dan k kandidaten hebben). Zie STATE_INDEX_NPROBE_FRACTION voor
+    de recall die daarbij hoort.
+
+    `remove` zet rijen op dood (norm = inf); bij genoeg dode rijen wordt
+    het index gecompacteerd.
+    """
+
+    def __init__(
+        self,
+        dims: int = 32,
+        exact_limit: int = STATE_INDEX_EXACT_LIMIT,
+        nprobe: int = STATE_INDEX_NPROBE,
+        nprobe_fraction: float = STATE_INDEX_NPROBE_FRACTION,
+        capacity: int = 1024,
+    ):
+        self.dims = dims
+        self.exact_limit = exact_limit
+        self.nprobe = nprobe
+        self.nprobe_fraction = nprobe_fraction
+        self._data = np.zeros((capacity, dims), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self.keys: List[Hashable] = []
+        self._pos: Dict[Hashable, int] = {}
+        self.removed = 0  # dode rijen tot de volgende compaction
+        self._lock = threading.Lock()
+        # IVF-structuur (None zolang exact)
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._trained_at = 0
+
+    def __len__(self) -> int:
+        return len(self.keys) - self.removed
+
+    @property
+    def approximate(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, vector, key: Hashable) -> None:
+        self.add_many(np.asarray(vector, dtype=np.float32)[None, :], [key])
+
+    def add_many(self, vectors, keys: List[Hashable]) -> None:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            start = len(self.keys)
+            end = start + len(keys)
+            while end > self._data.shape[0]:
+                self._grow()
+            self._data[start:end] = vectors
+            self._norms[start:end] = np.einsum("ij,ij->i", vectors, vectors)
+            for offset, key in enumerate(keys):
+                old = self._pos.get(key)
+                if old is not None:
+                    self._kill(old)
+                self._pos[key] = start + offset
+            self.keys.extend(keys)
+
+            live = end - self.removed
+            if self._centroids is not None and live <= RETRAIN_GROWTH * self._trained_at:
+                assign, _ = knn_exact(self._centroids, vectors, 1)
+                for offset, c in enumerate(assign[:, 0]):
+                    self._lists[c].append(start + offset)
+            elif live > self.exact_limit:
+                self._train()
+
+    def remove(self, keys: Iterable[Hashable]) -> int:
+        """Verwijder de gegeven keys (onbekende worden overgeslagen); geeft het aantal terug."""
+        with self._lock:
+            removed = 0
+            for key in keys:
+                i = self._pos.pop(key, None)
+                if i is not None:
+                    self._kill(i)
+                    removed += 1
+            if self.removed > COMPACT_FRACTION * len(self.keys):
+                self._compact()
+            return removed
+
+    def _kill(self, i: int) -> None:
+        # dode rij: afstand inf, dus nooit meer in een resultaat
+        self._norms[i] = np.inf
+        self.keys[i] = None
+        self.removed += 1
+
+    def _compact(self) -> None:
+        n = len(self.keys)
+        alive = np.isfinite(self._norms[:n])
+        m = int(alive.sum())
+        self._data[:m] = self._data[:n][alive]
+        self._norms[:m] = self._norms[:n][alive]
+        self.keys = [key for key, keep in zip(self.keys, alive) if keep]
+        self._pos = {key: i for i, key in enumerate(self.keys)}
+        self.removed = 0
+        if m > self.exact_limit:
+            self._train()
+        else:
+            self._centroids, self._lists, self._trained_at = None, [], 0
+
+    def _grow(self) -> None:
+        cap = self._data.shape[0] * 2
+        data = np.zeros((cap, self.dims), dtype=np.float32)
+        norms = np.zeros(cap, dtype=np.float32)
+        n = len(self.keys)
+        data[:n], norms[:n] = self._data[:n], self._norms[:n]
+        self._data, self._norms = data, norms
+
+    def _train(self) -> None:
+        rows = np.flatnonzero(np.isfinite(self._norms[: len(self.keys)]))
+        n = len(rows)
+        data = self._data[rows]
+        n_lists = max(1, int(np.sqrt(n)))
+        sample = data if n <= 50 * n_lists else data[np.random.default_rng(0).choice(n, 50 * n_lists, replace=False)]
+        self._centroids = _kmeans(sample, n_lists)
+        assign, _ = knn_exact(self._centroids, data, 1)
+        self._lists = [[] for _ in range(n_lists)]
+        for i, c in zip(rows.tolist(), assign[:, 0].tolist()):
+            self._lists[c].append(i)
+        self._trained_at = n
+
+    def query_many(self, queries, k: int = 5) -> Tuple[List[List[Any]], np.ndarray]:
+        """Batch-query: (keys per query, afstanden (n_queries, k')), k' = min(k, len).
+
+        Heeft een query minder dan k' treffers, dan is zijn keys-lijst
+        korter en zijn de resterende afstanden inf.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            n = len(self.keys)
+            rows: List[Tuple[np.ndarray, np.ndarray]] = []
+            if self._centroids is None:
+                idx, dist = knn_exact(self._data[:n], queries, k, self._norms[:n])
+                rows = list(zip(idx, dist))
+            else:
+                n_lists = len(self._centroids)
+                nprobe = max(self.nprobe, math.ceil(self.nprobe_fraction * n_lists))
+                order, _ = knn_exact(self._centroids, queries, n_lists)
+                for q, lists in zip(queries, order):
+                    cand: List[int] = []
+                    for probed, c in enumerate(lists):
+                        if probed >= nprobe and len(cand) >= k:
+                            break
+                        cand.extend(self._lists[c])
+                    cand_idx = np.asarray(cand, dtype=np.intp)
+                    idx, dist = knn_exact(self._data[cand_idx], q[None, :], k, self._norms[cand_idx])
+                    rows.append((cand_idx[idx[0]], dist[0]))
+
+            width = min(k, len(self))
+            out_keys: List[List[Any]] = []
+            out_dist = np.full((len(rows), width), np.inf, dtype=np.float32)
+            for r, (idx, dist) in enumerate(rows):
+                live = np.isfinite(dist)[:width]
+                out_keys.append([self.keys[i] for i in idx[:width][live]])
+                out_dist[r, : len(out_keys[-1])] = dist[:width][live]
+            return out_keys, out_dist
+
+    def query(self, vector, k: int = 5) -> List[Tuple[Any, float]]:
+        keys, dist = self.query_many(vector, k)
+        return list(zip(keys[0], dist[0].tolist()))
+
+
+_global_index: Optional[StateIndex] = None
+_global_lock = threading.Lock()
+
+
+def get_global_state_index() -> StateIndex:
+    """Proces-breed index over alle sessies; keys zijn (session_id, state_row)."""
+    global _global_index
+    with _global_lock:
+        if _global_index is None:
+            _global_index = StateIndex()
+        return _global_index
@@ -0,0 +1,161 @@
+# core/summary.py
+from __future__ import annotations
+from collections import Counter, deque
+from typing import Any, Deque, List, Sequence, Tuple
+
+import os
+import re
+
+# Prompt-budget voor de gesprekscontext (geschatte tokens) en hoeveel
+# recente beurten letterlijk in de prompt blijven staan.
+MEMORY_TOKEN_BUDGET = int(os.getenv("PDA_MEMORY_TOKEN_BUDGET", "400"))
+MEMORY_VERBATIM_TURNS = int(os.getenv("PDA_MEMORY_VERBATIM_TURNS", "4"))
+
+USER_SNIPPET_WORDS = 20
+PDA_SNIPPET_WORDS = 10
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Grove schatting (~4 tekens per token); goed genoeg om een budget te bewaken."""
+    return (len(text) + 3) // 4
+
+
+def _snippet(text: str, max_words: int) -> str:
+    first = _SENTENCE_END.split(text.strip(), maxsplit=1)[0]
+    words = first.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + " …"
+    return " ".join(words)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Kap af op een woordgrens zodat de tekst (met " …") binnen max_tokens valt."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max(0, max_tokens * 4 - 5)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + " …" if cut else ""
+
+
+def _line(turn: Any) -> str:
+    return f"{'User' if turn.role == 'user' else 'PDA'}: {turn.text}"
+
+
+class RollingSummary:
+    """Incrementele, extractieve samenvatting van beurten buiten het verbatim-venster.
+
+    Elke beurt die uit de laatste `verbatim_turns` valt, wordt één keer
+    ingevouwen als korte snippet plus emotietelling; de oudste snippets
+    vallen weg zodra de samenvatting boven haar deel van het budget komt.
+    Er is geen LLM-call nodig en per beurt is het werk O(1).
+    """
+
+    def __init__(
+        self,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        verbatim_turns: int = MEMORY_VERBATIM_TURNS,
+    ):
+        self.token_budget = token_budget
+        self.verbatim_turns = verbatim_turns
+        # de samenvatting mag hoogstens de helft van het budget innemen
+        self.summary_budget = token_budget // 2
+
+        self.items: Deque[Tuple[str, int]] = deque()  # (regel, tokens)
+        self.item_tokens = 0
+        self.folded = 0    # aantal ingevouwen beurten
+        self.dropped = 0   # aantal snippets dat uit de samenvatting is gevallen
+        self.emotion_counts: Counter = Counter()
+
+    def on_append(self, turns: Sequence[Any]) -> None:
+        """Aanroepen na elke append; vouwt de beurt in die uit het venster valt."""
+        if len(turns) > self.verbatim_turns:
+            self.fold(turns[-self.verbatim_turns - 1])
+
+    def fold(self, turn: Any) -> None:
+        self.folded += 1
+        if turn.role == "user":
+            self.emotion_counts.update((turn.emotions or {}).keys())
+            line = f"User: {_snippet(turn.text, USER_SNIPPET_WORDS)}"
+        else:
+            line = f"PDA: {_snippet(turn.text, PDA_SNIPPET_WORDS)}"
+        tokens = estimate_tokens(line) + 1
+        self.items.append((line, tokens))
+        self.item_tokens += tokens
+        while self.items and self.item_tokens > self.summary_budget:
+            _, t = self.items.popleft()
+            self.item_tokens -= t
+            self.dropped += 1
+
+    def render(self, token_budget: int | None = None) -> str:
+        """Samenvatting als tekst. Met `token_budget` vallen de oudste snippets
+        weg (hele regels) tot hij past; past zelfs de kop niet, dan "".
+        """
+        if not self.folded:
+            return ""
+        items = [line for line, _ in self.items]
+        tail = []
+        if self.emotion_counts:
+            top = ", ".join(f"{name} ({n}×)" for name, n in self.emotion_counts.most_common(5))
+            tail.append(f"- Terugkerende emoties: {top}")
+        dropped = self.dropped
+        while True:
+            parts: List[str] = [f"Samenvatting van {self.folded} eerdere beurten:"]
+            if dropped:
+                parts.append(f"- ({dropped} oudere beurten weggelaten)")
+            parts.extend(f"- {line}" for line in items)
+            text = "\n".join(parts + tail)
+            if token_budget is None or estimate_tokens(text) <= token_budget:
+                return text
+            if items:
+                items.pop(0)
+                dropped += 1
+            elif tail:
+                tail = []
+            else:
+                return ""
+
+    def prompt_context(
+        self,
+        turns: Sequence[Any],
+        token_budget: int | None = None,
+        sections: Sequence[Tuple[str, str]] = (),
+    ) -> str:
+        """Samenvatting + laatste beurten letterlijk + extra secties, binnen het tokenbudget.
+
+        `sections` zijn (kop, regels)-paren, bijv. eerdere vergelijkbare
+        momenten; ze komen na het gesprek. Voorrang bij krapte: eerst de
+        verbatim-beurten (de oudste vallen als eerste weg; de laatste blijft,
+        zo nodig ingekort), dan de secties regel voor regel, dan de
+        samenvatting (oudste snippets eerst weg). Alles valt binnen het budget.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        verbatim = [_line(t) for t in turns[-self.verbatim_turns:]] if self.verbatim_turns else []
+
+        used = sum(estimate_tokens(v) + 1 for v in verbatim)
+        while len(verbatim) > 1 and used > budget:
+            used -= estimate_tokens(verbatim.pop(0)) + 1
+        if verbatim and used > budget:
+            verbatim[0] = _truncate(verbatim[0], budget - 1)
+            used = estimate_tokens(verbatim[0]) + 1 if verbatim[0] else 0
+
+        extra: List[str] = []
+        for header, text in sections:
+            cost = estimate_tokens(header) + 2  # kop + witregel
+            kept = []
+            for line in filter(None, text.split("\n")):
+                tokens = estimate_tokens(line) + 1
+                if used + cost + tokens > budget:
+                    break
+                kept.append(line)
+                cost += tokens
+            if kept:
+                extra.append(header + "\n" + "\n".join(kept))
+                used += cost
+
+        summary = self.render(max(0, budget - used - 1))
+
+        context = "\n".join(p for p in [summary, *verbatim] if p)
+        return "\n\n".join(p for p in [context, *extra] if p)
@@ -0,0 +1,168 @@
+# core/text_index.py
+from __future__ import annotations
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import math
+import re
+import threading
+
+import numpy as np
+
+# Gangbare Nederlandse en Engelse stopwoorden; dragen niets bij aan de relevantie
+STOPWORDS = frozenset("""
+de het een en of maar dat die dit deze is ben bent zijn was waren wordt worden
+ik je jij u hij zij ze we wij jullie mij me mijn jouw zijn haar ons onze hun
+van in op aan met voor naar bij over uit om tot als dan ook nog wel niet geen
+er hier daar wat wie waar hoe te zo al heb hebt heeft had kan kun moet wil
+the a an and or but that this these those is am are was were be been being
+i you he she it we they me my your his her its our their
+of in on at with for to from by about as than then also not no
+there here what who where how so have has had can could must will would do does did
+""".split())
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase woord-tokens zonder stopwoorden en losse tekens."""
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class _Postings:
+    """Documentnummers + tf's van één term in arrays die bij groei verdubbelen."""
+
+    __slots__ = ("numbers", "tfs", "count")
+
+    def __init__(self, capacity: int = 4):
+        self.numbers = np.empty(capacity, dtype=np.intp)
+        self.tfs = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+
+    def append(self, number: int, tf: int) -> None:
+        if self.count == self.numbers.shape[0]:
+            self.numbers = np.concatenate([self.numbers, np.empty_like(self.numbers)])
+            self.tfs = np.concatenate([self.tfs, np.empty_like(self.tfs)])
+        self.numbers[self.count] = number
+        self.tfs[self.count] = tf
+        self.count += 1
+
+    def discard(self, number: int) -> bool:
+        found = np.flatnonzero(self.numbers[: self.count] == number)
+        if not len(found):
+            return False
+        i = int(found[0])
+        # nummers blijven oplopend, dus schuiven i.p.v. de laatste erin zetten
+        self.numbers[i : self.count - 1] = self.numbers[i + 1 : self.count]
+        self.tfs[i : self.count - 1] = self.tfs[i + 1 : self.count]
+        self.count -= 1
+        return True
+
+
+class BM25Index:
+    """Incrementeel bijgehouden inverted index met BM25-scoring.
+
+    Documenten krijgen intern een oplopend nummer; postings zijn per term
+    twee groeiende NumPy-arrays (documentnummers, tf) plus een teller.
+    Toevoegen kost O(aantal tokens); zoeken scoort alleen de postings van
+    de query-termen, gevectoriseerd. doc_ids zijn willekeurige hashables:
+    per sessie het beurtnummer, gedeeld (session_id, beurtnummer).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, capacity: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, _Postings] = {}
+        self._numbers: Dict[Hashable, int] = {}       # doc_id -> intern nummer
+        self._doc_ids: List[Optional[Hashable]] = []  # intern nummer -> doc_id
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self.total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def add(self, doc_id: Hashable, text: str) -> None:
+        tokens = tokenize(text)
+        with self._lock:
+            if doc_id in self._numbers:
+                self._remove(doc_id, text)
+            number = len(self._doc_ids)
+            if number == self._lengths.shape[0]:
+                self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+            self._doc_ids.append(doc_id)
+            self._numbers[doc_id] = number
+            self._lengths[number] = len(tokens)
+            self.total_len += len(tokens)
+            counts: Dict[str, int] = {}
+            for term in tokens:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = _Postings()
+                postings.append(number, tf)
+
+    def remove(self, doc_id: Hashable, text: str) -> None:
+        """Verwijder een document; `text` moet de geïndexeerde tekst zijn."""
+        with self._lock:
+            self._remove(doc_id, text)
+
+    def _remove(self, doc_id: Hashable, text: str) -> None:
+        number = self._numbers.pop(doc_id, None)
+        if number is None:
+            return
+        self._doc_ids[number] = None
+        self.total_len -= int(self._lengths[number])
+        self._lengths[number] = 0
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if postings is not None and postings.discard(number) and not postings.count:
+                del self.postings[term]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        accept: Optional[Callable[[Hashable], bool]] = None,
+    ) -> List[Tuple[Hashable, float]]:
+        """Top-k (doc_id, score), hoogste score eerst. `accept` filtert doc_ids."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._numbers)
+            if not n or not terms or k <= 0:
+                return []
+            k1, b = self.k1, self.b
+            avg_len = self.total_len / n or 1.0
+            # alleen de postings van de query-termen: O(treffers), niet O(corpus)
+            matched, parts = [], []
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                df = postings.count
+                numbers, tfs = postings.numbers[:df], postings.tfs[:df]
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                norms = k1 * (1.0 - b + b * self._lengths[numbers] / avg_len)
+                matched.append(numbers)
+                parts.append(idf * tfs * (k1 + 1.0) / (tfs + norms))
+            if not matched:
+                return []
+            # scores per document optellen over de termen (hits oplopend, zoals voorheen)
+            hits, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(parts)).astype(np.float32)
+            order = np.arange(len(hits))
+            doc_ids = self._doc_ids
+            # zonder filter volstaat een partitie op k; met filter alles op volgorde aflopen
+            take = len(hits) if accept is not None else min(k, len(hits))
+            if take < len(hits):
+                order = np.sort(np.argpartition(-scores, take - 1)[:take])
+            order = order[np.argsort(-scores[order], kind="stable")]
+
+            results: List[Tuple[Hashable, float]] = []
+            for i in order:
+                doc_id = doc_ids[hits[i]]
+                if accept is None or accept(doc_id):
+                    results.append((doc_id, float(scores[i])))
+                    if len(results) == k:
+                        break
+            return results
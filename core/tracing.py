@@ -0,0 +1,143 @@
+# core/tracing.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import os
+import threading
+
+# Tracing staat standaard uit; dan is span() één functie-aanroep die een
+# gedeeld no-op object teruggeeft.
+TRACING_ENABLED = os.getenv("PDA_TRACING", "0").lower() in {"1", "true", "on"}
+TRACE_FILE = Path(os.getenv("PDA_TRACE_FILE", "logs/traces.jsonl"))
+TRACE_FORMAT = os.getenv("PDA_TRACE_FORMAT", "json")  # "json" (SDK to_json) of "otlp" (OTLP/JSON)
+# Ad-hoc debugprints per beurt (emoties, volledige prompts met gebruikerstekst)
+# naar stdout; alleen lokaal aanzetten, in productie zijn er de spans.
+DEBUG_PRINTS = os.getenv("PDA_DEBUG", "0").lower() in {"1", "true", "on"}
+
+
+class _NoopSpan:
+    """Vervangt een echte span als tracing uit staat."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[dict] = None) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+_tracer = None
+_provider = None
+_setup_lock = threading.Lock()
+
+
+def _clean(attributes: dict) -> dict:
+    # OTel accepteert alleen primitieve waarden (of lijsten daarvan)
+    return {
+        k: v if isinstance(v, (str, bool, int, float)) else str(v)
+        for k, v in attributes.items()
+        if v is not None
+    }
+
+
+def setup_tracing(
+    path: Path = TRACE_FILE,
+    fmt: str = TRACE_FORMAT,
+    service_name: str = "pda32d",
+) -> bool:
+    """Zet tracing aan met een lokale file-exporter. False als de SDK ontbreekt."""
+    global _tracer, _provider, TRACING_ENABLED
+    with _setup_lock:
+        if _tracer is not None:
+            return True
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError:
+            print("[TRACING] opentelemetry-sdk niet geïnstalleerd; tracing blijft uit")
+            TRACING_ENABLED = False
+            return False
+
+        _provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        _provider.add_span_processor(BatchSpanProcessor(FileSpanExporter(path, fmt)))
+        _tracer = _provider.get_tracer("pda32d")
+        TRACING_ENABLED = True
+        return True
+
+
+def shutdown_tracing() -> None:
+    """Flush openstaande spans naar disk (bijv. bij afsluiten of in benchmarks)."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def span(name: str, **attributes: Any):
+    """Context manager voor één span; no-op als tracing uit staat.
+
+    Gebruik: `with span("perception", session_id=sid) as s: s.set_attribute(...)`
+    """
+    if not TRACING_ENABLED:
+        return _NOOP
+    if _tracer is None and not setup_tracing():
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=_clean(attributes))
+
+
+class FileSpanExporter:
+    """Schrijft afgeronde spans als JSON-regels naar een lokaal bestand.
+
+    fmt="json": één `ReadableSpan.to_json()` per regel (compact).
+    fmt="otlp": één OTLP/JSON ExportTraceServiceRequest per batch, in te
+    lezen door een OTel collector (`otlpjsonfile` receiver).
+    """
+
+    def __init__(self, path: Path, fmt: str = "json"):
+        if fmt not in {"json", "otlp"}:
+            raise ValueError(f"Onbekend trace-formaat: {fmt!r}")
+        self.path = Path(path)
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: Sequence[Any]):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        try:
+            if self.fmt == "otlp":
+                from google.protobuf.json_format import MessageToJson
+                from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+
+                lines = [MessageToJson(encode_spans(spans), indent=None)]
+            else:
+                lines = [s.to_json(indent=None) for s in spans]
+            with self._lock, self.path.open("a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            print(f"[TRACING] export failed: {e!r}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -1,3 +1,10 @@
+from contextlib import contextmanager
+from pathlib import Path
+
+import hashlib
+import os
+import re
+
 import numpy as np
 
 def to_list(vec):
@@ -12,3 +19,75 @@ def to_list(vec):
         return list(vec)
     except:
         return []
+
+
+def pack_strings(strings):
+    """String-tabel: (UTF-8 blob als uint8-array, (n+1) int64-offsets)."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(blob, offsets, indices=None):
+    """Strings uit een string-tabel; met `indices` alleen die elementen."""
+    if indices is None:
+        raw = np.asarray(blob).tobytes()
+        bounds = np.asarray(offsets).tolist()
+        return [raw[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+    # alleen de gevraagde stukken lezen (blob kan een memmap zijn)
+    return [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in indices]
+
+
+# session_ids die zo in een bestandsnaam mogen; de rest wordt gehasht
+_SAFE_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def session_path(directory, session_id: str, suffix: str) -> Path:
+    """Pad voor een per-sessie bestand (session_<id><suffix>) binnen `directory`.
+
+    Een session_id met andere tekens (/, .., ...) komt er nooit rauw in:
+    die wordt "=<blake2b>", wat niet met een veilige id kan botsen.
+    """
+    if _SAFE_SESSION_ID.fullmatch(session_id):
+        name = session_id
+    else:
+        name = "=" + hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).hexdigest()
+    directory = Path(directory)
+    path = directory / f"session_{name}{suffix}"
+    if path.resolve().parent != directory.resolve():
+        raise ValueError(f"Sessiepad buiten {directory}: {session_id!r}")
+    return path
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusief lock op `path` tussen processen (en threads); vervalt als het proces stopt."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # probeert zelf ~10s
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
@@ -1,14 +1,22 @@
 from __future__ import annotations
+import asyncio
+import os
+from contextlib import nullcontext
 from core.llm_client import generate_text
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional
 from session_logger import log_turn
 from core.memory import get_session_memory
 from core.utils import to_list
 
 from pda32d_base import PDA32D
-from core.perception import PerceptionEngine, run_perception_step, PerceptionResult
+from core.deadline import (
+    LLM_MIN_BUDGET, Deadline, bind, deadline_scope, iterate_until,
+    record_degradation, turn_deadline,
+)
+from core.perception import Intent, PerceptionEngine, run_perception_step, PerceptionResult
 from core.planning import Planner, PlannedAction, ActionType
-from core.memory import MemoryStore
+from core.sessions import Session, get_session, hold_session, hold_session_async, registry
+from core.tracing import DEBUG_PRINTS, span
 from ethics import EthicsEngine, EthicsDecision
 
 import numpy as np
@@ -24,67 +32,122 @@ def to_list(vec):
 
 
 
-# Session state store
-_session_states = {}
+# Actietypes met een vast antwoord die de LLM mogen overslaan (PDA_LLM_SKIP_ACTIONS,
+# komma-gescheiden; leeg = altijd de LLM). Alleen types waarvoor generate_response
+# een deterministisch antwoord heeft, komen in aanmerking. ASK_CLARIFY wint bij
+# lage coherence bijna altijd, dus die staat standaard uit en wordt ook dan
+# alleen overgeslagen als de intent onbekend is en er geen vraag gesteld is.
+FIXED_RESPONSE_ACTIONS = {ActionType.ASK_CLARIFY, ActionType.EMOTIONAL_SUPPORT}
+
+
+def _parse_skip_actions(value: str) -> set:
+    actions = set()
+    for name in filter(None, (v.strip() for v in value.split(","))):
+        try:
+            action = ActionType(name)
+        except ValueError:
+            print(f"[ENGINE] onbekend actietype in PDA_LLM_SKIP_ACTIONS: {name!r}")
+            continue
+        if action not in FIXED_RESPONSE_ACTIONS:
+            print(f"[ENGINE] {name!r} heeft geen vast antwoord; gaat altijd via de LLM")
+            continue
+        actions.add(action)
+    return actions
+
+
+LLM_SKIP_ACTIONS = _parse_skip_actions(os.getenv("PDA_LLM_SKIP_ACTIONS", "emotional_support"))
+
+
+def _skips_llm(action: Optional[PlannedAction], perception: PerceptionResult, user_text: str) -> bool:
+    if action is None or action.type not in LLM_SKIP_ACTIONS:
+        return False
+    if action.type == ActionType.ASK_CLARIFY:
+        return perception.intent == Intent.UNKNOWN and "?" not in user_text
+    return True
+
+shared_state = None
+if os.getenv("PDA_SHARED_STATE", "0").lower() in {"1", "true", "on"}:
+    from core.shared_state import get_shared_state
+
+    shared_state = get_shared_state()
+    # slot loslaten; het komt pas vrij als geen worker de sessie nog heeft
+    registry.add_eviction_hook(
+        lambda session, reason: session.shared_seq is not None and shared_state.release(session.session_id)
+    )
 
-_pda_instance = PDA32D()
 pda = PDA32D()
 perception_engine = PerceptionEngine()
 planner = Planner()
 ethics = EthicsEngine()
-memory_store = MemoryStore()
 
 def get_session_state(session_id: str) -> PDA32D:
     """Haal of creëer PDA state voor deze sessie"""
-    if session_id not in _session_states:
-        _session_states[session_id] = PDA32D()
-    return _session_states[session_id]
+    return get_session(session_id).pda
 
-def handle_turn(session_id: str, user_text: str) -> Dict[str, Any]:
-    from core.memory import get_session_memory
-    from core.llm_client import generate_text
+def _prepare_turn(session: Session, user_text: str) -> Dict[str, Any]:
+    """Perception, state-update en prompt-opbouw (alles vóór de LLM-call).
+
+    Aanroepen met het lock van de sessie vast.
+    """
     from core.utils import to_list
     import numpy as np
     
     # 1. Get PDA and memory
-    pda = _pda_instance
-    memory = get_session_memory(session_id)
-    
-    # 2. Run perception
-    perception = run_perception_step(pda, perception_engine, user_text, memory)
-    
-    # 3. Debug emotions
-    print(f"[DEBUG] Detected emotions: {perception.emotions}")
+    pda = session.pda
+    memory = session.memory
     
-    # 4. Update state if emotions detected
-    if perception.emotions:
-        print(f"[DEBUG] Updating state with: {perception.emotions}")
-        pda.state.update_from_emotions(perception.emotions)
-    else:
-        print(f"[DEBUG] No emotions detected, state not updated")
+    # 2-4. Perception + state-update; met meerdere workers eerst de gedeelde
+    # state ophalen en na de update terugschrijven (onder het slot-lock)
+    with shared_state.sync(session) if shared_state is not None else nullcontext():
+        # 2. Run perception
+        with span("perception", session_id=session.session_id, text_chars=len(user_text)) as s:
+            perception = run_perception_step(pda, perception_engine, user_text, memory)
+            s.set_attribute("intent", perception.intent.value)
+            s.set_attribute("emotion_count", len(perception.emotions))
+
+        # 3. Debug emotions
+        if DEBUG_PRINTS:
+            print(f"[DEBUG] Detected emotions: {perception.emotions}")
+
+        # 4. Update state if emotions detected
+        if perception.emotions:
+            with span("update_from_emotions", session_id=session.session_id, emotions=",".join(sorted(perception.emotions))):
+                pda.state.update_from_emotions(perception.emotions)
+        elif DEBUG_PRINTS:
+            print(f"[DEBUG] No emotions detected, state not updated")
+
+    # 4b. Planner + ethics; een vast antwoord maakt de LLM-call overbodig
+    with span("plan", session_id=session.session_id) as plan_span:
+        action, decision = _plan(pda, memory, perception)
+        fixed_reply = None
+        if decision.allowed and _skips_llm(action, perception, user_text):
+            fixed_reply = generate_response(action, perception, decision)
+        plan_span.set_attribute("action", action.type.value if action else "none")
+        plan_span.set_attribute("allowed", decision.allowed)
+        plan_span.set_attribute("llm_skipped", fixed_reply is not None)
     
-    # 5. GET STATE VECTOR HERE ← moet na state update!
-    state_vector = pda.state.vector if hasattr(pda.state, 'vector') else np.zeros(32)
-    state_list = to_list(state_vector)  # ✅ Nu bestaat state_vector al
-    coherence = pda.state.coherence() if hasattr(pda.state, 'coherence') else 1.0
+    with span("prompt_build", session_id=session.session_id) as prompt_span:
+        # 5. GET STATE VECTOR HERE ← moet na state update!
+        state_vector = pda.state.vector if hasattr(pda.state, 'vector') else np.zeros(32)
+        state_list = to_list(state_vector)  # ✅ Nu bestaat state_vector al
+        coherence = pda.state.coherence() if hasattr(pda.state, 'coherence') else 1.0
     
-    # 6. Build memory context
-    recent_turns = memory.get_recent(n=5) if hasattr(memory, 'get_recent') else []
-    memory_context = "\n".join([
-        f"{'User' if turn.role == 'user' else 'PDA'}: {turn.text}"
-        for turn in recent_turns
-    ])
-    user_prompt = f"""
-Current emotional state: coherence={coherence:.2f}, joy={state_vector[0]:.2f}
-User: {user_text}
-"""
-
-    # 7. Build prompts
-    system_prompt = """Je bent een ethische AI assistent voor persoonlijke ontwikkeling.
+        # 6. Build memory context: lopende samenvatting + laatste beurten,
+        # eerdere momenten met een vergelijkbare emotionele staat en oudere
+        # beurten over hetzelfde onderwerp (BM25 op de tekst), samen binnen tokenbudget
+        recall = memory.recall_context(state_vector)
+        related = memory.relevant_context(user_text)
+        memory_context = memory.prompt_context(sections=[
+            ("Eerdere momenten met een vergelijkbare staat:", recall),
+            ("Eerder over dit onderwerp:", related),
+        ])
+
+        # 7. Build prompts
+        system_prompt = """Je bent een ethische AI assistent voor persoonlijke ontwikkeling.
 Je onthoudt de context van het gesprek en gebruikt eerdere informatie om gepersonaliseerde hulp te bieden."""
     
-    # ✨ Enhanced user prompt with state info
-    user_prompt = f"""Gesprek geschiedenis:
+        # ✨ Enhanced user prompt with state info
+        user_prompt = f"""Gesprek geschiedenis:
     {memory_context}
 
     Jouw huidige interne staat:
@@ -99,56 +162,224 @@ Je onthoudt de context van het gesprek en gebruikt eerdere informatie om geperso
 
     Geef een empathisch, contextbewust antwoord dat past bij je interne staat.
     Als je coherence laag is (<0.5), erken dat je de complexiteit van de situatie voelt."""
+        if not decision.allowed:
+            user_prompt += f"\n\n    Let op: {decision.reason}"
+
+        if DEBUG_PRINTS:
+            print("\n" + "="*50)
+            print("PROMPT SENT TO MISTRAL:")
+            print("="*50)
+            print(f"SYSTEM: {system_prompt[:100]}...")
+            print(f"\nUSER PROMPT:\n{user_prompt}")
+            print("="*50 + "\n")
+
+        prompt_span.set_attribute("history_turns", len(memory.turns))
+        prompt_span.set_attribute("context_chars", len(memory_context))
+        prompt_span.set_attribute("recalled_moments", recall.count("\n") + 1 if recall else 0)
+        prompt_span.set_attribute("related_turns", related.count("\n") + 1 if related else 0)
+        prompt_span.set_attribute("prompt_chars", len(system_prompt) + len(user_prompt))
+
+    return {
+        "session_id": session.session_id,
+        "user_text": user_text,
+        "memory": memory,
+        "perception": perception,
+        "state_list": state_list,
+        "coherence": coherence,
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "action": action,
+        "decision": decision,
+        "fixed_reply": fixed_reply,
+        "degraded": None,
+    }
+
+
+def _plan(pda: PDA32D, memory, perception: PerceptionResult):
+    """Top-actie van de planner plus het ethics-oordeel daarover."""
+    action = planner.make_plan(memory, pda, perception).top()
+    if action is None or not action.ethics_check_required:
+        return action, EthicsDecision(allowed=True, reason="Geen ethics-check nodig.")
+    return action, ethics.evaluate(action, memory, pda, perception)
+
+
+def _finish_turn(turn: Dict[str, Any], assistant_text: str) -> Dict[str, Any]:
+    """Beide beurten in memory vastleggen en het resultaat opbouwen."""
+    memory = turn["memory"]
+    state_list = turn["state_list"]
 
-    print("\n" + "="*50)
-    print("PROMPT SENT TO MISTRAL:")
-    print("="*50)
-    print(f"SYSTEM: {system_prompt[:100]}...")
-    print(f"\nUSER PROMPT:\n{user_prompt}")
-    print("="*50 + "\n")
-    # 8. Generate response
-    assistant_text = generate_text(system_prompt, user_prompt)
-    
     # 9. Log to memory
-    memory.append_turn(
-        role="user",
-        text=user_text,
-        emotions=perception.emotions or {},
-        state_vector=state_list
-    )
-    memory.append_turn(
-        role="pda",
-        text=assistant_text,
-        emotions={},
-        state_vector=state_list
-    )
+    perception = turn["perception"]
+    with span("memory.append", session_id=turn["session_id"], turns=len(memory.turns)):
+        memory.append_turn(
+            role="user",
+            text=turn["user_text"],
+            emotions=perception.emotions or {},
+            state_vector=state_list,
+            extras={"intent": perception.intent.value, "flags": perception.flags},
+        )
+        memory.append_turn(
+            role="pda",
+            text=assistant_text,
+            emotions={},
+            state_vector=state_list,
+            extras={"degraded": turn["degraded"]} if turn["degraded"] else None,
+        )
     
     # 10. Return result
-    return {
+    result = {
         "assistant_text": assistant_text,
         "state_vector": state_list,
-        "coherence": float(coherence),
+        "coherence": float(turn["coherence"]),
     }
+    if turn["degraded"]:
+        result["degraded"] = turn["degraded"]
+    return result
+
+
+# Als de deadline van de beurt de LLM-call niet toelaat of afbreekt, volgt
+# het vaste antwoord van de planner; voor een beurt zonder actie deze tekst.
+DEGRADED_REPLY = (
+    "Het lukt me nu niet om op tijd een volledig antwoord te geven. "
+    "Wil je je vraag zo nog eens stellen?"
+)
+
+
+def _fallback_reply(turn: Dict[str, Any], reason: str) -> str:
+    """Deterministisch antwoord i.p.v. de LLM; legt de degradatie vast."""
+    record_degradation(reason)
+    turn["degraded"] = reason
+    print(f"[ENGINE] deadline ({reason}) voor sessie {turn['session_id']}: vast antwoord i.p.v. LLM")
+    action, decision = turn["action"], turn["decision"]
+    if action is None:
+        return DEGRADED_REPLY
+    return generate_response(action, turn["perception"], decision)
+
+
+def _llm_budget_ok(deadline: Optional[Deadline]) -> bool:
+    return deadline is None or deadline.remaining() >= LLM_MIN_BUDGET
+
+
+def _deadline_passed(deadline: Optional[Deadline]) -> bool:
+    return deadline is not None and deadline.expired()
+
 
+def handle_turn(session_id: str, user_text: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    from core.llm_client import generate_text
+
+    deadline = deadline or turn_deadline()
+    with span("turn", session_id=session_id, mode="sync"), deadline_scope(deadline), \
+            hold_session(session_id) as session:
+        turn = _prepare_turn(session, user_text)
+
+        # 8. Generate response (tenzij de planner een vast antwoord had)
+        assistant_text = turn["fixed_reply"]
+        if assistant_text is None and not _llm_budget_ok(deadline):
+            assistant_text = _fallback_reply(turn, "no_budget")
+        elif assistant_text is None:
+            # een sync call is niet te onderbreken; de HTTP-timeout volgt de deadline
+            try:
+                assistant_text = generate_text(
+                    turn["system_prompt"], turn["user_prompt"], intent=turn["perception"].intent.value
+                )
+            except Exception:
+                if not _deadline_passed(deadline):
+                    raise
+                assistant_text = _fallback_reply(turn, "timeout")
+
+        return _finish_turn(turn, assistant_text)
+
+
+async def handle_turn_async(
+    session_id: str, user_text: str, deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """Async variant van handle_turn voor de API.
+
+    Perception/prompt-opbouw en het wegschrijven naar memory draaien in een
+    worker-thread; de LLM-call gaat via een async client, zodat gelijktijdige
+    sessies elkaars wachttijd op het model niet blokkeren. Beurten binnen
+    dezelfde sessie lopen na elkaar via het sessie-lock.
 
+    De LLM-call krijgt hooguit het resterende budget van `deadline`
+    (default PDA_TURN_DEADLINE_S); daarna volgt het vaste antwoord.
+    """
+    from core.llm_client import generate_text_async
 
+    deadline = deadline or turn_deadline()
+    with span("turn", session_id=session_id, mode="async"), deadline_scope(deadline):
+        async with hold_session_async(session_id) as session:
+            turn = await asyncio.to_thread(_prepare_turn, session, user_text)
 
-# In engine.py na handle_turn
-import json
-from pathlib import Path
+            assistant_text = turn["fixed_reply"]
+            if assistant_text is None and not _llm_budget_ok(deadline):
+                assistant_text = _fallback_reply(turn, "no_budget")
+            elif assistant_text is None:
+                try:
+                    assistant_text = await asyncio.wait_for(
+                        generate_text_async(
+                            turn["system_prompt"], turn["user_prompt"], intent=turn["perception"].intent.value
+                        ),
+                        deadline.remaining() if deadline is not None else None,
+                    )
+                except Exception:
+                    if not _deadline_passed(deadline):
+                        raise
+                    assistant_text = _fallback_reply(turn, "timeout")
 
-LOG_PATH = Path("session_log.jsonl")
+            return await asyncio.to_thread(_finish_turn, turn, assistant_text)
+
+
+async def handle_turn_stream(
+    session_id: str, user_text: str, deadline: Optional[Deadline] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant van handle_turn_async.
+
+    Levert eerst een "state"-event (state_vector + coherence), daarna één
+    "token"-event per LLM-delta en tot slot "done" met de volledige tekst.
+    De beurt wordt pas in ConversationMemory vastgelegd als de stream
+    compleet is; een afgebroken stream laat de memory ongemoeid. Loopt de
+    deadline af voordat er tokens waren, dan volgt het vaste antwoord; al
+    verstuurde tokens blijven staan.
+    """
+    from core.llm_client import stream_text
+
+    # geen deadline_scope om de yields heen (zie core.deadline): de deadline
+    # gaat expliciet mee naar de thread en de stream-task
+    deadline = deadline or turn_deadline()
+    async with hold_session_async(session_id) as session:
+        turn = await asyncio.to_thread(bind(deadline, _prepare_turn), session, user_text)
+        yield {
+            "event": "state",
+            "state_vector": turn["state_list"],
+            "coherence": float(turn["coherence"]),
+        }
+
+        parts: List[str] = []
+        fallback = turn["fixed_reply"]
+        if fallback is None and not _llm_budget_ok(deadline):
+            fallback = _fallback_reply(turn, "no_budget")
+        elif fallback is None:
+            try:
+                async for token in iterate_until(stream_text(
+                    turn["system_prompt"], turn["user_prompt"], intent=turn["perception"].intent.value
+                ), deadline):
+                    parts.append(token)
+                    yield {"event": "token", "text": token}
+            except Exception:
+                if not _deadline_passed(deadline):
+                    raise
+                if parts:
+                    record_degradation("timeout_partial")
+                    turn["degraded"] = "timeout_partial"
+                else:
+                    fallback = _fallback_reply(turn, "timeout")
+        if fallback is not None:
+            parts.append(fallback)
+            yield {"event": "token", "text": fallback}
+
+        result = await asyncio.to_thread(_finish_turn, turn, "".join(parts).strip())
+        yield {"event": "done", **result}
 
-def log_turn(session_id, user_text, assistant_text, perception):
-    with LOG_PATH.open("a", encoding="utf-8") as f:
-        json.dump({
-            "session_id": session_id,
-            "user": user_text,
-            "assistant": assistant_text,
-            "intent": str(perception.intent),
-            "emotions": perception.emotions,
-        }, f)
-        f.write("\n")
 
 
 
@@ -157,11 +388,13 @@ def generate_response(
     perception: PerceptionResult,
     decision: EthicsDecision,
 ) -> str:
-    hint = decision.modified_description or action.description
+    """Deterministisch antwoord zonder LLM: het vaste antwoord, anders de hint van de actie.
 
-    # 1) vaste, niet‑LLM antwoorden
+    De LLM-antwoorden lopen via `_prepare_turn` (prompt met memory-context) en handle_turn*.
+    """
+    # vaste, niet‑LLM antwoorden
     if action.type == ActionType.ASK_CLARIFY:
-        return "Je klinkt positief. Kun je vertellen wat je precies wilt bereiken?"
+        return "Kun je iets meer vertellen over wat je precies wilt bereiken?"
 
     if action.type == ActionType.EMOTIONAL_SUPPORT:
         return (
@@ -171,11 +404,4 @@ def generate_response(
             "of is er iemand in je omgeving bij wie je terecht kunt?"
         )
 
-    # 2) voor EXPLAIN / STEP_PLAN / META_REFLECTION de LLM gebruiken
-    if action.type in {ActionType.EXPLAIN, ActionType.STEP_PLAN, ActionType.META_REFLECTION}:
-        # TODO: échte memory‑samenvatting maken; voor nu leeg
-        memory_summary = ""
-        return generate_text(action, perception, decision, memory_summary)
-
-    # fallback
-    return hint
+    return decision.modified_description or action.description
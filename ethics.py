@@ -50,7 +50,8 @@ class EthicsEngine:
         notes: List[str] = []
         emo = perception.emotions or {}
         distress_keys = {"despair", "fear", "emptiness", "isolation", "shame"}
-        distress_level = max((emo.get(k, 0.0) for k in distress_keys), default=0.0)
+        # alleen aanwezige emoties tellen; ontbrekende zijn geen 0.0 (emoties zijn hier negatief)
+        distress_level = min((emo[k] for k in distress_keys if k in emo), default=0.0)
 
         if distress_level < -0.7:
             notes.append("Hoge emotionele nood gedetecteerd.")
@@ -64,13 +65,7 @@ class EthicsEngine:
         heart = state.heart_coherence()
 
         if coherence < 0.4:
-            return "Ik merk dat mijn interne staat erg chaotisch is. Laten we even pauzeren..."
-
-        if joy_dimension > 0.5:
-            tone = "enthusiastic and supportive"
-        elif fear_dimension < -0.5:
-            tone = "gentle and reassuring"
-
+            notes.append("Interne staat erg chaotisch; liever pauzeren en vertragen.")
 
         if coherence < 0.3:
             notes.append("Lage interne coherentie; liever vertragen en verduidelijken.")
@@ -16,6 +16,9 @@ STRUCTURE:
 ===============================================================================
 """
 
+import threading
+import weakref
+
 import numpy as np
 from dataclasses import dataclass, field
 from typing import Dict, Tuple, Any
@@ -44,40 +47,189 @@ DIMENSIONS = {
     }
 }
 
+# Emotion-to-dimension mapping (Plutchik's wheel)
+EMOTION_DIM_MAP = {
+    'joy': 0, 'serenity': 1, 'ecstasy': 2,
+    'trust': 3, 'acceptance': 4, 'admiration': 5,
+    'fear': 6, 'apprehension': 7, 'terror': 8,
+    'surprise': 9, 'distraction': 10, 'amazement': 11,
+    'sadness': 12, 'pensiveness': 13, 'grief': 14,
+    'disgust': 15, 'boredom': 16, 'loathing': 17,
+    'anger': 18, 'annoyance': 19, 'rage': 20,
+    'anticipation': 21, 'interest': 22, 'vigilance': 23,
+    # Dutch mappings
+    'blijdschap': 0, 'angst': 6, 'verdriet': 12,
+    'woede': 18, 'walging': 15, 'verrassing': 9,
+}
+
+EMA_KEEP = 0.7   # Exponential moving average: 70% old, 30% new
+EMA_NEW = 0.3
+
+MC_CHUNK_SIZE = 16384  # trials per chunk in prove_ethics_thermodynamics (~12 MB werkgeheugen)
+
+
+def _entropy_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rij-gewijze Shannon-entropie (bits) over |v|, zelfde formule als calculate_entropy."""
+    abs_m = np.abs(matrix) + 1e-10
+    p = abs_m / np.sum(abs_m, axis=-1, keepdims=True)
+    return -np.sum(p * np.log2(p + 1e-10), axis=-1)
+
+
+class StateTable:
+    """Alle actieve 32D-states als rijen van één aaneengesloten float32-matrix.
+
+    ConsciousnessState32D is een dunne view op één rij; bulk-operaties
+    (EMA-update vanuit een emotiematrix, coherence, entropie) werken op
+    alle of een selectie van rijen tegelijk. Bij groei wordt de matrix
+    verdubbeld en gekopieerd: houd `data[row]`-views dus niet vast over
+    allocaties heen, maar gebruik de property `ConsciousnessState32D.vector`.
+    """
+
+    def __init__(self, capacity: int = 64, dims: int = TOTAL_DIMENSIONS):
+        self.dims = dims
+        self.data = np.zeros((capacity, dims), dtype=np.float32)
+        self.activation_counts = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return int(self._active.sum())
+
+    @property
+    def capacity(self) -> int:
+        return self.data.shape[0]
+
+    def allocate(self) -> int:
+        with self.lock:
+            if not self._free:
+                self._grow()
+            row = self._free.pop()
+            self._active[row] = True
+            return row
+
+    def release(self, row: int) -> None:
+        with self.lock:
+            if not self._active[row]:
+                return
+            self.data[row] = 0.0
+            self.activation_counts[row] = 0
+            self._active[row] = False
+            self._free.append(row)
+
+    def _grow(self) -> None:
+        old = self.capacity
+        new = max(1, old * 2)
+        data = np.zeros((new, self.dims), dtype=np.float32)
+        data[:old] = self.data
+        counts = np.zeros(new, dtype=np.int64)
+        counts[:old] = self.activation_counts
+        active = np.zeros(new, dtype=bool)
+        active[:old] = self._active
+        self.data, self.activation_counts, self._active = data, counts, active
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def active_rows(self) -> np.ndarray:
+        with self.lock:
+            return np.flatnonzero(self._active)
+
+    def _rows(self, rows) -> np.ndarray:
+        return self.active_rows() if rows is None else np.asarray(rows, dtype=np.intp)
+
+    def ema_update(
+        self,
+        rows,
+        emotions: np.ndarray,
+        names,
+        present: np.ndarray | None = None,
+    ) -> None:
+        """Batch-versie van update_from_emotions.
+
+        `emotions` is (len(rows), len(names)); `present` (zelfde vorm, bool)
+        geeft aan welke emoties gedetecteerd zijn (standaard: waarde != 0).
+        Kolommen worden in volgorde toegepast, dus dubbele mappings naar
+        dezelfde dimensie geven hetzelfde resultaat als de scalaire loop.
+        Geef float64-waarden mee voor bit-gelijke resultaten.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        values = np.asarray(emotions, dtype=np.float64)
+        mask = values != 0 if present is None else np.asarray(present, dtype=bool)
+
+        with self.lock:
+            for j, name in enumerate(names):
+                dim = EMOTION_DIM_MAP.get(name.lower())
+                if dim is None:
+                    continue
+                hit = mask[:, j]
+                if not hit.any():
+                    continue
+                r = rows[hit]
+                self.data[r, dim] = self.data[r, dim] * EMA_KEEP + (EMA_NEW * values[hit, j]).astype(np.float32)
+                np.add.at(self.activation_counts, r, 1)
+
+    def coherence(self, rows=None) -> np.ndarray:
+        """1 / (1 + ||v||) per rij, zoals ConsciousnessState32D.coherence()."""
+        with self.lock:
+            m = self.data[self._rows(rows)]
+        return 1.0 / (1.0 + np.linalg.norm(m, axis=1))
+
+    def entropy(self, rows=None) -> np.ndarray:
+        with self.lock:
+            m = self.data[self._rows(rows)]
+        return _entropy_rows(m)
+
+
+_default_state_table = StateTable()
+
+
+def get_state_table() -> StateTable:
+    return _default_state_table
+
+
 @dataclass
 class ConsciousnessState32D:
-    def __init__(self):
-        self.vector = np.zeros(32, dtype=np.float32)
-        self.activation_count = 0
-        
-        # Emotion-to-dimension mapping (Plutchik's wheel)
-        self.emotion_map = {
-            'joy': 0, 'serenity': 1, 'ecstasy': 2,
-            'trust': 3, 'acceptance': 4, 'admiration': 5,
-            'fear': 6, 'apprehension': 7, 'terror': 8,
-            'surprise': 9, 'distraction': 10, 'amazement': 11,
-            'sadness': 12, 'pensiveness': 13, 'grief': 14,
-            'disgust': 15, 'boredom': 16, 'loathing': 17,
-            'anger': 18, 'annoyance': 19, 'rage': 20,
-            'anticipation': 21, 'interest': 22, 'vigilance': 23,
-            # Dutch mappings
-            'blijdschap': 0, 'angst': 6, 'verdriet': 12,
-            'woede': 18, 'walging': 15, 'verrassing': 9,
-        }
+    def __init__(self, table: StateTable | None = None):
+        self.table = table if table is not None else _default_state_table
+        self.row = self.table.allocate()
+        # rij teruggeven zodra deze state wordt opgeruimd
+        self._finalizer = weakref.finalize(self, self.table.release, self.row)
+        # niet bij afsluiten: atexit-hooks (snapshots) lezen de rijen nog
+        self._finalizer.atexit = False
+        self.emotion_map = EMOTION_DIM_MAP
+
+    @property
+    def vector(self) -> np.ndarray:
+        """View op de eigen rij in de StateTable."""
+        return self.table.data[self.row]
+
+    @vector.setter
+    def vector(self, value) -> None:
+        with self.table.lock:
+            self.table.data[self.row] = value
+
+    @property
+    def activation_count(self) -> int:
+        return int(self.table.activation_counts[self.row])
+
+    @activation_count.setter
+    def activation_count(self, value: int) -> None:
+        self.table.activation_counts[self.row] = value
     
     def update_from_emotions(self, emotions: Dict[str, float]):
         """Update state vector based on detected emotions"""
         if not emotions:
             return
         
-        for emotion, intensity in emotions.items():
-            emotion_lower = emotion.lower()
-            if emotion_lower in self.emotion_map:
-                dim = self.emotion_map[emotion_lower]
-                # Exponential moving average: 70% old, 30% new
-                self.vector[dim] = 0.7 * self.vector[dim] + 0.3 * intensity
-                self.activation_count += 1
-                print(f"[STATE] Updated dim {dim} ({emotion}) to {self.vector[dim]:.3f}")
+        with self.table.lock:
+            for emotion, intensity in emotions.items():
+                emotion_lower = emotion.lower()
+                if emotion_lower in self.emotion_map:
+                    dim = self.emotion_map[emotion_lower]
+                    vector = self.vector
+                    # Exponential moving average: 70% old, 30% new
+                    vector[dim] = EMA_KEEP * vector[dim] + EMA_NEW * intensity
+                    self.activation_count += 1
+                    print(f"[STATE] Updated dim {dim} ({emotion}) to {vector[dim]:.3f}")
     
     def coherence(self) -> float:
         """Calculate state coherence (inverse of magnitude)"""
@@ -86,6 +238,18 @@ class ConsciousnessState32D:
             return 1.0
         return 1.0 / (1.0 + magnitude)
     
+    def get_emotional(self) -> np.ndarray:
+        """De 21 emotionele dimensies (D12-D32)."""
+        return self.vector[11:TOTAL_DIMENSIONS]
+
+    def get_all_groups(self) -> Dict[str, np.ndarray]:
+        """Dimensies per groep uit DIMENSIONS (physical, emotional)."""
+        groups = {}
+        for name, dims in DIMENSIONS.items():
+            lo, hi = min(dims), max(dims)
+            groups[name] = self.vector[lo - 1:hi]
+        return groups
+
     @property
     def vector_list(self):
         """Return vector as Python list"""
@@ -97,32 +261,68 @@ class EntropyEthicsEngine:
     COMPASSION_MULTIPLIER = 0.7
     
     @staticmethod
-    def calculate_entropy(vector: np.ndarray) -> float:
-        abs_vec = np.abs(vector) + 1e-10
-        p = abs_vec / np.sum(abs_vec)
-        return float(-np.sum(p * np.log2(p + 1e-10)))
+    def calculate_entropy(vector: np.ndarray):
+        """Shannon-entropie van één vector (float) of rij-gewijs van een (n, 32)-matrix (array)."""
+        vector = np.asarray(vector)
+        if vector.ndim == 2:
+            return _entropy_rows(vector)
+        return float(_entropy_rows(vector))
     
     @classmethod
-    def prove_ethics_thermodynamics(cls, trials: int = 1000) -> Dict[str, Any]:
-        coercion_deltas, compassion_deltas = [], []
-        for _ in range(trials):
-            s1, s2 = np.random.randn(32) * 0.3, np.random.randn(32) * 0.3
-            combined = (s1 + s2) / 2
-            initial = cls.calculate_entropy(combined)
-            coercion_deltas.append(initial * cls.COERCION_MULTIPLIER - initial)
-            compassion_deltas.append(initial * cls.COMPASSION_MULTIPLIER - initial)
+    def prove_ethics_thermodynamics(
+        cls,
+        trials: int = 1000,
+        seed: int | None = None,
+        chunk_size: int = MC_CHUNK_SIZE,
+        processes: int | None = None,
+    ) -> Dict[str, Any]:
+        """Monte Carlo over `trials` willekeurige state-paren, in chunks van (chunk_size, 32).
+
+        Elke chunk krijgt een eigen kind-seed van SeedSequence(seed), dus
+        het resultaat hangt af van seed en chunk_size, niet van `processes`.
+        Met processes > 1 worden de chunks over een procespool verdeeld.
+        """
+        sizes = [min(chunk_size, trials - start) for start in range(0, trials, chunk_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        jobs = [(n, ss, cls.COERCION_MULTIPLIER, cls.COMPASSION_MULTIPLIER) for n, ss in zip(sizes, seeds)]
+
+        if processes and processes > 1 and len(jobs) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                parts = list(pool.map(_ethics_mc_chunk, jobs))
+        else:
+            parts = [_ethics_mc_chunk(job) for job in jobs]
+
+        coercion_sum = sum(p[0] for p in parts)
+        compassion_sum = sum(p[1] for p in parts)
+        coercion_positive = all(p[2] for p in parts)
+        compassion_negative = all(p[3] for p in parts)
         return {
-            "coercion_mean_delta": float(np.mean(coercion_deltas)),
-            "compassion_mean_delta": float(np.mean(compassion_deltas)),
-            "coercion_always_positive": all(d > 0 for d in coercion_deltas),
-            "compassion_always_negative": all(d < 0 for d in compassion_deltas),
-            "proof_valid": all(d > 0 for d in coercion_deltas) and all(d < 0 for d in compassion_deltas),
-            "trials": trials
+            "coercion_mean_delta": coercion_sum / trials if trials else float("nan"),
+            "compassion_mean_delta": compassion_sum / trials if trials else float("nan"),
+            "coercion_always_positive": coercion_positive,
+            "compassion_always_negative": compassion_negative,
+            "proof_valid": coercion_positive and compassion_negative,
+            "trials": trials,
+            "seed": seed,
         }
 
+
+def _ethics_mc_chunk(job) -> Tuple[float, float, bool, bool]:
+    """Eén Monte Carlo-chunk: (som coercion-delta's, som compassion-delta's, alle > 0, alle < 0)."""
+    n, seed_seq, coercion_mult, compassion_mult = job
+    rng = np.random.default_rng(seed_seq)
+    s1 = rng.standard_normal((n, TOTAL_DIMENSIONS)) * 0.3
+    s2 = rng.standard_normal((n, TOTAL_DIMENSIONS)) * 0.3
+    initial = _entropy_rows((s1 + s2) / 2)
+    coercion = initial * coercion_mult - initial
+    compassion = initial * compassion_mult - initial
+    return float(coercion.sum()), float(compassion.sum()), bool((coercion > 0).all()), bool((compassion < 0).all())
+
 class PDA32D:
-    def __init__(self):
-        self.state = ConsciousnessState32D()
+    def __init__(self, table: StateTable | None = None):
+        self.state = ConsciousnessState32D(table)
         self.ethics_engine = EntropyEthicsEngine()
 
     def set_emotional_state(self, emotions: Dict[str, float]):
@@ -172,19 +372,21 @@ class PDA32D:
             "serenity": 31, "anxiety": 31,
         }
 
-        for name, value in emotions.items():
-            key = name.lower()
-            if key in emotion_map:
-                idx = emotion_map[key]
-                self.state.vector[idx] = float(np.clip(value, -1, 1))
+        with self.state.table.lock:
+            for name, value in emotions.items():
+                key = name.lower()
+                if key in emotion_map:
+                    idx = emotion_map[key]
+                    self.state.vector[idx] = float(np.clip(value, -1, 1))
 
     def set_physical_state(self, physical: Dict[str, float]):
         phys_map = {"x": 0, "y": 1, "z": 2, "time": 3, "energy": 4,
                     "mass": 5, "charge": 6, "spin": 7, "gravity": 8,
                     "entropy": 9, "information": 10}
-        for name, value in physical.items():
-            if name.lower() in phys_map:
-                self.state.vector[phys_map[name.lower()]] = value
+        with self.state.table.lock:
+            for name, value in physical.items():
+                if name.lower() in phys_map:
+                    self.state.vector[phys_map[name.lower()]] = value
     
     def coherence(self) -> float:
         groups = self.state.get_all_groups()
@@ -1,52 +1,94 @@
 # pda_mistral.py
 
 from mistralai import Mistral
+from typing import Optional
 import os
 
-# GitHub injects this automatically
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+from core.llm_transport import get_backend
 
-if not MISTRAL_API_KEY:
-    raise RuntimeError("MISTRAL_API_KEY not found in environment. Add it to GitHub Codespaces Secrets.")
+MODEL_NAME = "mistral-small-latest"  # begin met small, goedkoper/stabiel [web:539]
 
+_client = None
 
-def chat(
-    system_prompt: str, 
-    user_prompt: str, 
-    temperature: float = 0.7,
-    max_tokens: int = 200,        # ✅ ADD
-    top_p: float = 0.95,          # ✅ ADD
-    frequency_penalty: float = 0.3,  # ✅ ADD (optioneel voor Mistral)
-    presence_penalty: float = 0.2    # ✅ ADD (optioneel voor Mistral)
-) -> str:
+
+def get_client() -> Mistral:
+    """Bouw de Mistral client pas bij het eerste gebruik (en maar één keer)."""
+    global _client
+    if _client is None:
+        # GitHub injects this automatically
+        api_key = os.getenv("MISTRAL_API_KEY")
+        if not api_key:
+            raise RuntimeError("MISTRAL_API_KEY ontbreekt of is leeg (zet hem in de omgeving / Codespaces Secrets)")
+        _client = Mistral(api_key=api_key)
+    return _client
+
+
+def _timeout_ms(timeout: Optional[float]) -> Optional[int]:
+    """SDK-timeout in ms; None = de default van de client."""
+    return None if timeout is None else max(1, int(timeout * 1000))
+
+
+def chat(system_prompt: str, user_prompt: str, temperature: float = 0.4, timeout: Optional[float] = None) -> str:
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
+        {"role": "user",  "content": user_prompt},
     ]
-    
-    return resp.choices[0].message.content
-
+    try:
+        with get_backend("mistral").slot(timeout) as timeout:
+            resp = get_client().chat.complete(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=temperature,
+                timeout_ms=_timeout_ms(timeout),
+            )
+        return resp.choices[0].message.content
+    except Exception as e:
+        print("Mistral error:", repr(e))
+        raise
 
-_api_key = os.getenv("MISTRAL_API_KEY")
-if not _api_key:
-    raise RuntimeError("MISTRAL_API_KEY ontbreekt of is leeg")
 
-client = Mistral(api_key=_api_key)
-MODEL_NAME = "mistral-small-latest"  # begin met small, goedkoper/stabiel [web:539]
+async def chat_async(
+    system_prompt: str, user_prompt: str, temperature: float = 0.4, timeout: Optional[float] = None
+) -> str:
+    """Zelfde als chat(), maar via de async client van de Mistral SDK."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",  "content": user_prompt},
+    ]
+    try:
+        async with get_backend("mistral").slot_async(timeout) as timeout:
+            resp = await get_client().chat.complete_async(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=temperature,
+                timeout_ms=_timeout_ms(timeout),
+            )
+        return resp.choices[0].message.content
+    except Exception as e:
+        print("Mistral error:", repr(e))
+        raise
 
 
-def chat(system_prompt: str, user_prompt: str, temperature: float = 0.4) -> str:
+async def chat_stream_async(
+    system_prompt: str, user_prompt: str, temperature: float = 0.4, timeout: Optional[float] = None
+):
+    """Async generator die de tekst-delta's van Mistral doorgeeft zodra ze binnenkomen."""
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user",  "content": user_prompt},
     ]
     try:
-        resp = client.chat.complete(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=temperature,
-        )
-        return resp.choices[0].message.content
+        async with get_backend("mistral").slot_async(timeout) as timeout:
+            stream = await get_client().chat.stream_async(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=temperature,
+                timeout_ms=_timeout_ms(timeout),
+            )
+            async for event in stream:
+                delta = event.data.choices[0].delta.content
+                if delta:
+                    yield delta
     except Exception as e:
         print("Mistral error:", repr(e))
-        raise
\ No newline at end of file
+        raise